@@ -0,0 +1,52 @@
+"""
+Conditional GET support for API views.
+
+`conditional_view(validators)` wraps a view so that GET/HEAD requests are
+answered with 304 Not Modified, before the view (and its serializers) runs,
+whenever the client's If-None-Match / If-Modified-Since still matches.
+
+`validators(request, *args, **kwargs)` must be cheap: it returns an
+(etag, last_modified) pair, either of which may be None, computed without
+building the response payload. Apply the decorator below @api_view (or via
+method_decorator on DRF view methods) so it runs after authentication.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """Quoted strong ETag from the given validator parts"""
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+def conditional_view(validators, vary=None):
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = validators(request, *args, **kwargs)
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+            if etag and not response.has_header('ETag'):
+                response.headers['ETag'] = etag
+            if timestamp and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(timestamp)
+            if vary:
+                patch_vary_headers(response, vary)
+            return response
+        return inner
+    return decorator
@@ -1,3 +1,14 @@
+import glob
+import os
+
 raw_env = [
     "DJANGO_SETTINGS_MODULE=LandingPage.settings"
 ]
+
+
+def on_starting(server):
+    # Per-worker metric files from a previous run would be summed into this one
+    directory = os.environ.get('METRICS_DIR')
+    if directory:
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            os.remove(path)
@@ -0,0 +1,174 @@
+"""
+/media/ file serving.
+
+django.views.static.serve reads the file into the response in Python, so
+a gunicorn worker is held for the whole transfer to a slow client, and it
+knows nothing of Range. `serve_media` checks the file, answers conditional
+requests and sets cache headers, then hands the transfer off according to
+MEDIA_SERVE_MODE:
+
+- 'stream' (default): a FileResponse. Under gunicorn the file goes out
+  through wsgi.file_wrapper and os.sendfile, without passing through
+  Python. Single byte ranges are answered with 206.
+- 'accel': an empty response with X-Accel-Redirect to
+  MEDIA_ACCEL_LOCATION, for nginx to send from an `internal` location
+  aliased to MEDIA_ROOT. The worker is free as soon as the headers are out.
+- 'sendfile': the same with an X-Sendfile header holding the file's path
+  (Apache mod_xsendfile, lighttpd).
+
+Content-addressed names (see LandingPage.storage) never change content, so
+they are cached for MEDIA_IMMUTABLE_MAX_AGE without revalidation. Other
+files (the shared default picture, files saved before hashed names) get
+MEDIA_MAX_AGE and revalidate against their ETag / Last-Modified.
+"""
+import mimetypes
+import os
+import re
+import stat
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .conditional import conditional_view, make_etag
+from .storage import is_content_addressed
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def media_file(path):
+    """(absolute path, stat result) of a regular file under MEDIA_ROOT, or None"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return full_path, st
+
+
+def file_validators(request, path):
+    found = media_file(path)
+    if found is None:
+        return None, None
+    _, st = found
+    return file_etag(path, st), datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+
+
+def file_etag(path, st):
+    return make_etag(path, st.st_size, st.st_mtime_ns)
+
+
+def byte_range(request, size, etag, last_modified):
+    """
+    (start, end) for a satisfiable single-range request, None to send the
+    whole file, or False when the range can't be satisfied
+    """
+    header = request.META.get('HTTP_RANGE', '').strip()
+    match = RANGE.match(header)
+    if not match or not any(match.groups()):
+        # Absent, malformed or multiple ranges: the whole file is a valid answer
+        return None
+
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        # The client's copy is stale; ranges from it would be garbage
+        return None
+
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class FileRange:
+    """
+    An open file limited to bytes start..end. gunicorn sends it with
+    os.sendfile from the file's current offset for Content-Length bytes;
+    servers without sendfile read it through `read`, which stops at `end`.
+    """
+
+    def __init__(self, file, start, end):
+        self.file = file
+        self.end = end
+        file.seek(start)
+
+    def read(self, size=-1):
+        remaining = self.end + 1 - self.file.tell()
+        if remaining <= 0:
+            return b''
+        return self.file.read(remaining if size is None or size < 0 else min(size, remaining))
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def cache_control(response, path):
+    if is_content_addressed(path):
+        patch_cache_control(
+            response, public=True, immutable=True,
+            max_age=getattr(settings, 'MEDIA_IMMUTABLE_MAX_AGE', 365 * 24 * 3600),
+        )
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_MAX_AGE', 3600))
+
+
+@require_safe
+@conditional_view(file_validators)
+def serve_media(request, path):
+    found = media_file(path)
+    if found is None:
+        raise Http404("No such media file")
+    full_path, st = found
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    etag = file_etag(path, st)
+    mtime = int(st.st_mtime)
+
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'stream')
+    if mode == 'accel':
+        # nginx serves the file itself, Range and all
+        response = HttpResponse(content_type=content_type)
+        location = getattr(settings, 'MEDIA_ACCEL_LOCATION', '/protected-media/')
+        response['X-Accel-Redirect'] = location.rstrip('/') + '/' + quote(path)
+    elif mode == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        window = byte_range(request, st.st_size, etag, mtime)
+        if window is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+            return response
+        file = open(full_path, 'rb')
+        if window is None:
+            response = FileResponse(file, content_type=content_type)
+            response['Content-Length'] = st.st_size
+        else:
+            start, end = window
+            response = FileResponse(FileRange(file, start, end), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    cache_control(response, path)
+    return response
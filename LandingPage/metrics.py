@@ -0,0 +1,287 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms live in one registry per process. `metrics_view`,
+mounted at /metrics, renders them for a Prometheus scrape.
+
+Gunicorn runs several worker processes, and each one only sees its own
+requests. When METRICS_DIR is set, every process therefore writes its values
+to its own file there, at most every METRICS_FLUSH_INTERVAL seconds and on
+exit. The worker that answers a scrape writes its own file and then sums all
+of them. Files of workers that have exited stay in place, so their counts
+remain part of the totals. gunicorn.conf.py empties the directory when the
+master starts.
+"""
+import atexit
+import copy
+import glob
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; suits both request latency and the SendGrid round trip
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def sample_labelnames(self, sample_name):
+        return self.labelnames
+
+    def empty(self):
+        metric = copy.copy(self)
+        metric.values = {}
+        return metric
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.maybe_flush()
+
+    def merge(self, key, value):
+        self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name + '_total', key, value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+                    break
+            entry['sum'] += value
+            entry['count'] += 1
+        self.registry.maybe_flush()
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def merge(self, key, value):
+        entry = self.values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+        entry['buckets'] = [a + b for a, b in zip(entry['buckets'], value['buckets'])]
+        entry['sum'] += value['sum']
+        entry['count'] += value['count']
+
+    def samples(self):
+        for key, entry in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry['buckets']):
+                cumulative += count
+                yield self.name + '_bucket', key + (_number(bound),), cumulative
+            yield self.name + '_bucket', key + ('+Inf',), entry['count']
+            yield self.name + '_sum', key, entry['sum']
+            yield self.name + '_count', key, entry['count']
+
+    def sample_labelnames(self, sample_name):
+        if sample_name.endswith('_bucket'):
+            return self.labelnames + ('le',)
+        return self.labelnames
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._file = None
+        self._file_dir = None
+        self._flushed_at = 0.0
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    # -- multi-process ---------------------------------------------------
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def snapshot(self):
+        """This process's values as JSON"""
+        with self.lock:
+            return json.dumps({
+                name: [[list(key), value] for key, value in metric.values.items()]
+                for name, metric in self.metrics.items()
+            })
+
+    def flush(self, blocking=True):
+        """Write this process's values to its file in METRICS_DIR"""
+        directory = self.directory
+        if not directory or not self._flush_lock.acquire(blocking=blocking):
+            return
+        try:
+            if self._file_dir != directory:
+                # pid alone could be reused by a later worker and overwrite this one
+                os.makedirs(directory, exist_ok=True)
+                self._file = os.path.join(directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+                self._file_dir = directory
+            temporary = f'{self._file}.tmp'
+            with open(temporary, 'w') as f:
+                f.write(self.snapshot())
+            os.replace(temporary, self._file)
+            self._flushed_at = time.monotonic()
+        finally:
+            self._flush_lock.release()
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() - self._flushed_at >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+            # Another thread already writing is as good as writing now
+            self.flush(blocking=False)
+
+    def collect(self):
+        """Metrics with values summed over every process that wrote a file"""
+        if not self.directory:
+            return list(self.metrics.values())
+        self.flush()
+        merged = {}
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                merged.setdefault(name, metric.empty())
+                for key, value in values:
+                    merged[name].merge(tuple(key), value)
+        return [merged.get(name) or metric.empty() for name, metric in self.metrics.items()]
+
+    # -- exposition ------------------------------------------------------
+
+    def render(self):
+        lines = []
+        for metric in self.collect():
+            lines.append(f'# HELP {metric.name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample_name, key, value in metric.samples():
+                names = metric.sample_labelnames(sample_name)
+                labels = ','.join(f'{n}="{_escape_label(v)}"' for n, v in zip(names, key))
+                lines.append(f'{sample_name}{{{labels}}} {_number(value)}' if labels else f'{sample_name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def _escape_help(text):
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _escape_label(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+REQUEST_LATENCY = registry.histogram(
+    'verifeed_http_request_duration_seconds', 'Time to answer a request', ['view', 'status'],
+)
+REQUEST_DB_TIME = registry.histogram(
+    'verifeed_http_request_db_seconds', 'Database time spent per request', ['view'], buckets=DB_BUCKETS,
+)
+DB_QUERIES = registry.counter(
+    'verifeed_db_queries', 'SQL queries executed while handling requests', ['view'],
+)
+EMAIL_LATENCY = registry.histogram(
+    'verifeed_email_send_duration_seconds', 'SendGrid send latency', ['kind'],
+)
+EMAIL_FAILURES = registry.counter(
+    'verifeed_email_send_failures', 'Emails that could not be sent', ['kind'],
+)
+OTP_GENERATED = registry.counter(
+    'verifeed_otp_generated', 'One-time passwords issued', ['purpose'],
+)
+OTP_VERIFICATIONS = registry.counter(
+    'verifeed_otp_verifications', 'One-time password checks', ['purpose', 'result'],
+)
+CACHE_LOOKUPS = registry.counter(
+    'verifeed_cache_lookups', 'Cache reads by outcome; hit ratio = hit / (hit + miss)', ['cache', 'result'],
+)
+THROTTLED = registry.counter(
+    'verifeed_throttled_requests', 'Requests rejected by a rate limit', ['scope', 'key'],
+)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint; requires `Bearer METRICS_TOKEN`, and is
+    closed without a token unless DEBUG is on
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 
     'accounts',
     'reviews',
+    'uploads',
     'corsheaders',
 ]
 
@@ -48,6 +49,7 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 
 # MIDDLEWARE 
 MIDDLEWARE = [
+    'LandingPage.timing.RequestTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',   
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -79,8 +81,13 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'if-none-match',
+    'if-modified-since',
 ]
 
+# Let the extension read validators for conditional polling
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified', 'Server-Timing']
+
 # CSRF CONFIGURATION
 CSRF_TRUSTED_ORIGINS = [
     "https://veri-feed-frontend.vercel.app",
@@ -117,6 +124,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated'
     ],
+    # Proxies in front of gunicorn that append to X-Forwarded-For (1 on
+    # Heroku). With 0 the client address is REMOTE_ADDR and X-Forwarded-For,
+    # which any client can send, is ignored by the throttles.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '0')),
 }
 
 # JWT SETTINGS
@@ -134,10 +145,30 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are named by content hash and stored once (LandingPage.storage),
+# so /media/ URLs for them can be cached forever
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+STORAGES = {
+    'default': {'BACKEND': 'LandingPage.storage.ContentAddressedStorage'},
+    # Django 5.1+ ignores STATICFILES_STORAGE; this is the storage in effect
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# MEDIA SERVING
+# /media/ is served by LandingPage.media.serve_media. MEDIA_SERVE_MODE
+# 'stream' sends files from the worker with sendfile and Range support;
+# 'accel' hands them to nginx with X-Accel-Redirect to MEDIA_ACCEL_LOCATION
+# (an `internal` location aliased to MEDIA_ROOT, see README);
+# 'sendfile' sets X-Sendfile for Apache / lighttpd. Files without a hashed
+# name are cached for MEDIA_MAX_AGE seconds, then revalidated.
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'stream')
+MEDIA_ACCEL_LOCATION = os.environ.get('MEDIA_ACCEL_LOCATION', '/protected-media/')
+MEDIA_MAX_AGE = 3600
+
 # WHITENOISE SETTINGS
-WHITENOISE_AUTOREFRESH = True  # Only for media files
+# Static files only: WhiteNoise scans its roots into memory, and with
+# AUTOREFRESH re-scans on every request, which is no way to serve uploads
 WHITENOISE_USE_FINDERS = True
-WHITENOISE_ROOT = MEDIA_ROOT
 
 os.makedirs(os.path.join(MEDIA_ROOT, 'profile_pics'), exist_ok=True)
 os.makedirs(os.path.join(MEDIA_ROOT, 'videos'), exist_ok=True)
@@ -146,6 +177,126 @@ os.makedirs(os.path.join(MEDIA_ROOT, 'videos'), exist_ok=True)
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024
 
+# CACHES
+# Local memory by default (per worker). Set CACHE_URL, e.g. redis://host:6379/0,
+# to share the cache between gunicorn workers; CACHE_BACKEND picks another
+# Django cache backend for that location (e.g. PyMemcacheCache).
+CACHE_URL = os.environ.get('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'verifeed',
+        }
+    }
+
+# Public review summaries are cached per service and invalidated on review writes
+SUMMARY_CACHE = 'default'
+SUMMARY_CACHE_TIMEOUT = int(os.environ.get('SUMMARY_CACHE_TIMEOUT', '300'))
+
+# Most services accepted by the batched summary endpoint in one request
+SERVICE_SUMMARY_BATCH_LIMIT = 50
+
+# Most reviews accepted by the bulk submission endpoint in one request
+REVIEW_BULK_CREATE_LIMIT = 100
+
+# Identical concurrent summary / service review reads are computed once and
+# shared; followers wait up to SINGLE_FLIGHT_WAIT_TIMEOUT seconds, then compute
+SINGLE_FLIGHT_CACHE = 'default'
+SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_WAIT_TIMEOUT', '5'))
+SINGLE_FLIGHT_LOCK_TIMEOUT = 10
+
+# HELPFUL VOTE COUNTERS
+# Vote deltas are buffered in this cache and flushed to Review.helpful_count
+# every N seconds (0 writes every vote straight through). Workers flush as
+# votes come in; `python manage.py flush_helpful_counts` (the `counters`
+# process in the Procfile) also flushes deltas from workers that stopped.
+# Buffering needs a shared cache, so without CACHE_URL votes are written
+# straight through; startup fails if buffering is turned on over LocMemCache.
+HELPFUL_COUNT_CACHE = 'default'
+HELPFUL_COUNT_FLUSH_INTERVAL = int(os.environ.get('HELPFUL_COUNT_FLUSH_INTERVAL', '5' if CACHE_URL else '0'))
+
+# REQUEST TIMING
+# Query count, DB / serializer / view time per request, logged as one JSON line
+# and sent to staff (or everyone under DEBUG) as a Server-Timing header.
+# Requests over either threshold are logged at WARNING. Turning this off
+# drops the log line and header; /metrics still gets the measurements.
+REQUEST_TIMING_ENABLED = os.environ.get('REQUEST_TIMING_ENABLED', 'True') == 'True'
+REQUEST_TIMING_SLOW_QUERIES = int(os.environ.get('REQUEST_TIMING_SLOW_QUERIES', '20'))
+REQUEST_TIMING_SLOW_MS = int(os.environ.get('REQUEST_TIMING_SLOW_MS', '500'))
+
+# METRICS
+# Prometheus text format on /metrics. Under multi-worker gunicorn set
+# METRICS_DIR to a directory writable by every worker: each one writes its
+# values there and a scrape sums them (start gunicorn with
+# -c LandingPage/gunicorn.conf.py so files from the last run are cleared).
+# METRICS_TOKEN must be sent as `Authorization: Bearer <token>`; without one
+# /metrics answers 403 unless DEBUG is on.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# EMAIL OUTBOX
+# OTP and notification emails are queued in accounts.EmailOutbox and sent by
+# `python manage.py send_emails`. Failed sends are retried after
+# EMAIL_OUTBOX_RETRY_DELAY * 2**(attempt-1) seconds (jittered, capped at
+# EMAIL_OUTBOX_MAX_RETRY_DELAY), up to EMAIL_OUTBOX_MAX_ATTEMPTS times.
+# accounts.outbox.LocMemProvider records emails instead of sending them.
+EMAIL_OUTBOX_PROVIDER = os.environ.get('EMAIL_OUTBOX_PROVIDER', 'accounts.outbox.SendGridProvider')
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 5
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 300
+EMAIL_OUTBOX_LEASE = 60
+# SendGrid v3 API base URL (a local fake in benchmarks)
+SENDGRID_API_URL = os.environ.get('SENDGRID_API_URL', 'https://api.sendgrid.com')
+
+# OTP STORE
+# accounts.otp_backends.DatabaseOTPBackend keeps codes in UserOTP rows;
+# CacheOTPBackend keeps them in the OTP_CACHE cache instead, which must be
+# shared by all workers (set CACHE_URL). OTP_AUDIT records every issued code
+# (not the code itself) as an OTPIssuance row, written in the background
+# every OTP_AUDIT_FLUSH_INTERVAL seconds (0 writes straight away).
+OTP_BACKEND = os.environ.get('OTP_BACKEND', 'accounts.otp_backends.DatabaseOTPBackend')
+OTP_CACHE = 'default'
+OTP_AUDIT = os.environ.get('OTP_AUDIT', 'False') == 'True'
+OTP_AUDIT_FLUSH_INTERVAL = 2
+
+# AUTH THROTTLING
+# Token-bucket limits on the unauthenticated account endpoints, per client IP
+# and per account named in the request. 'N/period' allows a burst of N and
+# refills at N per period. Buckets live in AUTH_THROTTLE_CACHE, which must be
+# shared by all workers (set CACHE_URL) for the limits to hold across them.
+AUTH_THROTTLE_CACHE = 'default'
+AUTH_THROTTLES = {
+    'register': {'ip': '10/hour'},
+    'login': {'ip': '30/min', 'account': '10/min'},
+    'otp_request': {'ip': '20/min', 'account': '5/min'},
+    'otp_resend': {'ip': '20/min', 'account': '3/min'},
+}
+
+# CHUNKED UPLOADS
+# Videos and other large files are uploaded in CHUNKED_UPLOAD_CHUNK_SIZE
+# pieces (see uploads.chunked), streamed to CHUNKED_UPLOAD_DIR, which should
+# be on the same filesystem as MEDIA_ROOT so finished files are moved, not
+# copied. Unfinished uploads expire CHUNKED_UPLOAD_TTL seconds after their
+# last chunk; run `python manage.py purge_uploads` periodically. Each user
+# may have CHUNKED_UPLOAD_MAX_OPEN_SESSIONS unfinished uploads, announcing
+# CHUNKED_UPLOAD_MAX_PENDING_BYTES in total.
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'upload_parts')
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+CHUNKED_UPLOAD_TTL = 24 * 3600
+CHUNKED_UPLOAD_MAX_OPEN_SESSIONS = 5
+CHUNKED_UPLOAD_MAX_PENDING_BYTES = 4 * 1024 ** 3
+CHUNKED_UPLOAD_CONTENT_TYPES = ['video/mp4', 'video/webm', 'video/quicktime', 'video/x-matroska']
+
 # EMAIL CONFIGURATION
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = (os.getenv("EMAIL_HOST", "smtp.sendgrid.net"))
@@ -0,0 +1,171 @@
+"""
+Content-addressed media storage.
+
+ContentAddressedStorage names every saved file after a hash of its bytes,
+keeping the directory and extension it was given:
+
+    profile_pics/photo.png -> profile_pics/9f86d081884c7d659a2feaa0c55ad015.png
+
+Saving bytes that are already stored writes nothing and returns the
+existing name, so repeated uploads of one picture share a single file. A
+name always refers to the same content, which lets the media view serve
+these files with a far-future immutable Cache-Control.
+
+Several records can then point at one file, so each file has a reference
+count in accounts.MediaFile: `save` adds a reference and `delete` drops one.
+The file is removed only when the last reference goes, once the
+transaction that dropped it has committed. Files stored under other names
+(uploads from before this storage, the shared default picture) have no
+count and are deleted straight away, as before. A hashed name with no
+count (e.g. after a data import that skipped the counts) is never deleted:
+other records may still share it.
+
+Counts change inside the caller's transaction when there is one, so the
+code that saves or deletes a file and then saves the record pointing at it
+should do both in one `transaction.atomic()`: if the record's save fails,
+the count change rolls back with it. Outside a transaction a failed save
+leaves the count one too high (the file is kept) or one too low.
+"""
+import errno
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+# Hex digits of the SHA-256 kept in a name: 128 bits
+HASH_LENGTH = 32
+
+_HASHED_NAME = re.compile(rf'(^|/)[0-9a-f]{{{HASH_LENGTH}}}(\.[A-Za-z0-9]+)?$')
+
+
+def is_content_addressed(name):
+    """Whether `name` is a hashed name, whose content can never change"""
+    return bool(_HASHED_NAME.search(name))
+
+
+def file_digest(content):
+    sha = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Never add Django's collision suffix; _save picks the final name
+        return name
+
+    def hashed_name(self, name, digest):
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, f'{digest[:HASH_LENGTH]}{extension}')
+
+    def _save(self, name, content):
+        from accounts.models import MediaFile
+
+        name = self.hashed_name(name, file_digest(content))
+        with transaction.atomic():
+            # Serializes against a concurrent delete of the same file
+            media_file, _ = MediaFile.objects.select_for_update().get_or_create(
+                name=name, defaults={'size': content.size},
+            )
+            if not self.exists(name):
+                self._write(name, content)
+            MediaFile.objects.filter(pk=media_file.pk).update(refcount=F('refcount') + 1)
+        return name
+
+    def _write(self, name, content):
+        """Write to a temporary file, then move it into place whole"""
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            os.chmod(tmp, self.file_permissions_mode or 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def adopt(self, name, path, digest):
+        """
+        Store the local file at `path`, whose SHA-256 is `digest`, by moving
+        it into place rather than reading and copying it. Returns the stored
+        name; `path` is gone afterwards either way.
+        """
+        from accounts.models import MediaFile
+
+        name = self.hashed_name(name, digest)
+        with transaction.atomic():
+            media_file, _ = MediaFile.objects.select_for_update().get_or_create(
+                name=name, defaults={'size': os.path.getsize(path)},
+            )
+            if self.exists(name):
+                os.remove(path)
+            else:
+                target = self.path(name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.chmod(path, self.file_permissions_mode or 0o644)
+                try:
+                    os.replace(path, target)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    # On another filesystem: copy, then drop the original
+                    with open(path, 'rb') as f:
+                        self._write(name, File(f))
+                    os.remove(path)
+            MediaFile.objects.filter(pk=media_file.pk).update(refcount=F('refcount') + 1)
+        return name
+
+    def reference(self, name):
+        """Count one more record pointing at an already stored file"""
+        from accounts.models import MediaFile
+
+        with transaction.atomic():
+            media_file, _ = MediaFile.objects.select_for_update().get_or_create(
+                name=name, defaults={'size': self.size(name)},
+            )
+            MediaFile.objects.filter(pk=media_file.pk).update(refcount=F('refcount') + 1)
+
+    def delete(self, name):
+        from accounts.models import MediaFile
+
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        with transaction.atomic():
+            media_file = MediaFile.objects.select_for_update().filter(name=name).first()
+            if media_file is None:
+                if is_content_addressed(name):
+                    logger.warning(f"Not deleting {name}: it has no reference count")
+                    return
+                return super().delete(name)
+            if media_file.refcount > 1:
+                MediaFile.objects.filter(pk=media_file.pk).update(refcount=F('refcount') - 1)
+                return
+            MediaFile.objects.filter(pk=media_file.pk).update(refcount=0)
+            transaction.on_commit(lambda: self._remove_unreferenced(name))
+
+    def _remove_unreferenced(self, name):
+        from accounts.models import MediaFile
+
+        # The row stays at refcount 0 so that saving the same bytes again
+        # waits on its lock instead of racing this removal
+        with transaction.atomic():
+            if MediaFile.objects.select_for_update().filter(name=name, refcount=0).exists():
+                super().delete(name)
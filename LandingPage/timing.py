@@ -0,0 +1,173 @@
+"""
+Per-request timing: query count, database time, serializer time and view time.
+
+RequestTimingMiddleware measures every request and writes one JSON log line
+to the `LandingPage.timing` logger. Requests over REQUEST_TIMING_SLOW_QUERIES
+queries or REQUEST_TIMING_SLOW_MS milliseconds are logged at WARNING with
+"slow": true. Staff users, and everyone under DEBUG, also get a
+Server-Timing header that browser dev tools can display.
+
+The same measurements feed the request, DB and query metrics served on
+/metrics (see LandingPage.metrics).
+
+Serializer time is collected by TimedSerializerMixin. Database time comes
+from a connection.execute_wrapper that is only installed while a request is
+being measured. REQUEST_TIMING_ENABLED turns off only the log line and the
+header: requests are still measured for the metrics.
+"""
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_timings', default=None)
+
+
+class Timings:
+    def __init__(self):
+        self.queries = 0
+        self.spans = {'db': 0.0}
+        self.view_started = self.view_ended = None
+        self._depth = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.spans['db'] += time.perf_counter() - started
+            self.queries += 1
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name):
+    """Add the enclosed block's duration to the current request's `name` time"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    # Nested spans of one name (a serializer inside a serializer) count once
+    depth = timings._depth.get(name, 0)
+    timings._depth[name] = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._depth[name] = depth
+        if not depth:
+            timings.add(name, time.perf_counter() - started)
+
+
+class TimedSerializerMixin:
+    """Counts validation and to_representation towards the `serializer` time"""
+
+    def is_valid(self, *args, **kwargs):
+        with span('serializer'):
+            return super().is_valid(*args, **kwargs)
+
+    def to_representation(self, *args, **kwargs):
+        with span('serializer'):
+            return super().to_representation(*args, **kwargs)
+
+
+class RequestTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Off: metrics only, no log line or Server-Timing header
+        self.enabled = getattr(settings, 'REQUEST_TIMING_ENABLED', True)
+        self.slow_queries = getattr(settings, 'REQUEST_TIMING_SLOW_QUERIES', None)
+        self.slow_ms = getattr(settings, 'REQUEST_TIMING_SLOW_MS', None)
+
+    def __call__(self, request):
+        timings = Timings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        finished = time.perf_counter()
+        total = finished - started
+
+        if timings.view_started is not None:
+            # View time excludes the queries and serialization it triggered
+            view = (timings.view_ended or finished) - timings.view_started
+            timings.spans['view'] = max(view - timings.spans['db'] - timings.spans.get('serializer', 0.0), 0.0)
+        entry = self.log_entry(request, response, timings, total)
+        self.record_metrics(entry, timings, total)
+        if not self.enabled:
+            return response
+        if entry['slow']:
+            logger.warning(json.dumps(entry))
+        else:
+            logger.info(json.dumps(entry))
+
+        if self.show_header(request):
+            response.headers['Server-Timing'] = self.server_timing(timings, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _current.get().view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses come through here before they are rendered
+        _current.get().view_ended = time.perf_counter()
+        return response
+
+    def process_exception(self, request, exception):
+        _current.get().view_ended = time.perf_counter()
+
+    def log_entry(self, request, response, timings, total):
+        match = getattr(request, 'resolver_match', None)
+        total_ms = total * 1000
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': timings.queries,
+            'total_ms': round(total_ms, 2),
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in timings.spans.items()},
+            'slow': (
+                (self.slow_queries is not None and timings.queries > self.slow_queries)
+                or (self.slow_ms is not None and total_ms > self.slow_ms)
+            ),
+        }
+
+    def record_metrics(self, entry, timings, total):
+        # View names rather than paths keep label cardinality bounded
+        view = entry['view'] or 'unmatched'
+        metrics.REQUEST_LATENCY.observe(total, view=view, status=entry['status'])
+        metrics.REQUEST_DB_TIME.observe(timings.spans['db'], view=view)
+        if timings.queries:
+            metrics.DB_QUERIES.inc(timings.queries, view=view)
+
+    def show_header(self, request):
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return bool(user is not None and user.is_staff)
+
+    def server_timing(self, timings, total):
+        parts = [f'db;dur={timings.spans["db"] * 1000:.2f};desc="{timings.queries} queries"']
+        parts += [
+            f'{name};dur={seconds * 1000:.2f}'
+            for name, seconds in timings.spans.items() if name != 'db'
+        ]
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
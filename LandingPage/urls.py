@@ -5,7 +5,8 @@ from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .debug_views import check_media_files
-from django.views.static import serve
+from .metrics import metrics_view
+from .media import serve_media
 
 
 
@@ -14,12 +15,14 @@ router = DefaultRouter()
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('debug/media/', check_media_files),
+    path('metrics', metrics_view, name='metrics'),
     path('api/accounts/', include('accounts.urls')),
+    path('api/uploads/', include('uploads.urls')),
     path('api/', include('reviews.urls')), 
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
 
-    re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
+    re_path(r'^media/(?P<path>.*)$', serve_media),
 
 ]
 
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from .models import CustomUser, EmailOutbox, MediaFile, OTPIssuance
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -12,4 +12,31 @@ class CustomUserAdmin(UserAdmin):
     # Add profile_picture to the user edit form
     fieldsets = UserAdmin.fieldsets + (
         ('Profile', {'fields': ('profile_picture', 'birthday')}),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'user', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['user__username', 'user__email']
+    list_select_related = ['user']
+    # Payloads hold OTP codes
+    exclude = ['payload']
+    readonly_fields = ['kind', 'user', 'attempts', 'expires_at', 'last_error', 'created_at', 'sent_at']
+
+
+@admin.register(OTPIssuance)
+class OTPIssuanceAdmin(admin.ModelAdmin):
+    list_display = ['user', 'purpose', 'backend', 'ip_address', 'issued_at', 'expires_at']
+    list_filter = ['purpose', 'backend']
+    search_fields = ['user__username', 'user__email', 'ip_address']
+    list_select_related = ['user']
+
+
+@admin.register(MediaFile)
+class MediaFileAdmin(admin.ModelAdmin):
+    list_display = ['name', 'size', 'refcount', 'created_at']
+    search_fields = ['name']
+    # Counts are kept by the storage; editing them could delete files still in use
+    readonly_fields = ['name', 'size', 'refcount', 'created_at']
@@ -0,0 +1,314 @@
+"""
+Resized copies of profile pictures.
+
+Uploads are kept as sent, but every response that shows an avatar used to
+link to that original (up to 5 MB) even for a 48 px thumbnail. Now each
+upload is decoded once, rotated upright from its EXIF orientation,
+center-cropped square and saved at every AVATAR_SIZES size as WebP and
+JPEG. The names the storage gave them go in
+CustomUser.profile_picture_variants:
+
+    {"48": {"webp": "profile_pics/variants/<hash>.webp", "jpeg": "..."}, ...}
+
+Serializers ask `avatar_url(user, size)` for the smallest variant at least
+`size` pixels wide, and fall back to the original when there is none (e.g.
+for pictures uploaded before variants existed; `generate_avatars` backfills
+those).
+
+The shared default picture has fixed-name variants next to it
+(profile_pics/variants/default_48.webp, ...), which `generate_avatars`
+writes. Users on the default picture keep empty variants and are served
+those, once they exist.
+"""
+import io
+import logging
+import os
+import posixpath
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SIZES = (48, 96, 256)
+
+# Pillow format name, file extension and encoder options
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+# Sizes served per context: review lists show ~48 CSS px, doubled for HiDPI
+REVIEW_AVATAR_SIZE = 96
+PROFILE_AVATAR_SIZE = 256
+
+DEFAULT_PICTURE = 'profile_pics/default.jpg'
+
+# Media roots where the default picture's variants were found
+_default_variants_found = set()
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def render_variants(source):
+    """{size: {format: bytes}} for an image file or file-like object"""
+    try:
+        with Image.open(source) as image:
+            # Let the JPEG decoder scale down while decoding; far cheaper than
+            # decoding a full-size camera photo and resizing afterwards
+            image.draft('RGB', (max(AVATAR_SIZES) * 2, max(AVATAR_SIZES) * 2))
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e)) from e
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = {}
+    for size in sorted(AVATAR_SIZES, reverse=True):
+        # Each size is scaled from the next larger one rather than the original
+        image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        variants[size] = {}
+        for fmt, (pil_format, _, options) in FORMATS.items():
+            frame = image
+            if has_alpha and pil_format == 'JPEG':
+                frame = Image.new('RGB', image.size, 'white')
+                frame.paste(image, mask=image.getchannel('A'))
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, **options)
+            variants[size][fmt] = buffer.getvalue()
+    return variants
+
+
+def variant_name(name, size, fmt):
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}_{size}.{FORMATS[fmt][1]}')
+
+
+def save_variants(field_file, rendered=None):
+    """
+    Write the variants of the picture in `field_file` to its storage and
+    return the names to keep in profile_picture_variants
+    """
+    if rendered is None:
+        with field_file.storage.open(field_file.name, 'rb') as source:
+            rendered = render_variants(source)
+    storage = field_file.storage
+    names = {}
+    for size, formats in rendered.items():
+        names[str(size)] = {}
+        for fmt, data in formats.items():
+            names[str(size)][fmt] = storage.save(variant_name(field_file.name, size, fmt), ContentFile(data))
+    return names
+
+
+def default_variants(storage):
+    """Names of the default picture's variants, or {} until they are written"""
+    names = {
+        str(size): {fmt: variant_name(DEFAULT_PICTURE, size, fmt) for fmt in FORMATS}
+        for size in AVATAR_SIZES
+    }
+    if storage.location not in _default_variants_found:
+        if not all(storage.exists(name) for formats in names.values() for name in formats.values()):
+            return {}
+        _default_variants_found.add(storage.location)
+    return names
+
+
+def write_default_variants(storage):
+    """
+    Write the default picture's variants under their fixed names. Like the
+    default picture itself they bypass the storage's naming and reference
+    counts, since no user owns them.
+    """
+    with storage.open(DEFAULT_PICTURE, 'rb') as source:
+        rendered = render_variants(source)
+    for size, formats in rendered.items():
+        for fmt, data in formats.items():
+            path = storage.path(variant_name(DEFAULT_PICTURE, size, fmt))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+
+def delete_variants(user):
+    if user.profile_picture and user.profile_picture.name == DEFAULT_PICTURE:
+        # Shared by every user without a picture of their own
+        return
+    storage = user.profile_picture.storage
+    for formats in (user.profile_picture_variants or {}).values():
+        for name in formats.values():
+            try:
+                storage.delete(name)
+            except Exception as e:
+                logger.warning(f"Failed to delete avatar variant {name}: {e}")
+
+
+def set_profile_picture(user, upload):
+    """
+    Replace the user's picture with `upload` and its variants, deleting the
+    old files. Raises InvalidImage, before touching anything, if Pillow can't
+    read the upload. The caller saves the user.
+    """
+    rendered = render_variants(upload)
+    upload.seek(0)
+    clear_profile_picture(user)
+    user.profile_picture.save(upload.name, upload, save=False)
+    user.profile_picture_variants = save_variants(user.profile_picture, rendered)
+
+
+def clear_profile_picture(user, default=None):
+    """Delete the user's own picture and its variants; the caller saves the user"""
+    delete_variants(user)
+    if user.profile_picture and user.profile_picture.name != DEFAULT_PICTURE:
+        try:
+            user.profile_picture.delete(save=False)
+        except Exception as e:
+            logger.warning(f"Failed to delete old profile picture: {e}")
+    user.profile_picture_variants = {}
+    if default is not None:
+        user.profile_picture = default
+
+
+def avatar_url(user, size, request=None, fmt='webp'):
+    """URL of the smallest variant at least `size` px wide, else of the original"""
+    if user is None or not user.profile_picture:
+        return None
+    variants = user.profile_picture_variants or {}
+    if not variants and user.profile_picture.name == DEFAULT_PICTURE:
+        variants = default_variants(user.profile_picture.storage)
+    sizes = sorted(int(s) for s in variants)
+    if sizes:
+        formats = variants[str(next((s for s in sizes if s >= size), sizes[-1]))]
+        name = formats.get(fmt) or next(iter(formats.values()))
+        url = user.profile_picture.storage.url(name)
+    else:
+        url = user.profile_picture.url
+    return request.build_absolute_uri(url) if request else url
+
+
+def backfill_variants(force=False, batch_size=200):
+    """
+    Create variants for users whose picture has none (all users with
+    `force`), and the default picture's variants if missing. A picture
+    shared by several users is resized once. Returns counts of pictures
+    resized, users updated and users skipped because their file is missing
+    or unreadable.
+    """
+    from django.core.files.storage import default_storage
+
+    from .models import CustomUser
+
+    counts = {'pictures': 0, 'users': 0, 'skipped': 0}
+    if default_storage.exists(DEFAULT_PICTURE) and (force or not default_variants(default_storage)):
+        try:
+            write_default_variants(default_storage)
+            counts['pictures'] += 1
+        except InvalidImage as e:
+            logger.warning(f"Not resizing {DEFAULT_PICTURE}: {e}")
+
+    users = (
+        CustomUser.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True)
+        .exclude(profile_picture=DEFAULT_PICTURE)
+    )
+    if not force:
+        users = users.filter(profile_picture_variants={})
+
+    done = {}
+    pending = []
+    for user in users.only('pk', 'profile_picture', 'profile_picture_variants').order_by('pk').iterator():
+        name = user.profile_picture.name
+        storage = user.profile_picture.storage
+        if name in done:
+            variants = done[name]
+            if variants and hasattr(storage, 'reference'):
+                # Every user holds its own reference to the copies, so that
+                # deleting one user's picture leaves them for the others
+                for formats in variants.values():
+                    for variant in formats.values():
+                        storage.reference(variant)
+        else:
+            try:
+                variants = save_variants(user.profile_picture)
+                counts['pictures'] += 1
+            except (FileNotFoundError, InvalidImage) as e:
+                logger.warning(f"Not resizing {name}: {e}")
+                variants = None
+            done[name] = variants
+        if variants is None:
+            counts['skipped'] += 1
+            continue
+
+        delete_variants(user)
+        user.profile_picture_variants = variants
+        pending.append(user)
+        if len(pending) >= batch_size:
+            CustomUser.objects.bulk_update(pending, ['profile_picture_variants'])
+            counts['users'] += len(pending)
+            pending = []
+    CustomUser.objects.bulk_update(pending, ['profile_picture_variants'])
+    counts['users'] += len(pending)
+    return counts
+
+
+def dedupe_pictures(batch_size=200):
+    """
+    Move pictures and variants saved under their upload names to
+    content-addressed names, so identical files collapse into one, then
+    delete the old files. Needs ContentAddressedStorage. Returns counts of
+    files moved, files left after merging, users updated and bytes freed.
+    """
+    from django.core.files.storage import default_storage
+
+    from LandingPage.storage import is_content_addressed
+
+    from .models import CustomUser
+
+    storage = default_storage
+    moved = {}
+
+    def adopt(name):
+        if not name or name == DEFAULT_PICTURE or is_content_addressed(name):
+            return name
+        if name in moved:
+            storage.reference(moved[name])
+            return moved[name]
+        try:
+            with storage.open(name) as f:
+                moved[name] = storage.save(name, f)
+        except FileNotFoundError:
+            logger.warning(f"Not moving {name}: file is missing")
+            return name
+        return moved[name]
+
+    pending = []
+    counts = {'files': 0, 'stored': 0, 'users': 0, 'bytes_freed': 0}
+    users = CustomUser.objects.only('pk', 'profile_picture', 'profile_picture_variants').order_by('pk')
+    for user in users.iterator():
+        picture = adopt(user.profile_picture.name)
+        variants = {
+            size: {fmt: adopt(name) for fmt, name in formats.items()}
+            for size, formats in (user.profile_picture_variants or {}).items()
+        }
+        if picture != user.profile_picture.name or variants != user.profile_picture_variants:
+            user.profile_picture.name = picture
+            user.profile_picture_variants = variants
+            pending.append(user)
+        if len(pending) >= batch_size:
+            CustomUser.objects.bulk_update(pending, ['profile_picture', 'profile_picture_variants'])
+            counts['users'] += len(pending)
+            pending = []
+    CustomUser.objects.bulk_update(pending, ['profile_picture', 'profile_picture_variants'])
+    counts['users'] += len(pending)
+
+    for old in moved:
+        counts['bytes_freed'] += storage.size(old)
+        storage.delete(old)
+    counts['files'] = len(moved)
+    counts['stored'] = len(set(moved.values()))
+    counts['bytes_freed'] -= sum(storage.size(name) for name in set(moved.values()))
+    return counts
@@ -0,0 +1,45 @@
+"""
+Username-or-email + password checks for token login and OTP requests.
+
+Password hashing is the slow part of both endpoints (PBKDF2, ~0.25 s), so
+`verify_credentials` finds the user with one query on a unique column and
+hashes the password exactly once, whether or not the account exists. It
+does the same checks as Django's ModelBackend: an inactive user is refused,
+an outdated hash is upgraded and user_login_failed is sent on failure.
+`issue_tokens` then turns the verified user into a JWT pair without
+authenticating again.
+"""
+from django.contrib.auth import user_login_failed
+from django.contrib.auth.models import update_last_login
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import CustomUser
+
+
+def find_user(username_or_email):
+    """The user with this email (if it has an @) or username, or None"""
+    field = 'email' if '@' in username_or_email else 'username'
+    return CustomUser.objects.filter(**{field: username_or_email}).first()
+
+
+def verify_credentials(username_or_email, password, request=None):
+    """The active user these credentials belong to, or None"""
+    user = find_user(username_or_email or '')
+    if user is None:
+        # Hash anyway, so unknown accounts can't be told apart by timing
+        CustomUser().set_password(password)
+    elif user.check_password(password) and user.is_active:
+        return user
+    user_login_failed.send(
+        sender=__name__, credentials={'username': username_or_email}, request=request
+    )
+    return None
+
+
+def issue_tokens(user, token_class=RefreshToken):
+    """Access and refresh tokens for an already verified user"""
+    refresh = token_class.for_user(user)
+    if api_settings.UPDATE_LAST_LOGIN:
+        update_last_login(None, user)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
@@ -1,183 +1,271 @@
+"""
+OTP and notification emails, sent through the SendGrid v3 API.
+
+The message bodies live in templates/accounts/email/. Each (kind, purpose)
+pair is rendered once per process, with placeholders where the recipient's
+username and code go. SendGrid fills the placeholders in per recipient from
+each personalization's `substitutions`. That lets `send_many` put up to
+SENDGRID_BATCH_LIMIT recipients into one API call.
+
+Requests go through one SendGridClient per process. It keeps a keep-alive
+HTTPS connection per thread instead of opening a new one per email.
+"""
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.template.loader import get_template
+from functools import lru_cache
+from urllib.parse import urlsplit
+import http.client
+import json
 import logging
 import os
+import threading
+
+from LandingPage import metrics
 
 logger = logging.getLogger(__name__)
 
-def send_otp_email(user, otp_code, purpose='login'):
+FROM_EMAIL = {'email': 'verifeedofficial@gmail.com', 'name': 'VeriFeed Security'}
+REPLY_TO = {'email': 'verifeedofficial@gmail.com', 'name': 'VeriFeed Support'}
+
+# SendGrid's cap on personalizations per request
+SENDGRID_BATCH_LIMIT = 1000
+
+# Filled in by SendGrid per recipient. Usernames are limited to letters,
+# digits and @.+-_, so they need no HTML escaping.
+USERNAME = '%username%'
+OTP_CODE = '%otp_code%'
+
+# Purpose-specific messaging
+OTP_COPY = {
+    'login': {
+        # Include OTP in subject (anti-spam best practice)
+        'subject': f'Your VeriFeed Login Code: {OTP_CODE}',
+        'title': 'Login Verification',
+        'greeting': f'Hello {USERNAME},',
+        'message': 'You requested to log in to your VeriFeed account.',
+    },
+    'signup': {
+        'subject': f'Welcome to VeriFeed - Verification Code: {OTP_CODE}',
+        'title': 'Welcome to VeriFeed!',
+        'greeting': f'Welcome {USERNAME}!',
+        'message': 'Thank you for creating a VeriFeed account. Please verify your email to get started.',
+    },
+    'reset': {
+        'subject': f'VeriFeed Password Reset Code: {OTP_CODE}',
+        'title': 'Password Reset',
+        'greeting': f'Hello {USERNAME},',
+        'message': 'You requested to reset your VeriFeed password.',
+    },
+}
+
+NOTIFICATION_COPY = {
+    'login': {
+        'subject': 'VeriFeed - Login Successful',
+        'heading': 'Login Successful',
+        'outcome': 'accessed',
+    },
+    'signup': {
+        'subject': 'VeriFeed - Account Activated',
+        'heading': 'Account Activated',
+        'outcome': 'verified and activated',
+    },
+}
+
+
+class EmailSendError(Exception):
+    def __init__(self, status_code, body=''):
+        super().__init__(f"SendGrid answered {status_code}: {body[:200]}")
+        self.status_code = status_code
+
+
+@lru_cache(maxsize=None)
+def render_email(kind, purpose):
+    """
+    (subject, text, html) for an email kind and purpose, with USERNAME and
+    OTP_CODE placeholders. Rendered once per process.
+    """
+    if kind == 'otp':
+        context = OTP_COPY.get(purpose, OTP_COPY['login'])
+        context = {**context, 'otp_code': OTP_CODE}
+    else:
+        context = NOTIFICATION_COPY.get(purpose, NOTIFICATION_COPY['signup'])
+        context = {**context, 'username': USERNAME}
+    text = get_template(f'accounts/email/{kind}.txt').render(context)
+    html = get_template(f'accounts/email/{kind}.html').render(context)
+    return context['subject'], text, html
+
+
+def build_payload(kind, purpose, recipients):
     """
-    Send an OTP verification email using SendGrid with anti-spam optimizations.
-    
+    SendGrid mail/send body for one or more recipients of the same email.
+    `recipients` is a list of (user, otp_code) pairs; otp_code is None for
+    notifications.
+    """
+    subject, text, html = render_email(kind, purpose)
+    personalizations = []
+    for user, otp_code in recipients:
+        substitutions = {USERNAME: user.username}
+        if otp_code is not None:
+            substitutions[OTP_CODE] = str(otp_code)
+        personalizations.append({'to': [{'email': user.email}], 'substitutions': substitutions})
+    return {
+        'personalizations': personalizations,
+        'from': FROM_EMAIL,
+        'reply_to': REPLY_TO,
+        'subject': subject,
+        'content': [
+            # Plain text version (important for spam filters)
+            {'type': 'text/plain', 'value': text},
+            {'type': 'text/html', 'value': html},
+        ],
+    }
+
+
+def personalize(text, user, otp_code=None):
+    """`text` with the placeholders filled in, as SendGrid would"""
+    text = text.replace(USERNAME, user.username)
+    return text.replace(OTP_CODE, str(otp_code)) if otp_code is not None else text
+
+
+def otp_message(user, otp_code, purpose='login'):
+    """
+    Build the OTP verification email.
+
     Args:
         user: CustomUser instance (must have .email and .username)
         otp_code: string or int - the OTP code
         purpose: 'login', 'signup', or 'reset'
     """
-    try:
-        from sendgrid import SendGridAPIClient
-        from sendgrid.helpers.mail import Mail, Email, To, Content
-        
-        # Debug logging
-        logger.info(f"🔍 Starting OTP email send for {user.email}, purpose: {purpose}")
-        
-        # Include OTP in subject (anti-spam best practice)
-        subject_map = {
-            'login': f'Your VeriFeed Login Code: {otp_code}',
-            'signup': f'Welcome to VeriFeed - Verification Code: {otp_code}',
-            'reset': f'VeriFeed Password Reset Code: {otp_code}',
-        }
-        subject = subject_map.get(purpose, f'VeriFeed Verification Code: {otp_code}')
-        
-        # Purpose-specific messaging
-        purpose_messages = {
-            'login': {
-                'title': 'Login Verification',
-                'greeting': f'Hello {user.username},',
-                'message': 'You requested to log in to your VeriFeed account.',
-                'action': 'Complete your login'
-            },
-            'signup': {
-                'title': 'Welcome to VeriFeed!',
-                'greeting': f'Welcome {user.username}!',
-                'message': 'Thank you for creating a VeriFeed account. Please verify your email to get started.',
-                'action': 'Verify your account'
-            },
-            'reset': {
-                'title': 'Password Reset',
-                'greeting': f'Hello {user.username},',
-                'message': 'You requested to reset your VeriFeed password.',
-                'action': 'Reset your password'
-            }
+    return build_payload('otp', purpose, [(user, otp_code)])
+
+
+def success_message(user, purpose='login'):
+    """
+    Build the email telling a user their OTP verification succeeded.
+
+    Args:
+        user: CustomUser instance
+        purpose: 'login' or 'signup'
+    """
+    return build_payload('notification', purpose, [(user, None)])
+
+
+class SendGridClient:
+    """Posts to the v3 mail/send endpoint over one keep-alive connection per thread"""
+
+    def __init__(self, api_key, base_url='https://api.sendgrid.com', timeout=60):
+        parts = urlsplit(base_url)
+        self.connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        )
+        self.netloc = parts.netloc
+        self.path = parts.path.rstrip('/') + '/v3/mail/send'
+        self.timeout = timeout
+        self.headers = {
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json',
+            'User-Agent': 'verifeed',
         }
-        
-        purpose_info = purpose_messages.get(purpose, purpose_messages['login'])
-        
-        # Plain text version (important for spam filters)
-        text_content = f"""
-{purpose_info['greeting']}
+        self._local = threading.local()
 
-{purpose_info['message']}
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.connection_class(self.netloc, timeout=self.timeout)
+        return connection
 
-Your verification code is: {otp_code}
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
 
-This code will expire in 5 minutes.
+    def send(self, payload):
+        """POST one mail/send body; returns the status, raises EmailSendError on non-2xx"""
+        body = json.dumps(payload).encode('utf-8')
+        reused = getattr(self._local, 'connection', None) is not None
+        try:
+            try:
+                self._connection().request('POST', self.path, body=body, headers=self.headers)
+            except (ConnectionResetError, BrokenPipeError):
+                self.close()
+                if not reused:
+                    raise
+                # The server closed an idle keep-alive connection before this
+                # request was fully written, so it can't have been sent; send
+                # it again on a fresh one
+                self._connection().request('POST', self.path, body=body, headers=self.headers)
+            # Past this point the mail may have gone out, so a failure is
+            # raised rather than retried here; the outbox retries later
+            response = self._local.connection.getresponse()
+            data = response.read()
+        except Exception:
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        if not 200 <= response.status < 300:
+            raise EmailSendError(response.status, data.decode('utf-8', 'replace'))
+        return response.status
 
-If you didn't request this code, please ignore this email or contact our support team at verifeedofficial@gmail.com.
 
-Best regards,
-The VeriFeed Team
+_client = None
+_client_lock = threading.Lock()
 
----
-VeriFeed - Deepfake Detection for Facebook
-This is an automated message, please do not reply directly to this email.
 
-To unsubscribe, email: verifeedofficial@gmail.com with subject "unsubscribe"
-"""
+def get_client():
+    """This process's SendGridClient, created on first use"""
+    global _client
+    # Get API key from EMAIL_HOST_PASSWORD (Railway variable)
+    api_key = os.environ.get('EMAIL_HOST_PASSWORD')
+    if not api_key:
+        raise ImproperlyConfigured("EMAIL_HOST_PASSWORD (SendGrid API key) not found in environment variables")
+    with _client_lock:
+        if _client is None or _client.headers['Authorization'] != f'Bearer {api_key}':
+            _client = SendGridClient(
+                api_key,
+                base_url=getattr(settings, 'SENDGRID_API_URL', 'https://api.sendgrid.com'),
+                timeout=getattr(settings, 'EMAIL_TIMEOUT', 60),
+            )
+        return _client
 
-        # Simplified HTML (less likely to trigger spam filters)
-        html_content = f"""
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{subject}</title>
-</head>
-<body style="margin: 0; padding: 0; font-family: Arial, Helvetica, sans-serif; background-color: #ffffff;">
-    <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0">
-        <tr>
-            <td align="center" style="padding: 40px 20px;">
-                <table role="presentation" width="600" cellspacing="0" cellpadding="0" border="0" style="max-width: 600px;">
-                    
-                    <!-- Header -->
-                    <tr>
-                        <td style="padding: 30px 20px; text-align: center; background-color: #4f46e5;">
-                            <h1 style="margin: 0; font-size: 28px; color: #ffffff; font-weight: 600;">VeriFeed</h1>
-                            <p style="margin: 8px 0 0 0; font-size: 14px; color: #e0e7ff;">{purpose_info['title']}</p>
-                        </td>
-                    </tr>
-                    
-                    <!-- Body -->
-                    <tr>
-                        <td style="padding: 40px 30px; background-color: #ffffff; border-left: 1px solid #e5e7eb; border-right: 1px solid #e5e7eb;">
-                            <p style="margin: 0 0 20px 0; font-size: 16px; color: #111827; font-weight: 500;">{purpose_info['greeting']}</p>
-                            <p style="margin: 0 0 30px 0; font-size: 14px; color: #4b5563; line-height: 1.6;">{purpose_info['message']}</p>
-                            
-                            <!-- OTP Box -->
-                            <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0" style="margin: 0 0 30px 0;">
-                                <tr>
-                                    <td style="padding: 25px 20px; text-align: center; background-color: #f9fafb; border: 2px solid #d1d5db; border-radius: 8px;">
-                                        <p style="margin: 0 0 12px 0; font-size: 11px; color: #6b7280; text-transform: uppercase; letter-spacing: 1px; font-weight: 600;">Your Verification Code</p>
-                                        <p style="margin: 0; font-size: 36px; font-weight: bold; color: #1f2937; letter-spacing: 8px; font-family: 'Courier New', Courier, monospace;">{otp_code}</p>
-                                        <p style="margin: 12px 0 0 0; font-size: 13px; color: #6b7280;">Valid for 5 minutes</p>
-                                    </td>
-                                </tr>
-                            </table>
-                            
-                            <!-- Security Notice -->
-                            <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0" style="margin: 0 0 20px 0;">
-                                <tr>
-                                    <td style="padding: 15px; background-color: #fef3c7; border-left: 3px solid #f59e0b; border-radius: 4px;">
-                                        <p style="margin: 0; font-size: 13px; color: #92400e; line-height: 1.5;">
-                                            <strong>Security Notice:</strong> Never share this code with anyone. VeriFeed will never ask for your verification code.
-                                        </p>
-                                    </td>
-                                </tr>
-                            </table>
-                            
-                            <p style="margin: 0; font-size: 13px; color: #6b7280; line-height: 1.5;">
-                                If you didn't request this code, please ignore this email or contact us at 
-                                <a href="mailto:verifeedofficial@gmail.com" style="color: #4f46e5; text-decoration: none;">verifeedofficial@gmail.com</a>
-                            </p>
-                        </td>
-                    </tr>
-                    
-                    <!-- Footer -->
-                    <tr>
-                        <td style="padding: 25px 30px; text-align: center; background-color: #f9fafb; border: 1px solid #e5e7eb; border-top: none;">
-                            <p style="margin: 0 0 5px 0; font-size: 13px; color: #374151; font-weight: 600;">VeriFeed</p>
-                            <p style="margin: 0 0 15px 0; font-size: 12px; color: #6b7280;">Deepfake Detection for Facebook</p>
-                            <p style="margin: 0; font-size: 11px; color: #9ca3af;">
-                                © 2025 VeriFeed. All rights reserved.
-                            </p>
-                            <p style="margin: 10px 0 0 0; font-size: 10px; color: #9ca3af;">
-                                This is an automated message. Please do not reply.
-                            </p>
-                        </td>
-                    </tr>
-                    
-                </table>
-            </td>
-        </tr>
-    </table>
-</body>
-</html>
-"""
-        
-        # Create message
-        message = Mail(
-            from_email=Email('verifeedofficial@gmail.com', 'VeriFeed Security'),
-            to_emails=To(user.email),
-            subject=subject,
-            plain_text_content=Content("text/plain", text_content),
-            html_content=Content("text/html", html_content)
-        )
-        
-        # Add reply-to email
-        message.reply_to = Email('verifeedofficial@gmail.com', 'VeriFeed Support')
-        
-        # Get API key from EMAIL_HOST_PASSWORD (Railway variable)
-        api_key = os.environ.get('EMAIL_HOST_PASSWORD')
-        if not api_key:
-            logger.error("EMAIL_HOST_PASSWORD (SendGrid API key) not found in environment variables")
-            return False
-            
-        sg = SendGridAPIClient(api_key)
-        response = sg.send(message)
-        
-        logger.info(f"✅ OTP email sent via SendGrid to {user.email} (status: {response.status_code})")
+
+def deliver(payload, kind):
+    """
+    Send a mail/send body through SendGrid. Raises on any failure
+    (missing API key, network error, non-2xx response).
+    """
+    recipients = len(payload['personalizations'])
+    try:
+        client = get_client()
+        with metrics.EMAIL_LATENCY.time(kind=kind):
+            return client.send(payload)
+    except Exception:
+        metrics.EMAIL_FAILURES.inc(recipients, kind=kind)
+        raise
+
+
+def send_many(kind, purpose, recipients):
+    """
+    Send one email to many recipients in as few API calls as possible.
+    `recipients` is a list of (user, otp_code) pairs as for build_payload.
+    """
+    for start in range(0, len(recipients), SENDGRID_BATCH_LIMIT):
+        deliver(build_payload(kind, purpose, recipients[start:start + SENDGRID_BATCH_LIMIT]), kind)
+
+
+def send_otp_email(user, otp_code, purpose='login'):
+    """
+    Send an OTP verification email right away; returns False on failure.
+    The OTP views queue theirs through accounts.outbox instead.
+    """
+    try:
+        logger.info(f"🔍 Starting OTP email send for {user.email}, purpose: {purpose}")
+        status = deliver(otp_message(user, otp_code, purpose), 'otp')
+        logger.info(f"✅ OTP email sent via SendGrid to {user.email} (status: {status})")
         return True
-        
+
     except Exception as e:
         logger.error(f"❌ Failed to send OTP email via SendGrid to {user.email}: {str(e)}")
         return False
@@ -185,126 +273,14 @@ To unsubscribe, email: verifeedofficial@gmail.com with subject "unsubscribe"
 
 def send_otp_success_notification(user, purpose='login'):
     """
-    Notify user that OTP verification was successful.
-    
-    Args:
-        user: CustomUser instance
-        purpose: 'login' or 'signup'
+    Notify user right away that OTP verification was successful; returns
+    False on failure. The OTP views queue theirs through accounts.outbox.
     """
     try:
-        from sendgrid import SendGridAPIClient
-        from sendgrid.helpers.mail import Mail, Email, To, Content
-        
-        subject = 'VeriFeed - Login Successful' if purpose == 'login' else 'VeriFeed - Account Activated'
-        
-        text_content = f"""
-Hello {user.username},
-
-Your account was successfully {'accessed' if purpose == 'login' else 'verified and activated'}.
-
-If this wasn't you, please secure your account immediately by:
-1. Changing your password
-2. Enabling two-factor authentication
-3. Contacting our support team at verifeedofficial@gmail.com
-
-Best regards,
-The VeriFeed Team
-
----
-VeriFeed - Deepfake Detection for Facebook
-© 2025 VeriFeed. All rights reserved.
-
-To unsubscribe, email: verifeedofficial@gmail.com with subject "unsubscribe"
-"""
-        
-        html_content = f"""
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{subject}</title>
-</head>
-<body style="margin: 0; padding: 0; font-family: Arial, Helvetica, sans-serif; background-color: #ffffff;">
-    <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0">
-        <tr>
-            <td align="center" style="padding: 40px 20px;">
-                <table role="presentation" width="600" cellspacing="0" cellpadding="0" border="0" style="max-width: 600px; border: 1px solid #e5e7eb;">
-                    
-                    <!-- Header -->
-                    <tr>
-                        <td style="padding: 30px 20px; text-align: center; background-color: #4f46e5;">
-                            <h1 style="margin: 0; font-size: 28px; color: #ffffff; font-weight: 600;">VeriFeed</h1>
-                        </td>
-                    </tr>
-                    
-                    <!-- Body -->
-                    <tr>
-                        <td style="padding: 40px 30px; text-align: center; background-color: #ffffff;">
-                            <!-- Success Icon -->
-                            <div style="display: inline-block; width: 60px; height: 60px; background-color: #10b981; border-radius: 50%; margin-bottom: 20px; line-height: 60px; text-align: center;">
-                                <span style="color: #ffffff; font-size: 32px; font-weight: bold;">✓</span>
-                            </div>
-                            
-                            <h2 style="margin: 0 0 15px 0; color: #111827; font-size: 22px; font-weight: 600;">
-                                {'Login Successful' if purpose == 'login' else 'Account Activated'}
-                            </h2>
-                            
-                            <p style="margin: 0 0 30px 0; color: #4b5563; font-size: 14px; line-height: 1.6;">
-                                Hello <strong style="color: #111827;">{user.username}</strong>, your account was successfully {'accessed' if purpose == 'login' else 'verified and activated'}.
-                            </p>
-                            
-                            <!-- Info box -->
-                            <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0">
-                                <tr>
-                                    <td style="padding: 15px; background-color: #eff6ff; border-left: 3px solid #3b82f6; border-radius: 4px; text-align: left;">
-                                        <p style="margin: 0; color: #1e40af; font-size: 13px; line-height: 1.5;">
-                                            If this wasn't you, please contact us immediately at
-                                            <a href="mailto:verifeedofficial@gmail.com" style="color: #1e40af; text-decoration: none; font-weight: 600;">verifeedofficial@gmail.com</a>
-                                        </p>
-                                    </td>
-                                </tr>
-                            </table>
-                        </td>
-                    </tr>
-                    
-                    <!-- Footer -->
-                    <tr>
-                        <td style="padding: 25px 30px; text-align: center; background-color: #f9fafb; border-top: 1px solid #e5e7eb;">
-                            <p style="margin: 0 0 5px 0; font-size: 13px; color: #374151; font-weight: 600;">VeriFeed</p>
-                            <p style="margin: 0 0 10px 0; font-size: 12px; color: #6b7280;">Deepfake Detection for Facebook</p>
-                            <p style="margin: 0; font-size: 11px; color: #9ca3af;">© 2025 VeriFeed. All rights reserved.</p>
-                        </td>
-                    </tr>
-                </table>
-            </td>
-        </tr>
-    </table>
-</body>
-</html>
-"""
-        
-        message = Mail(
-            from_email=Email('verifeedofficial@gmail.com', 'VeriFeed Security'),
-            to_emails=To(user.email),
-            subject=subject,
-            plain_text_content=Content("text/plain", text_content),
-            html_content=Content("text/html", html_content)
-        )
-        
-        message.reply_to = Email('verifeedofficial@gmail.com', 'VeriFeed Support')
-        
-        api_key = os.environ.get('EMAIL_HOST_PASSWORD')
-        if not api_key:
-            logger.error("EMAIL_HOST_PASSWORD not found")
-            return False
-            
-        sg = SendGridAPIClient(api_key)
-        response = sg.send(message)
-        
-        logger.info(f"✅ Success notification sent to {user.email} (status: {response.status_code})")
+        status = deliver(success_message(user, purpose), 'notification')
+        logger.info(f"✅ Success notification sent to {user.email} (status: {status})")
         return True
-        
+
     except Exception as e:
         logger.error(f"❌ Failed to send success notification to {user.email}: {str(e)}")
-        return False
\ No newline at end of file
+        return False
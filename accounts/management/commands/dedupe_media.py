@@ -0,0 +1,24 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.avatars import dedupe_pictures
+from LandingPage.storage import ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    help = (
+        "Rename profile pictures saved under their upload names to content hashes, "
+        "storing identical files once, and delete the old copies"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Users updated per query')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not LandingPage.storage.ContentAddressedStorage")
+        counts = dedupe_pictures(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {counts['files']} files into {counts['stored']} for {counts['users']} users, "
+            f"freeing {counts['bytes_freed']} bytes"
+        ))
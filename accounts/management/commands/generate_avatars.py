@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from accounts.avatars import backfill_variants
+
+
+class Command(BaseCommand):
+    help = "Create the resized copies of profile pictures uploaded before they were made at upload time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Also regenerate pictures that already have copies')
+        parser.add_argument('--batch-size', type=int, default=200, help='Users updated per query')
+
+    def handle(self, *args, **options):
+        counts = backfill_variants(force=options['force'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Resized {counts['pictures']} pictures for {counts['users']} users "
+            f"({counts['skipped']} skipped: missing or unreadable file)"
+        ))
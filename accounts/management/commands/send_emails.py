@@ -0,0 +1,45 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts.outbox import deliver_due, get_provider, purge_sent
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued OTP and notification emails from the outbox, retrying "
+        "failures with backoff. Runs until stopped unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain what is due now, then exit')
+        parser.add_argument('--batch-size', type=int, default=50, help='Emails claimed per round')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when idle')
+        parser.add_argument('--keep-days', type=int, default=7, help='Delete sent emails older than this')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        provider = get_provider()
+        purged_at = 0.0
+
+        while not self.stopping:
+            close_old_connections()
+            counts = deliver_due(batch_size=options['batch_size'], provider=provider)
+            if any(counts.values()):
+                self.stdout.write(
+                    f"sent {counts['sent']}, retrying {counts['retry']}, failed {counts['failed']}"
+                )
+                continue
+            if options['once']:
+                break
+            if time.monotonic() - purged_at > 3600:
+                purge_sent(options['keep_days'])
+                purged_at = time.monotonic()
+            time.sleep(options['poll_interval'])
+
+    def stop(self, signum, frame):
+        # Finish the batch in hand rather than abandon leased rows
+        self.stopping = True
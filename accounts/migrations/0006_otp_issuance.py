@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_email_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OTPIssuance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(max_length=20)),
+                ('backend', models.CharField(max_length=20)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('issued_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='otp_issuances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-issued_at'],
+                'indexes': [models.Index(fields=['user', '-issued_at'], name='otp_issuance_user_idx')],
+            },
+        ),
+    ]
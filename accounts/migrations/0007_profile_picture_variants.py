@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_otp_issuance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_picture_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -5,6 +5,12 @@ from datetime import timedelta
 import random
 import string
 
+from LandingPage import metrics
+
+# How long an OTP stays valid, and how many wrong codes lock it
+OTP_LIFETIME = timedelta(minutes=5)
+OTP_MAX_ATTEMPTS = 5
+
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     profile_picture = models.ImageField(
@@ -13,6 +19,8 @@ class CustomUser(AbstractUser):
         null=True,
         default='profile_pics/default.jpg'
     )
+    # Resized copies of profile_picture, see accounts.avatars
+    profile_picture_variants = models.JSONField(default=dict, blank=True)
     birthday = models.DateField(null=True, blank=True)
     two_fa_enabled = models.BooleanField(default=True)  # Enable 2FA by default
 
@@ -58,7 +66,7 @@ class UserOTP(models.Model):
         otp_code = ''.join(random.choices(string.digits, k=6))
         
         # Set expiration (5 minutes from now)
-        expires_at = timezone.now() + timedelta(minutes=5)
+        expires_at = timezone.now() + OTP_LIFETIME
 
         # Create new OTP
         otp = cls.objects.create(
@@ -68,6 +76,7 @@ class UserOTP(models.Model):
             expires_at=expires_at,
             ip_address=ip_address
         )
+        metrics.OTP_GENERATED.inc(purpose=purpose)
         
         return otp
 
@@ -77,22 +86,25 @@ class UserOTP(models.Model):
             return False
         if timezone.now() > self.expires_at:
             return False
-        if self.failed_attempts >= 5:
+        if self.failed_attempts >= OTP_MAX_ATTEMPTS:
             return False
         return True
 
     def verify(self, code):
         """Verify the OTP code"""
         if not self.is_valid():
+            metrics.OTP_VERIFICATIONS.inc(purpose=self.purpose, result='invalid')
             return False
         
         if self.otp_code == code:
             self.is_used = True
             self.save()
+            metrics.OTP_VERIFICATIONS.inc(purpose=self.purpose, result='success')
             return True
         else:
             self.failed_attempts += 1
             self.save()
+            metrics.OTP_VERIFICATIONS.inc(purpose=self.purpose, result='mismatch')
             return False
 
     @property
@@ -101,4 +113,68 @@ class UserOTP(models.Model):
         if timezone.now() > self.expires_at:
             return 0
         delta = self.expires_at - timezone.now()
-        return int(delta.total_seconds())
\ No newline at end of file
+        return int(delta.total_seconds())
+
+class OTPIssuance(models.Model):
+    """Audit record of an OTP being issued; never holds the code itself"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='otp_issuances')
+    purpose = models.CharField(max_length=20)
+    backend = models.CharField(max_length=20)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    issued_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-issued_at']
+        indexes = [
+            models.Index(fields=['user', '-issued_at'], name='otp_issuance_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.purpose} - {self.issued_at:%Y-%m-%d %H:%M}"
+
+
+class MediaFile(models.Model):
+    """Reference count of a file in LandingPage.storage.ContentAddressedStorage"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+
+class EmailOutbox(models.Model):
+    """Emails queued in the request's transaction and sent by the send_emails worker"""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    kind = models.CharField(max_length=20, choices=[
+        ('otp', 'OTP Code'),
+        ('notification', 'Verification Notice'),
+    ])
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='outbox_emails')
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, default=PENDING, choices=[
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ])
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Not worth sending after this (e.g. the OTP inside has expired)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.user.username} ({self.status})"
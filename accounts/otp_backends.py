@@ -0,0 +1,257 @@
+"""
+Where one-time passwords live between issue and verification.
+
+OTP_BACKEND picks the implementation:
+
+- DatabaseOTPBackend (default) keeps codes in the UserOTP table.
+- CacheOTPBackend keeps them in the OTP_CACHE cache. Each code expires
+  with its cache entry, and issuing or verifying does no DB writes. The
+  cache must be shared by all workers (e.g. Redis via CACHE_URL); with the
+  per-process LocMemCache, a code issued by one worker is unknown to the
+  others.
+
+The email carrying a code is queued with the backend's `mail_payload`. The
+database backend puts the code in the outbox row; the cache backend puts
+only a reference to a copy kept in its cache until the email is done with,
+so that no plain code reaches the database.
+
+Both give the same guarantees. A code expires after OTP_LIFETIME. A new
+code replaces the last one for the same user and purpose. A code works
+once. After OTP_MAX_ATTEMPTS wrong guesses the code is locked.
+
+With OTP_AUDIT on, every issued code is also recorded as an OTPIssuance
+row, without the code itself. The rows are written in batches by a
+background thread every OTP_AUDIT_FLUSH_INTERVAL seconds, or straight away
+when the interval is 0.
+"""
+import atexit
+import logging
+import secrets
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.module_loading import import_string
+
+from LandingPage import metrics
+
+from .models import OTP_LIFETIME, OTP_MAX_ATTEMPTS, OTPIssuance, UserOTP
+
+logger = logging.getLogger(__name__)
+
+
+class OTPError(Exception):
+    pass
+
+
+class OTPNotFound(OTPError):
+    """No usable code: never issued, expired, replaced or already used"""
+
+
+class OTPLocked(OTPError):
+    """Too many wrong guesses for this code"""
+
+
+class OTPMismatch(OTPError):
+    def __init__(self, remaining_attempts):
+        super().__init__(f"{remaining_attempts} attempts remaining")
+        self.remaining_attempts = remaining_attempts
+
+
+@dataclass
+class IssuedOTP:
+    code: str
+    expires_at: datetime
+    ref: str = ''
+
+
+class OTPBackend:
+    name = None
+
+    def issue(self, user, purpose='login', ip_address=None):
+        """Create a code for `user`, replacing any earlier one for `purpose`"""
+        issued = self._issue(user, purpose, ip_address)
+        if getattr(settings, 'OTP_AUDIT', False):
+            audit_trail.record(OTPIssuance(
+                user_id=user.pk, purpose=purpose, backend=self.name, ip_address=ip_address,
+                issued_at=timezone.now(), expires_at=issued.expires_at,
+            ))
+        return issued
+
+    def verify(self, user, purpose, code):
+        """Use up `code`; raises an OTPError subclass if it is not accepted"""
+        raise NotImplementedError
+
+    def mail_payload(self, issued):
+        """What the outbox row for `issued` stores to find its code"""
+        return {'otp_code': issued.code}
+
+    def mail_code(self, payload):
+        """The code to send for an outbox payload, or None if it is gone"""
+        return payload.get('otp_code') or None
+
+    def forget_mail_code(self, payload):
+        """Called once the email for `payload` has been sent or given up on"""
+
+    def _issue(self, user, purpose, ip_address):
+        raise NotImplementedError
+
+
+class DatabaseOTPBackend(OTPBackend):
+    name = 'database'
+
+    def _issue(self, user, purpose, ip_address):
+        otp = UserOTP.generate_otp(user, purpose=purpose, ip_address=ip_address)
+        return IssuedOTP(otp.otp_code, otp.expires_at)
+
+    def verify(self, user, purpose, code):
+        # Find the latest valid OTP for this user and purpose
+        otp = UserOTP.objects.filter(
+            user=user,
+            purpose=purpose,
+            is_used=False,
+            expires_at__gt=timezone.now()
+        ).order_by('-created_at').first()
+        if otp is None:
+            metrics.OTP_VERIFICATIONS.inc(purpose=purpose, result='invalid')
+            raise OTPNotFound
+        if otp.failed_attempts >= OTP_MAX_ATTEMPTS:
+            metrics.OTP_VERIFICATIONS.inc(purpose=purpose, result='invalid')
+            raise OTPLocked
+        if not otp.verify(code):
+            raise OTPMismatch(OTP_MAX_ATTEMPTS - otp.failed_attempts)
+
+
+class CacheOTPBackend(OTPBackend):
+    """
+    One entry per (user, purpose) holding a per-issue id, the code's HMAC
+    and its expiry. Attempts and use are tracked in companion keys named by
+    the issue id, so a new code starts fresh and stale keys simply expire.
+    The plain code is kept only under otp:mail:<issue id>, for the outbox.
+    """
+    name = 'cache'
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'OTP_CACHE', 'default')]
+
+    def _key(self, user, purpose):
+        return f'otp:{user.pk}:{purpose}'
+
+    def _digest(self, issue_id, code):
+        return salted_hmac('accounts.otp', f'{issue_id}:{code}').hexdigest()
+
+    def _issue(self, user, purpose, ip_address):
+        code = f'{secrets.randbelow(10 ** 6):06d}'
+        issue_id = secrets.token_hex(8)
+        expires_at = timezone.now() + OTP_LIFETIME
+        timeout = OTP_LIFETIME.total_seconds()
+        self.cache.set(f'otp:attempts:{issue_id}', 0, timeout=timeout)
+        self.cache.set(self._key(user, purpose), {
+            'id': issue_id, 'digest': self._digest(issue_id, code), 'expires_at': expires_at,
+        }, timeout=timeout)
+        self.cache.set(f'otp:mail:{issue_id}', code, timeout=timeout)
+        metrics.OTP_GENERATED.inc(purpose=purpose)
+        return IssuedOTP(code, expires_at, ref=issue_id)
+
+    def mail_payload(self, issued):
+        return {'otp_ref': issued.ref}
+
+    def mail_code(self, payload):
+        if 'otp_ref' not in payload:
+            return super().mail_code(payload)
+        return self.cache.get(f"otp:mail:{payload['otp_ref']}")
+
+    def forget_mail_code(self, payload):
+        if 'otp_ref' in payload:
+            self.cache.delete(f"otp:mail:{payload['otp_ref']}")
+
+    def verify(self, user, purpose, code):
+        entry = self.cache.get(self._key(user, purpose))
+        if entry is None or entry['expires_at'] <= timezone.now():
+            metrics.OTP_VERIFICATIONS.inc(purpose=purpose, result='invalid')
+            raise OTPNotFound
+        issue_id = entry['id']
+        timeout = max((entry['expires_at'] - timezone.now()).total_seconds(), 1)
+
+        # Count the attempt before comparing, so concurrent guesses can't
+        # get more than OTP_MAX_ATTEMPTS comparisons between them
+        try:
+            attempt = self.cache.incr(f'otp:attempts:{issue_id}')
+        except ValueError:
+            metrics.OTP_VERIFICATIONS.inc(purpose=purpose, result='invalid')
+            raise OTPNotFound
+        if attempt > OTP_MAX_ATTEMPTS:
+            metrics.OTP_VERIFICATIONS.inc(purpose=purpose, result='invalid')
+            raise OTPLocked
+
+        if not constant_time_compare(entry['digest'], self._digest(issue_id, code)):
+            metrics.OTP_VERIFICATIONS.inc(purpose=purpose, result='mismatch')
+            raise OTPMismatch(OTP_MAX_ATTEMPTS - attempt)
+
+        # add() is atomic: of two requests racing with the right code, one wins
+        if not self.cache.add(f'otp:used:{issue_id}', 1, timeout=timeout):
+            metrics.OTP_VERIFICATIONS.inc(purpose=purpose, result='invalid')
+            raise OTPNotFound
+        self.cache.delete(self._key(user, purpose))
+        metrics.OTP_VERIFICATIONS.inc(purpose=purpose, result='success')
+
+
+@lru_cache(maxsize=None)
+def _load(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return _load(getattr(settings, 'OTP_BACKEND', 'accounts.otp_backends.DatabaseOTPBackend'))
+
+
+class AuditTrail:
+    """Write-behind buffer of OTPIssuance rows"""
+
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'OTP_AUDIT_FLUSH_INTERVAL', 2)
+
+    def record(self, issuance):
+        with self._lock:
+            self._pending.append(issuance)
+        if self.flush_interval <= 0:
+            self.flush()
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='otp-audit', daemon=True)
+            self._thread.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            OTPIssuance.objects.bulk_create(pending, batch_size=500)
+        except Exception:
+            # Best effort: losing audit rows must never break sign-in
+            logger.exception(f"Could not write {len(pending)} OTP audit records")
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            close_old_connections()
+            self.flush()
+
+
+audit_trail = AuditTrail()
+atexit.register(audit_trail.flush)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from .models import UserOTP, CustomUser
-from django.utils import timezone
+from .credentials import verify_credentials
+from .models import CustomUser
+from .otp_backends import OTPLocked, OTPMismatch, OTPNotFound, get_backend
 
 
 class RequestOTPSerializer(serializers.Serializer):
@@ -17,21 +18,9 @@ class RequestOTPSerializer(serializers.Serializer):
         password = data.get('password')
         purpose = data.get('purpose')
 
-        # Find user by email or username
-        user = None
-        if '@' in username_or_email:
-            try:
-                user = CustomUser.objects.get(email=username_or_email)
-            except CustomUser.DoesNotExist:
-                raise serializers.ValidationError("Invalid credentials")
-        else:
-            try:
-                user = CustomUser.objects.get(username=username_or_email)
-            except CustomUser.DoesNotExist:
-                raise serializers.ValidationError("Invalid credentials")
-
-        # Verify password
-        if not user.check_password(password):
+        # Find user by email or username and check the password in one pass
+        user = verify_credentials(username_or_email, password, self.context.get('request'))
+        if not user:
             raise serializers.ValidationError("Invalid credentials")
 
         # Check if 2FA is enabled
@@ -77,34 +66,23 @@ class VerifyOTPSerializer(serializers.Serializer):
             except CustomUser.DoesNotExist:
                 raise serializers.ValidationError("Invalid user")
 
-        # Find the latest valid OTP for this user and purpose
-        otp = UserOTP.objects.filter(
-            user=user,
-            purpose=purpose,
-            is_used=False,
-            expires_at__gt=timezone.now()
-        ).order_by('-created_at').first()
-
-        if not otp:
+        try:
+            get_backend().verify(user, purpose, otp_code)
+        except OTPNotFound:
             raise serializers.ValidationError(
                 "No valid OTP found. Please request a new one."
             )
-
-        # Check if OTP is locked due to too many failed attempts
-        if otp.failed_attempts >= 5:
+        except OTPLocked:
+            # Too many failed attempts on this OTP
             raise serializers.ValidationError(
                 "Too many failed attempts. Please request a new OTP."
             )
-
-        # Verify the OTP code
-        if not otp.verify(otp_code):
-            remaining_attempts = 5 - (otp.failed_attempts)
+        except OTPMismatch as e:
             raise serializers.ValidationError(
-                f"Invalid OTP code. {remaining_attempts} attempts remaining."
+                f"Invalid OTP code. {e.remaining_attempts} attempts remaining."
             )
 
         data['user'] = user
-        data['otp'] = otp
         return data
 
 
@@ -1,16 +1,19 @@
 from django.conf import settings
+from django.db import transaction
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import UserOTP
 from .otp_serializers import (
     RequestOTPSerializer, 
     VerifyOTPSerializer,
     ResendOTPSerializer
 )
-from .email_utils import send_otp_email, send_otp_success_notification
+from . import outbox
+from .avatars import PROFILE_AVATAR_SIZE, avatar_url
+from .otp_backends import get_backend
+from .throttling import OTPRequestThrottle, OTPResendThrottle
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,6 +31,7 @@ def get_client_ip(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([OTPRequestThrottle])
 def request_otp(request):
     """
     Step 1: Request OTP code
@@ -35,7 +39,7 @@ def request_otp(request):
     """
     logger.info(f"OTP request received: {request.data.get('username_or_email')}")
     
-    serializer = RequestOTPSerializer(data=request.data)
+    serializer = RequestOTPSerializer(data=request.data, context={'request': request})
     
     if not serializer.is_valid():
         logger.error(f"OTP request validation failed: {serializer.errors}")
@@ -49,20 +53,15 @@ def request_otp(request):
     ip_address = get_client_ip(request)
     
     try:
-        # Generate OTP
-        otp = UserOTP.generate_otp(user, purpose=purpose, ip_address=ip_address)
-        
-        # Send OTP via email
-        email_sent = send_otp_email(user, otp.otp_code, purpose=purpose)
-        
-        if not email_sent:
-            logger.error(f"Failed to send OTP email to {user.email}")
-            return Response(
-                {'error': 'Failed to send OTP email. Please try again.'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        # Generate OTP and queue its email together; the send_emails worker delivers it
+        with transaction.atomic():
+            backend = get_backend()
+            otp = backend.issue(user, purpose=purpose, ip_address=ip_address)
+            outbox.enqueue(
+                'otp', user, expires_at=otp.expires_at, purpose=purpose, **backend.mail_payload(otp)
             )
         
-        logger.info(f"OTP generated and sent to {user.email}")
+        logger.info(f"OTP generated and queued for {user.email}")
         
         return Response({
             'message': 'OTP sent successfully to your email',
@@ -105,12 +104,10 @@ def verify_otp(request):
         refresh = RefreshToken.for_user(user)
         
         # Get profile picture URL
-        profile_picture_url = None
-        if user.profile_picture:
-            profile_picture_url = request.build_absolute_uri(user.profile_picture.url)
+        profile_picture_url = avatar_url(user, PROFILE_AVATAR_SIZE, request)
         
-        # Send success notification
-        send_otp_success_notification(user, purpose=purpose)
+        # Queue success notification
+        outbox.enqueue('notification', user, purpose=purpose)
         
         logger.info(f"OTP verified successfully for {user.username}")
         
@@ -142,6 +139,7 @@ def verify_otp(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([OTPResendThrottle])
 def resend_otp(request):
     """
     Resend OTP code to user's email
@@ -162,16 +160,12 @@ def resend_otp(request):
     ip_address = get_client_ip(request)
     
     try:
-        # Generate new OTP
-        otp = UserOTP.generate_otp(user, purpose=purpose, ip_address=ip_address)
-        
-        # Send OTP via email
-        email_sent = send_otp_email(user, otp.otp_code, purpose=purpose)
-        
-        if not email_sent:
-            return Response(
-                {'error': 'Failed to send OTP email. Please try again.'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        # Generate new OTP and queue its email together
+        with transaction.atomic():
+            backend = get_backend()
+            otp = backend.issue(user, purpose=purpose, ip_address=ip_address)
+            outbox.enqueue(
+                'otp', user, expires_at=otp.expires_at, purpose=purpose, **backend.mail_payload(otp)
             )
         
         logger.info(f"OTP resent to {user.email}")
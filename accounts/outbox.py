@@ -0,0 +1,198 @@
+"""
+Transactional email outbox.
+
+Views call `enqueue()` inside the same transaction that creates the UserOTP
+row, so an email is queued if and only if the OTP is committed, and the
+request never waits on SendGrid. The `send_emails` management command runs
+`deliver_due()` in a loop and sends the queued rows through the provider
+named by EMAIL_OUTBOX_PROVIDER.
+
+A failed send is retried with exponential backoff and jitter until
+EMAIL_OUTBOX_MAX_ATTEMPTS. Rejections that retrying cannot fix (4xx other
+than 429) and emails past their `expires_at` are marked failed at once.
+Claimed rows are leased for EMAIL_OUTBOX_LEASE seconds, so a row held by a
+worker that died is picked up again after the lease runs out.
+
+Claimed emails of the same kind and purpose go to the provider together;
+SendGridProvider sends each such group as one multi-recipient API call.
+
+An OTP email's code is blanked from its payload as soon as the row is sent
+or has failed (expiry included), so finished rows and backups of them hold
+no usable codes. With CacheOTPBackend the row never holds the code at all,
+only a reference to it (see `OTPBackend.mail_payload`). `purge_sent` deletes failed and expired OTP rows along
+with old sent ones.
+"""
+import logging
+import random
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import EmailOutbox
+from .otp_backends import get_backend
+
+logger = logging.getLogger(__name__)
+
+
+class PermanentEmailError(Exception):
+    """The provider rejected the message; sending it again will not help"""
+
+
+class SendGridProvider:
+    def send_many(self, emails):
+        """Send emails that share a kind and purpose in one API call"""
+        from .email_utils import EmailSendError, send_many
+
+        first = emails[0]
+        recipients = [(email.user, otp_code(email)) for email in emails]
+        try:
+            send_many(first.kind, first.payload.get('purpose', 'login'), recipients)
+        except EmailSendError as e:
+            if 400 <= e.status_code < 500 and e.status_code != 429:
+                raise PermanentEmailError(str(e)) from e
+            raise
+
+
+class LocMemProvider:
+    """Logs emails and keeps them in `LocMemProvider.outbox` instead of sending them (tests, local dev)"""
+    outbox = []
+
+    def send_many(self, emails):
+        for email in emails:
+            logger.info(f"Not sending {email.kind} email to {email.user.email}: {email.payload}")
+            message = {'kind': email.kind, 'to': email.user.email, **email.payload}
+            if email.kind == 'otp':
+                message.pop('otp_ref', None)
+                message['otp_code'] = otp_code(email)
+            self.outbox.append(message)
+
+
+def get_provider():
+    path = getattr(settings, 'EMAIL_OUTBOX_PROVIDER', 'accounts.outbox.SendGridProvider')
+    return import_string(path)()
+
+
+def otp_code(email):
+    """The code an OTP email carries, or None once it is no longer available"""
+    return get_backend().mail_code(email.payload)
+
+
+def enqueue(kind, user, expires_at=None, **payload):
+    """Queue an email; call inside the transaction that makes it necessary"""
+    return EmailOutbox.objects.create(kind=kind, user=user, payload=payload, expires_at=expires_at)
+
+
+def retry_delay(attempts):
+    """Seconds before attempt number `attempts + 1`: exponential, capped, jittered"""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 5)
+    ceiling = getattr(settings, 'EMAIL_OUTBOX_MAX_RETRY_DELAY', 300)
+    delay = min(base * 2 ** (attempts - 1), ceiling)
+    return delay * random.uniform(0.5, 1)
+
+
+def claim(batch_size):
+    """Lease up to `batch_size` due emails to this worker"""
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_LEASE', 60))
+    with transaction.atomic():
+        ids = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailOutbox.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        EmailOutbox.objects.filter(pk__in=ids).update(next_attempt_at=now + lease)
+    return list(EmailOutbox.objects.select_related('user').filter(pk__in=ids).order_by('id'))
+
+
+def record(email, error=None, permanent=False):
+    """Save the outcome of one attempt at `email`; returns 'sent', 'retry' or 'failed'"""
+    now = timezone.now()
+    email.attempts += 1
+    if error is None:
+        email.status, email.sent_at, email.last_error = EmailOutbox.SENT, now, ''
+    else:
+        email.last_error = error
+        if permanent or email.attempts >= getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5):
+            email.status = EmailOutbox.FAILED
+        else:
+            email.next_attempt_at = now + timedelta(seconds=retry_delay(email.attempts))
+
+    update_fields = ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+    if email.status != EmailOutbox.PENDING and email.kind == 'otp':
+        # Never needed again once the email is done with
+        get_backend().forget_mail_code(email.payload)
+        if email.payload.get('otp_code'):
+            email.payload = {**email.payload, 'otp_code': ''}
+            update_fields.append('payload')
+    email.save(update_fields=update_fields)
+    if email.status == EmailOutbox.FAILED:
+        logger.error(f"Giving up on {email.kind} email {email.pk} to {email.user.email}: {email.last_error}")
+        return 'failed'
+    if email.status == EmailOutbox.PENDING:
+        logger.warning(f"{email.kind} email {email.pk} failed (attempt {email.attempts}), retrying: {email.last_error}")
+        return 'retry'
+    return 'sent'
+
+
+def send_group(emails, provider):
+    """Send emails sharing a kind and purpose; returns one outcome per email"""
+    now = timezone.now()
+    outcomes = []
+    live = []
+    for email in emails:
+        if email.expires_at is not None and email.expires_at <= now:
+            outcomes.append(record(email, 'Expired before it could be sent', permanent=True))
+        elif email.kind == 'otp' and otp_code(email) is None:
+            outcomes.append(record(email, 'The code is no longer available', permanent=True))
+        else:
+            live.append(email)
+    if not live:
+        return outcomes
+
+    try:
+        provider.send_many(live)
+    except PermanentEmailError as e:
+        if len(live) > 1:
+            # One bad address rejects the whole request; send singly to find it
+            return outcomes + [outcome for email in live for outcome in send_group([email], provider)]
+        return outcomes + [record(live[0], str(e), permanent=True)]
+    except Exception as e:
+        return outcomes + [record(email, f'{type(e).__name__}: {e}') for email in live]
+    return outcomes + [record(email) for email in live]
+
+
+def _group_key(email):
+    return email.kind, email.payload.get('purpose', '')
+
+
+def deliver_due(batch_size=None, provider=None):
+    """Send one batch of due emails; returns outcome counts"""
+    provider = provider or get_provider()
+    counts = {'sent': 0, 'retry': 0, 'failed': 0}
+    emails = sorted(claim(batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)), key=_group_key)
+    for _, group in groupby(emails, key=_group_key):
+        for outcome in send_group(list(group), provider):
+            counts[outcome] += 1
+    return counts
+
+
+def purge_sent(days):
+    """
+    Delete sent emails older than `days`, and OTP emails that failed or
+    expired; other failed emails stay for inspection
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = EmailOutbox.objects.filter(status=EmailOutbox.SENT, sent_at__lt=cutoff).delete()
+    stale_otps = EmailOutbox.objects.filter(kind='otp').filter(
+        Q(status=EmailOutbox.FAILED) | Q(expires_at__lt=timezone.now())
+    ).exclude(status=EmailOutbox.SENT)
+    deleted += stale_otps.delete()[0]
+    return deleted
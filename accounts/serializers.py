@@ -3,11 +3,21 @@ from datetime import date
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from django.contrib.auth import authenticate
+from django.db import transaction
+from .avatars import (
+    AVATAR_SIZES, DEFAULT_PICTURE, PROFILE_AVATAR_SIZE, InvalidImage, avatar_url, clear_profile_picture,
+    set_profile_picture,
+)
+from .credentials import issue_tokens, verify_credentials
 from .models import CustomUser
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-class UserSerializer(serializers.ModelSerializer):
+from LandingPage.timing import TimedSerializerMixin
+import logging
+
+logger = logging.getLogger(__name__)
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     confirm_password = serializers.CharField(write_only=True)
     full_name = serializers.CharField(write_only=True)
     profile_picture = serializers.ImageField(required=False, allow_null=True)
@@ -68,31 +78,36 @@ class UserSerializer(serializers.ModelSerializer):
             birthday=birthday 
         )
         
-        # Set profile picture 
+        # Set profile picture and its resized copies
         if profile_picture:
-            user.profile_picture = profile_picture
-            user.save()
+            try:
+                with transaction.atomic():
+                    set_profile_picture(user, profile_picture)
+                    user.save()
+            except InvalidImage:
+                logger.warning(f"Keeping the default picture for {user.username}: upload is not a readable image")
         
         return user
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     profile_picture_url = serializers.SerializerMethodField()
+    avatar_urls = serializers.SerializerMethodField()
     full_name = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
         fields = ['id', 'first_name', 'last_name', 'email', 'username', 
-                 'profile_picture', 'profile_picture_url', 'full_name']
+                 'profile_picture', 'profile_picture_url', 'avatar_urls', 'full_name']
         read_only_fields = ['id', 'username', 'email']
 
     def get_profile_picture_url(self, obj):
-        """Return full URL for profile picture"""
+        """Return full URL for the profile-sized picture"""
+        return avatar_url(obj, PROFILE_AVATAR_SIZE, self.context.get('request'))
+
+    def get_avatar_urls(self, obj):
+        """URL of the picture at each size, for srcset"""
         request = self.context.get('request')
-        if obj.profile_picture:
-            if request:
-                return request.build_absolute_uri(obj.profile_picture.url)
-            return obj.profile_picture.url
-        return None
+        return {size: avatar_url(obj, size, request) for size in AVATAR_SIZES}
 
     def get_full_name(self, obj):
         """Return formatted full name"""
@@ -105,30 +120,22 @@ class UserProfileSerializer(serializers.ModelSerializer):
             if attr != 'profile_picture':
                 setattr(instance, attr, value)
         
-        # Handle profile picture separately
-        if 'profile_picture' in validated_data:
-            profile_picture = validated_data['profile_picture']
-            if profile_picture:
-                # Delete old profile picture if exists and not default
-                if (instance.profile_picture and 
-                    instance.profile_picture.name != 'profile_pics/default.jpg'):
-                    try:
-                        instance.profile_picture.delete(save=False)
-                    except:
-                        pass  # Ignore if file doesn't exist
-                
-                instance.profile_picture = profile_picture
-            elif profile_picture is None:
-                # User wants to remove profile picture
-                if (instance.profile_picture and 
-                    instance.profile_picture.name != 'profile_pics/default.jpg'):
+        # Handle profile picture separately; its files' reference counts
+        # change in the same transaction as the user row
+        with transaction.atomic():
+            if 'profile_picture' in validated_data:
+                profile_picture = validated_data['profile_picture']
+                if profile_picture:
+                    # Replaces the old picture (unless it is the default) and makes resized copies
                     try:
-                        instance.profile_picture.delete(save=False)
-                    except:
-                        pass
-                instance.profile_picture = 'profile_pics/default.jpg'
-        
-        instance.save()
+                        set_profile_picture(instance, profile_picture)
+                    except InvalidImage:
+                        raise serializers.ValidationError({'profile_picture': ["Upload a valid image."]})
+                elif profile_picture is None:
+                    # User wants to remove profile picture
+                    clear_profile_picture(instance, default=DEFAULT_PICTURE)
+
+            instance.save()
         return instance
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -136,25 +143,15 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     
     def validate(self, attrs):
         username_or_email = attrs.get("username") or attrs.get("email")
-        password = attrs.get("password")
-        
-        user = None
-        if "@" in username_or_email:  # login with email
-            try:
-                user_obj = CustomUser.objects.get(email=username_or_email)
-                user = authenticate(username=user_obj.username, password=password)
-            except CustomUser.DoesNotExist:
-                user = None
-        else:  # login with username
-            user = authenticate(username=username_or_email, password=password)
-        
+        user = verify_credentials(username_or_email, attrs.get("password"), self.context.get("request"))
         if not user:
             raise serializers.ValidationError("Invalid credentials")
-        
-        attrs["username"] = user.username  # force username for JWT
-        return super().validate(attrs)
+
+        # Already authenticated; skip super().validate(), which would hash the password again
+        self.user = user
+        return issue_tokens(user, self.token_class)
     
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ['username', 'email', 'password', 'birthday', 'profile_picture']  # include yours
@@ -1,3 +1,777 @@
-from django.test import TestCase
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from LandingPage import metrics
+from LandingPage.storage import ContentAddressedStorage, is_content_addressed
+
+from . import avatars, email_utils, outbox
+from .models import OTP_LIFETIME, CustomUser, EmailOutbox, MediaFile, OTPIssuance, UserOTP
+from .otp_backends import (
+    CacheOTPBackend, DatabaseOTPBackend, OTPLocked, OTPMismatch, OTPNotFound, audit_trail,
+)
+from .outbox import LocMemProvider
+from .throttling import TokenBucketThrottle
+
+
+class ProfileConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='alice', email='alice@example.com', password='Passw0rd!x'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unchanged_profile_returns_304(self):
+        etag = self.client.get('/api/accounts/profile/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/accounts/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_profile_edit_changes_etag(self):
+        etag = self.client.get('/api/accounts/profile/')['ETag']
+        self.client.patch('/api/accounts/profile/', {'first_name': 'Alice'})
+        response = self.client.get('/api/accounts/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['first_name'], 'Alice')
+
+
+class CredentialTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='fay', email='fay@example.com', password='Passw0rd!x')
+        self.client = APIClient()
+
+    def hashes(self):
+        return mock.patch.object(
+            PBKDF2PasswordHasher, 'encode', autospec=True, side_effect=PBKDF2PasswordHasher.encode
+        )
+
+    def test_login_hashes_once_in_one_query(self):
+        for username in ('fay', 'fay@example.com'):
+            with self.hashes() as encode, self.assertNumQueries(1):
+                response = self.client.post('/api/accounts/token/', {'username': username, 'password': 'Passw0rd!x'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(response.data), {'access', 'refresh'})
+            self.assertEqual(encode.call_count, 1)
+
+    def test_rejects_bad_credentials_at_the_same_cost(self):
+        for username, password in [('fay', 'wrong'), ('nobody', 'Passw0rd!x'), ('nobody@example.com', 'x')]:
+            with self.hashes() as encode:
+                response = self.client.post('/api/accounts/token/', {'username': username, 'password': password})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(encode.call_count, 1)
+
+    def test_inactive_user_cannot_log_in(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post('/api/accounts/token/', {'username': 'fay', 'password': 'Passw0rd!x'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(EMAIL_OUTBOX_PROVIDER='accounts.outbox.LocMemProvider')
+    def test_request_otp_hashes_once(self):
+        with self.hashes() as encode:
+            response = self.client.post(
+                '/api/accounts/request-otp/',
+                {'username_or_email': 'fay@example.com', 'password': 'Passw0rd!x', 'purpose': 'signup'},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(encode.call_count, 1)
+
+
+class OTPMetricsTests(TestCase):
+    def test_counts_generated_and_verified_codes(self):
+        user = CustomUser.objects.create_user(username='bob', email='bob@example.com', password='Passw0rd!x')
+        generated = metrics.OTP_GENERATED.values.get(('signup',), 0)
+        verified = dict(metrics.OTP_VERIFICATIONS.values)
+
+        otp = UserOTP.generate_otp(user, purpose='signup')
+        otp.verify('not-it')
+        otp.verify(otp.otp_code)
+        otp.verify(otp.otp_code)
+
+        self.assertEqual(metrics.OTP_GENERATED.values[('signup',)], generated + 1)
+        for result in ('mismatch', 'success', 'invalid'):
+            key = ('signup', result)
+            self.assertEqual(metrics.OTP_VERIFICATIONS.values[key], verified.get(key, 0) + 1)
+
+
+class OTPBackendTestsMixin:
+    backend_class = None
+
+    def setUp(self):
+        self.backend = self.backend_class()
+        self.user = CustomUser.objects.create_user(username='dave', email='dave@example.com', password='Passw0rd!x')
+
+    def test_code_works_once(self):
+        otp = self.backend.issue(self.user, 'login')
+        self.backend.verify(self.user, 'login', otp.code)
+        with self.assertRaises(OTPNotFound):
+            self.backend.verify(self.user, 'login', otp.code)
+
+    def test_new_code_replaces_old_one(self):
+        first = self.backend.issue(self.user, 'login')
+        second = self.backend.issue(self.user, 'login')
+        if first.code != second.code:
+            with self.assertRaises(OTPMismatch):
+                self.backend.verify(self.user, 'login', first.code)
+        self.backend.verify(self.user, 'login', second.code)
+
+    def test_code_expires(self):
+        otp = self.backend.issue(self.user, 'signup')
+        later = timezone.now() + OTP_LIFETIME + timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=later), self.assertRaises(OTPNotFound):
+            self.backend.verify(self.user, 'signup', otp.code)
+
+    def test_locks_after_too_many_wrong_codes(self):
+        otp = self.backend.issue(self.user, 'login')
+        wrong = '000000' if otp.code != '000000' else '111111'
+        remaining = []
+        for _ in range(5):
+            with self.assertRaises(OTPMismatch) as caught:
+                self.backend.verify(self.user, 'login', wrong)
+            remaining.append(caught.exception.remaining_attempts)
+        self.assertEqual(remaining, [4, 3, 2, 1, 0])
+        with self.assertRaises(OTPLocked):
+            self.backend.verify(self.user, 'login', otp.code)
+
+    def test_verify_endpoint_reports_errors(self):
+        otp = self.backend.issue(self.user, 'login')
+        with mock.patch('accounts.otp_serializers.get_backend', return_value=self.backend):
+            response = APIClient().post(
+                '/api/accounts/verify-otp/',
+                {'username_or_email': 'dave', 'otp_code': '123456' if otp.code != '123456' else '654321'},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid OTP code. 4 attempts remaining.', str(response.data['details']))
+
+    @override_settings(OTP_AUDIT=True, OTP_AUDIT_FLUSH_INTERVAL=0)
+    def test_audit_records_issuance_without_the_code(self):
+        otp = self.backend.issue(self.user, 'login', ip_address='10.0.0.1')
+        issuance = OTPIssuance.objects.get(user=self.user)
+        self.assertEqual(issuance.backend, self.backend.name)
+        self.assertEqual(issuance.ip_address, '10.0.0.1')
+        self.assertEqual(issuance.expires_at, otp.expires_at)
+
+
+class DatabaseOTPBackendTests(OTPBackendTestsMixin, TestCase):
+    backend_class = DatabaseOTPBackend
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'otp-tests'}})
+class CacheOTPBackendTests(OTPBackendTestsMixin, TestCase):
+    backend_class = CacheOTPBackend
+
+    def setUp(self):
+        super().setUp()
+        self.backend.cache.clear()
+
+    def test_stores_no_rows_or_plain_codes(self):
+        otp = self.backend.issue(self.user, 'login')
+        self.assertFalse(UserOTP.objects.exists())
+        self.assertNotIn(otp.code, str(self.backend.cache.get(f'otp:{self.user.pk}:login')))
+
+    @override_settings(
+        OTP_BACKEND='accounts.otp_backends.CacheOTPBackend',
+        EMAIL_OUTBOX_PROVIDER='accounts.outbox.LocMemProvider',
+    )
+    def test_outbox_never_holds_the_code(self):
+        LocMemProvider.outbox.clear()
+        response = APIClient().post(
+            '/api/accounts/request-otp/', {'username_or_email': 'dave', 'password': 'Passw0rd!x'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        queued = EmailOutbox.objects.get().payload
+        outbox.deliver_due()
+        code = LocMemProvider.outbox[0]['otp_code']
+        self.assertEqual(len(code), 6)
+        self.assertNotIn(code, json.dumps(queued))
+        self.assertNotIn(code, json.dumps(EmailOutbox.objects.get().payload))
+
+        # The code was sent, and is usable, but its mail copy is gone
+        self.assertIsNone(outbox.otp_code(EmailOutbox.objects.get()))
+        self.backend.verify(self.user, 'login', code)
+
+    def test_buffered_audit_is_written_on_flush(self):
+        with self.settings(OTP_AUDIT=True, OTP_AUDIT_FLUSH_INTERVAL=3600):
+            self.backend.issue(self.user, 'login')
+            self.backend.issue(self.user, 'signup')
+            self.assertFalse(OTPIssuance.objects.exists())
+            audit_trail.flush()
+        self.assertEqual(sorted(OTPIssuance.objects.values_list('purpose', flat=True)), ['login', 'signup'])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'throttle-tests'}},
+    EMAIL_OUTBOX_PROVIDER='accounts.outbox.LocMemProvider',
+)
+class AuthThrottleTests(TestCase):
+    def setUp(self):
+        TokenBucketThrottle().cache.clear()
+        self.user = CustomUser.objects.create_user(username='erin', email='erin@example.com', password='Passw0rd!x')
+        self.client = APIClient()
+
+    def request_otp(self, ip='10.0.0.1'):
+        return self.client.post(
+            '/api/accounts/request-otp/', {'username_or_email': 'erin', 'password': 'Passw0rd!x'},
+            format='json', REMOTE_ADDR=ip,
+        )
+
+    @override_settings(AUTH_THROTTLES={'otp_request': {'account': '2/min'}})
+    def test_rejects_before_checking_password(self):
+        self.assertEqual(self.request_otp().status_code, 200)
+        self.assertEqual(self.request_otp(ip='10.0.0.2').status_code, 200)
+        with mock.patch.object(CustomUser, 'check_password') as check_password:
+            response = self.request_otp(ip='10.0.0.3')
+        self.assertEqual(response.status_code, 429)
+        # One token per 30s, less the time the first two requests took
+        self.assertIn(int(response['Retry-After']), range(25, 31))
+        check_password.assert_not_called()
+        self.assertEqual(UserOTP.objects.count(), 2)
+
+    @override_settings(AUTH_THROTTLES={'login': {'ip': '1/min'}})
+    def test_limits_per_ip(self):
+        login = {'username': 'erin', 'password': 'Passw0rd!x'}
+        self.assertEqual(self.client.post('/api/accounts/token/', login, REMOTE_ADDR='10.0.0.1').status_code, 200)
+        self.assertEqual(self.client.post('/api/accounts/token/', login, REMOTE_ADDR='10.0.0.1').status_code, 429)
+        self.assertEqual(self.client.post('/api/accounts/token/', login, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    @override_settings(AUTH_THROTTLES={'register': {'ip': '2/hour'}})
+    def test_forwarded_for_cannot_dodge_the_ip_limit(self):
+        statuses = [
+            self.client.post('/api/accounts/register/', {}, REMOTE_ADDR='10.0.0.1',
+                             HTTP_X_FORWARDED_FOR=f'192.0.2.{n}').status_code
+            for n in range(3)
+        ]
+        self.assertEqual(statuses, [400, 400, 429])
+
+    @override_settings(AUTH_THROTTLES={'register': {'ip': '2/hour'}})
+    def test_uses_the_address_added_by_a_trusted_proxy(self):
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            statuses = [
+                self.client.post('/api/accounts/register/', {}, REMOTE_ADDR='10.0.0.1',
+                                 HTTP_X_FORWARDED_FOR=f'192.0.2.{n}, 198.51.100.7').status_code
+                for n in range(3)
+            ]
+            other = self.client.post('/api/accounts/register/', {}, REMOTE_ADDR='10.0.0.1',
+                                     HTTP_X_FORWARDED_FOR='198.51.100.8').status_code
+        self.assertEqual(statuses, [400, 400, 429])
+        self.assertEqual(other, 400)
+
+    def test_bucket_refills_over_time(self):
+        throttle = TokenBucketThrottle()
+        with mock.patch('accounts.throttling.time.time', return_value=1000.0) as now:
+            self.assertIsNone(throttle.take('bucket', 3, 60))
+            self.assertIsNone(throttle.take('bucket', 3, 60))
+            self.assertIsNone(throttle.take('bucket', 3, 60))
+            self.assertEqual(throttle.take('bucket', 3, 60), 20)
+            # A rejected request costs nothing
+            self.assertEqual(throttle.take('bucket', 3, 60), 20)
+            now.return_value = 1020.0
+            self.assertIsNone(throttle.take('bucket', 3, 60))
+            self.assertEqual(throttle.take('bucket', 3, 60), 20)
+
+
+@override_settings(EMAIL_OUTBOX_PROVIDER='accounts.outbox.LocMemProvider')
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        LocMemProvider.outbox.clear()
+        self.user = CustomUser.objects.create_user(
+            username='carol', email='carol@example.com', password='Passw0rd!x'
+        )
+        self.client = APIClient()
+
+    def test_request_otp_queues_email_without_sending(self):
+        with mock.patch('accounts.outbox.SendGridProvider.send_many') as send:
+            response = self.client.post(
+                '/api/accounts/request-otp/', {'username_or_email': 'carol', 'password': 'Passw0rd!x'},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        send.assert_not_called()
+        email = EmailOutbox.objects.get()
+        otp = UserOTP.objects.get(user=self.user)
+        self.assertEqual(email.status, EmailOutbox.PENDING)
+        self.assertEqual(email.payload, {'otp_code': otp.otp_code, 'purpose': 'login'})
+        self.assertEqual(email.expires_at, otp.expires_at)
+
+    def test_worker_delivers_queued_emails(self):
+        otp = UserOTP.generate_otp(self.user)
+        outbox.enqueue('otp', self.user, expires_at=otp.expires_at, otp_code=otp.otp_code, purpose='login')
+        call_command('send_emails', once=True, stdout=StringIO())
+
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.status, EmailOutbox.SENT)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(LocMemProvider.outbox, [
+            {'kind': 'otp', 'to': 'carol@example.com', 'otp_code': otp.otp_code, 'purpose': 'login'},
+        ])
+        self.assertEqual(email.payload, {'otp_code': '', 'purpose': 'login'})
+
+    def test_failures_back_off_then_give_up(self):
+        email = outbox.enqueue('notification', self.user, purpose='login')
+        with self.settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2), \
+                mock.patch.object(LocMemProvider, 'send_many', side_effect=ConnectionError('down')):
+            self.assertEqual(outbox.deliver_due(), {'sent': 0, 'retry': 1, 'failed': 0})
+            email.refresh_from_db()
+            self.assertGreater(email.next_attempt_at, timezone.now())
+            # Not due yet
+            self.assertEqual(outbox.deliver_due(), {'sent': 0, 'retry': 0, 'failed': 0})
+
+            EmailOutbox.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(outbox.deliver_due(), {'sent': 0, 'retry': 0, 'failed': 1})
+        email.refresh_from_db()
+        self.assertEqual(email.status, EmailOutbox.FAILED)
+        self.assertEqual(email.last_error, 'ConnectionError: down')
+
+    def test_expired_otp_emails_are_dropped(self):
+        outbox.enqueue(
+            'otp', self.user, expires_at=timezone.now() - timedelta(seconds=1), otp_code='123456', purpose='login'
+        )
+        self.assertEqual(outbox.deliver_due(), {'sent': 0, 'retry': 0, 'failed': 1})
+        self.assertEqual(LocMemProvider.outbox, [])
+        self.assertEqual(EmailOutbox.objects.get().payload['otp_code'], '')
+
+    def test_purge_removes_finished_otp_rows(self):
+        failed_notification = outbox.enqueue('notification', self.user, purpose='login')
+        failed_otp = outbox.enqueue('otp', self.user, otp_code='', purpose='login')
+        EmailOutbox.objects.filter(pk__in=[failed_notification.pk, failed_otp.pk]).update(status=EmailOutbox.FAILED)
+        outbox.enqueue('otp', self.user, expires_at=timezone.now() - timedelta(seconds=1), otp_code='222222')
+        live = outbox.enqueue('otp', self.user, expires_at=timezone.now() + timedelta(minutes=5), otp_code='333333')
+
+        self.assertEqual(outbox.purge_sent(7), 2)
+        self.assertEqual(
+            set(EmailOutbox.objects.values_list('pk', flat=True)), {failed_notification.pk, live.pk}
+        )
+
+    def test_rolled_back_otp_leaves_no_email(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            UserOTP.generate_otp(self.user)
+            outbox.enqueue('otp', self.user, otp_code='123456', purpose='login')
+            raise RuntimeError
+        self.assertFalse(EmailOutbox.objects.exists())
+
+
+class _MailSendHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.server.requests.append((self.client_address, json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+        if getattr(self.server, 'drop_responses', False):
+            # Read the mail but close before answering
+            self.close_connection = True
+            return
+        self.send_response(202)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class EmailTemplateTests(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser(username='dana', email='dana@example.com'),
+            CustomUser(username='eli', email='eli@example.com'),
+        ]
+
+    def test_payload_personalizes_one_rendering_per_recipient(self):
+        payload = email_utils.build_payload('otp', 'signup', [(self.users[0], '111111'), (self.users[1], '222222')])
+        self.assertEqual(len(payload['personalizations']), 2)
+        self.assertEqual(payload['personalizations'][1]['to'], [{'email': 'eli@example.com'}])
+        substitutions = payload['personalizations'][0]['substitutions']
+        subject = email_utils.personalize(payload['subject'], self.users[0], '111111')
+        self.assertEqual(subject, 'Welcome to VeriFeed - Verification Code: 111111')
+        html = payload['content'][1]['value']
+        self.assertEqual(substitutions, {email_utils.USERNAME: 'dana', email_utils.OTP_CODE: '111111'})
+        self.assertIn('Welcome dana!', email_utils.personalize(html, self.users[0], '111111'))
+        self.assertIn('>111111<', email_utils.personalize(html, self.users[0], '111111'))
+
+    def test_templates_render_once_per_kind_and_purpose(self):
+        email_utils.render_email.cache_clear()
+        with mock.patch('accounts.email_utils.get_template', wraps=email_utils.get_template) as get_template:
+            for _ in range(3):
+                email_utils.success_message(self.users[0], 'login')
+        self.assertEqual(get_template.call_count, 2)
+        text = email_utils.render_email('notification', 'login')[1]
+        self.assertIn('Your account was successfully accessed.', text)
+
+    def start_server(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _MailSendHandler)
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, email_utils.SendGridClient('key', base_url=f'http://127.0.0.1:{server.server_port}')
+
+    def test_client_reuses_one_connection(self):
+        server, client = self.start_server()
+        for user in self.users:
+            self.assertEqual(client.send(email_utils.success_message(user)), 202)
+        client.close()
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(server.requests[0][0], server.requests[1][0])
+
+    def test_client_resends_only_unsent_requests(self):
+        server, client = self.start_server()
+        client.send(email_utils.success_message(self.users[0]))
+        # Writing to a connection the server already closed
+        with mock.patch.object(client._local.connection, 'request', side_effect=BrokenPipeError):
+            self.assertEqual(client.send(email_utils.success_message(self.users[1])), 202)
+        self.assertEqual(len(server.requests), 2)
+        self.assertNotEqual(server.requests[0][0], server.requests[1][0])
+
+        # Sent, but no response: the mail may have gone out, so no resend
+        server.drop_responses = True
+        with self.assertRaises(http.client.RemoteDisconnected):
+            client.send(email_utils.success_message(self.users[0]))
+        self.assertEqual(len(server.requests), 3)
+        client.close()
+
+    @override_settings(EMAIL_OUTBOX_PROVIDER='accounts.outbox.SendGridProvider')
+    def test_outbox_sends_a_group_in_one_call(self):
+        for user in self.users:
+            user.save()
+            outbox.enqueue('otp', user, otp_code='123456', purpose='login')
+        outbox.enqueue('notification', self.users[0], purpose='login')
+        with mock.patch('accounts.email_utils.deliver') as deliver:
+            self.assertEqual(outbox.deliver_due(), {'sent': 3, 'retry': 0, 'failed': 0})
+        self.assertEqual(deliver.call_count, 2)
+        sizes = sorted(len(call.args[0]['personalizations']) for call in deliver.call_args_list)
+        self.assertEqual(sizes, [1, 2])
+
+
+def image_file(name='photo.jpg', size=(600, 300), orientation=None, fmt='JPEG'):
+    """Left half red, right half blue"""
+    image = Image.new('RGB', size, 'blue')
+    image.paste('red', (0, 0, size[0] // 2, size[1]))
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, fmt, exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class AvatarTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root))
+        self.user = CustomUser.objects.create_user(username='gil', email='gil@example.com', password='Passw0rd!x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def variant_url(self, size, fmt):
+        return self.user.profile_picture.storage.url(self.user.profile_picture_variants[str(size)][fmt])
+
+    def open_variant(self, size, fmt):
+        self.user.refresh_from_db()
+        return Image.open(self.user.profile_picture.storage.open(self.user.profile_picture_variants[str(size)][fmt]))
+
+    def test_upload_makes_upright_square_variants(self):
+        # Orientation 6: the stored left edge is the top of the photo
+        response = self.client.post(
+            '/api/accounts/upload-profile-picture/', {'profile_picture': image_file(orientation=6)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(response.data['profile_picture_url'].endswith(self.variant_url(256, 'webp')))
+        for size in avatars.AVATAR_SIZES:
+            for fmt, pil_format in [('webp', 'WEBP'), ('jpeg', 'JPEG')]:
+                image = self.open_variant(size, fmt)
+                self.assertEqual((image.format, image.size), (pil_format, (size, size)))
+        image = self.open_variant(256, 'jpeg').convert('RGB')
+        red, blue = image.getpixel((10, 10)), image.getpixel((10, 245))
+        self.assertGreater(red[0], 200)
+        self.assertGreater(blue[2], 200)
+
+    def test_review_lists_use_thumbnails(self):
+        avatars.set_profile_picture(self.user, image_file())
+        self.user.save()
+        self.assertEqual(avatars.avatar_url(self.user, 96), self.variant_url(96, 'webp'))
+        self.assertEqual(avatars.avatar_url(self.user, 50, fmt='jpeg'), self.variant_url(96, 'jpeg'))
+        self.assertEqual(avatars.avatar_url(self.user, 1000), self.variant_url(256, 'webp'))
+
+        from reviews.serializers import ReviewUserSerializer
+        self.assertEqual(ReviewUserSerializer(self.user).data['profile_picture'], self.variant_url(96, 'webp'))
+
+    def test_rejects_unreadable_image_and_keeps_the_old_one(self):
+        avatars.set_profile_picture(self.user, image_file())
+        self.user.save()
+        before = self.user.profile_picture.name
+        upload = SimpleUploadedFile('fake.png', b'not an image', content_type='image/png')
+        response = self.client.post('/api/accounts/upload-profile-picture/', {'profile_picture': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture.name, before)
+        self.assertTrue(self.user.profile_picture.storage.exists(before))
+
+    def test_remove_deletes_variants(self):
+        avatars.set_profile_picture(self.user, image_file())
+        self.user.save()
+        names = [name for formats in self.user.profile_picture_variants.values() for name in formats.values()]
+        # Files go once the transaction that dropped the last reference commits
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete('/api/accounts/remove-profile-picture/')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture.name, avatars.DEFAULT_PICTURE)
+        self.assertEqual(self.user.profile_picture_variants, {})
+        self.assertFalse(any(self.user.profile_picture.storage.exists(name) for name in names))
+
+    def test_removed_picture_is_replaced_by_sized_default(self):
+        storage = self.user.profile_picture.storage
+        os.makedirs(os.path.dirname(storage.path(avatars.DEFAULT_PICTURE)))
+        with open(storage.path(avatars.DEFAULT_PICTURE), 'wb') as f:
+            f.write(image_file().read())
+        avatars.write_default_variants(storage)
+        avatars.set_profile_picture(self.user, image_file())
+        self.user.save()
+
+        response = self.client.delete('/api/accounts/remove-profile-picture/')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(avatars.avatar_url(self.user, 96), storage.url('profile_pics/variants/default_96.webp'))
+        self.assertEqual(avatars.avatar_url(self.user, 96, fmt='jpeg'), storage.url('profile_pics/variants/default_96.jpg'))
+
+    def test_failed_save_undoes_reference_counts(self):
+        avatars.set_profile_picture(self.user, image_file())
+        self.user.save()
+        counts = dict(MediaFile.objects.values_list('name', 'refcount'))
+
+        with mock.patch.object(CustomUser, 'save', side_effect=DatabaseError):
+            response = self.client.post(
+                '/api/accounts/upload-profile-picture/', {'profile_picture': image_file('new.png', fmt='PNG')},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(dict(MediaFile.objects.values_list('name', 'refcount')), counts)
+
+    def test_backfill_command(self):
+        storage = self.user.profile_picture.storage
+        # The default picture keeps its fixed name
+        os.makedirs(os.path.dirname(storage.path(avatars.DEFAULT_PICTURE)))
+        with open(storage.path(avatars.DEFAULT_PICTURE), 'wb') as f:
+            f.write(image_file().read())
+        CustomUser.objects.create_user(username='hal', email='hal@example.com', password='Passw0rd!x')
+        self.user.profile_picture.save('old.png', image_file('old.png', fmt='PNG'))
+        CustomUser.objects.create_user(username='ida', email='ida@example.com', password='Passw0rd!x',
+                                       profile_picture='profile_pics/missing.jpg')
+
+        hal = CustomUser.objects.get(username='hal')
+        self.assertEqual(avatars.avatar_url(hal, 48), storage.url(avatars.DEFAULT_PICTURE))
+
+        out = StringIO()
+        call_command('generate_avatars', stdout=out)
+        # The default picture and gil's; hal is served the default's variants
+        self.assertIn('Resized 2 pictures for 1 users (1 skipped', out.getvalue())
+        hal.refresh_from_db()
+        self.assertEqual(hal.profile_picture_variants, {})
+        self.assertEqual(avatars.avatar_url(hal, 48), storage.url('profile_pics/variants/default_48.webp'))
+        self.assertEqual(Image.open(storage.open('profile_pics/variants/default_48.webp')).size, (48, 48))
+        self.assertEqual(self.open_variant(48, 'webp').size, (48, 48))
+
+        out = StringIO()
+        call_command('generate_avatars', stdout=out)
+        self.assertIn('Resized 0 pictures for 0 users (1 skipped', out.getvalue())
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root))
+        self.storage = ContentAddressedStorage()
+
+    def test_identical_files_are_stored_once_and_counted(self):
+        first = self.storage.save('profile_pics/a.png', ContentFile(b'same bytes'))
+        second = self.storage.save('profile_pics/b.PNG', ContentFile(b'same bytes'))
+        self.assertEqual(first, second)
+        self.assertTrue(is_content_addressed(first))
+        self.assertTrue(first.startswith('profile_pics/') and first.endswith('.png'))
+        self.assertEqual(os.listdir(self.storage.path('profile_pics')), [os.path.basename(first)])
+        self.assertEqual(MediaFile.objects.get(name=first).refcount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(first)
+        self.assertTrue(self.storage.exists(first))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(first)
+        self.assertFalse(self.storage.exists(first))
+        self.assertEqual(MediaFile.objects.get(name=first).refcount, 0)
+
+        # Saving the bytes again brings the file back
+        self.assertEqual(self.storage.save('profile_pics/c.png', ContentFile(b'same bytes')), first)
+        self.assertTrue(self.storage.exists(first))
+
+    def test_uncounted_hashed_file_is_kept(self):
+        name = self.storage.save('profile_pics/a.png', ContentFile(b'bytes'))
+        MediaFile.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+
+    def test_rolled_back_delete_keeps_the_file(self):
+        name = self.storage.save('profile_pics/a.png', ContentFile(b'bytes'))
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError), transaction.atomic():
+            self.storage.delete(name)
+            raise RuntimeError
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(MediaFile.objects.get(name=name).refcount, 1)
+
+    def test_removing_a_shared_picture_keeps_it_for_others(self):
+        users = [
+            CustomUser.objects.create_user(username=name, email=f'{name}@example.com', password='Passw0rd!x')
+            for name in ('jan', 'kim')
+        ]
+        client = APIClient()
+        for user in users:
+            client.force_authenticate(user)
+            response = client.post(
+                '/api/accounts/upload-profile-picture/', {'profile_picture': image_file()}, format='multipart'
+            )
+            self.assertEqual(response.status_code, 200)
+        for user in users:
+            user.refresh_from_db()
+        self.assertEqual(users[0].profile_picture.name, users[1].profile_picture.name)
+
+        client.force_authenticate(users[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete('/api/accounts/remove-profile-picture/')
+        self.assertTrue(self.storage.exists(users[1].profile_picture.name))
+        self.assertTrue(self.storage.exists(users[1].profile_picture_variants['48']['webp']))
+
+    def test_hashed_media_is_served_immutable(self):
+        name = self.storage.save('profile_pics/a.png', ContentFile(b'bytes'))
+        with open(self.storage.path('profile_pics/default.jpg'), 'wb') as f:
+            f.write(b'default')
+        response = self.client.get(f'/media/{name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        response = self.client.get('/media/profile_pics/default.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=3600', response['Cache-Control'])
+
+    def test_dedupe_command_merges_legacy_copies(self):
+        data = image_file().read()
+        legacy = FileSystemStorage(location=self.storage.location)
+        names = [legacy.save('profile_pics/shot.png', ContentFile(data)) for _ in range(3)]
+        self.assertEqual(len(set(names)), 3)
+        for i, name in enumerate(names):
+            CustomUser.objects.create_user(
+                username=f'user{i}', email=f'user{i}@example.com', password='Passw0rd!x', profile_picture=name
+            )
+
+        out = StringIO()
+        call_command('dedupe_media', stdout=out)
+        self.assertIn('Moved 3 files into 1 for 3 users', out.getvalue())
+        stored = set(CustomUser.objects.values_list('profile_picture', flat=True))
+        self.assertEqual(len(stored), 1)
+        name = stored.pop()
+        self.assertTrue(is_content_addressed(name))
+        self.assertEqual(MediaFile.objects.get(name=name).refcount, 3)
+        self.assertFalse(any(legacy.exists(old) for old in names))
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root))
+        self.name = ContentAddressedStorage().save('videos/clip.mp4', ContentFile(bytes(range(256)) * 4))
+        self.url = f'/media/{self.name}'
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Content-Length'], '1024')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.content(response), bytes(range(256)) * 4)
+        response.close()
+
+    def test_byte_ranges(self):
+        for header, status, content_range, body in [
+            ('bytes=0-9', 206, 'bytes 0-9/1024', bytes(range(10))),
+            ('bytes=1020-', 206, 'bytes 1020-1023/1024', bytes(range(252, 256))),
+            ('bytes=-3', 206, 'bytes 1021-1023/1024', bytes(range(253, 256))),
+            ('bytes=1000-5000', 206, 'bytes 1000-1023/1024', bytes(range(232, 256))),
+        ]:
+            with self.subTest(header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(response['Content-Length'], str(len(body)))
+                self.assertEqual(self.content(response), body)
+                response.close()
+
+    def test_unsatisfiable_and_ignored_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+        for header in ('bytes=0-1,5-9', 'lines=1-2'):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200)
+            response.close()
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response.close()
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_conditional_requests(self):
+        response = self.client.get(self.url)
+        response.close()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get('/media/videos/missing.mp4').status_code, 404)
+        self.assertEqual(self.client.get('/media/videos').status_code, 404)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    def test_proxy_modes_send_no_body(self):
+        with self.settings(MEDIA_SERVE_MODE='accel', MEDIA_ACCEL_LOCATION='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response.content, b'')
+
+        with self.settings(MEDIA_SERVE_MODE='sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], ContentAddressedStorage().path(self.name))
+        self.assertEqual(response.content, b'')
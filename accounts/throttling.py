@@ -0,0 +1,126 @@
+"""
+Token-bucket throttles for the unauthenticated account endpoints.
+
+Registration, token login and OTP requests each hash a password or queue an
+email, so they are rate limited per client IP and per account (the username
+or email in the request body). AUTH_THROTTLES maps each endpoint's scope to
+its limits, e.g. {'login': {'ip': '30/min', 'account': '10/min'}}. A rate
+of 'N/period' is a bucket holding N requests that refills at N per period:
+bursts of up to N are allowed, then requests are spaced out. A scope or key
+type left out of AUTH_THROTTLES is not limited.
+
+DRF runs throttles before the view, so a rejected request never reaches the
+serializer. It gets a 429 with Retry-After.
+
+The client IP is DRF's `get_ident`: REMOTE_ADDR, or with
+REST_FRAMEWORK['NUM_PROXIES'] set, the X-Forwarded-For entry added by the
+outermost trusted proxy. Entries a client adds itself are never used.
+
+Buckets live in the AUTH_THROTTLE_CACHE cache, which must be shared by all
+workers for the limits to hold across them (set CACHE_URL). Each bucket is
+a single integer key holding the time at which it will be full again, in
+ms (the "theoretical arrival time" of GCRA, an equivalent form of the token
+bucket). A request atomically adds one request's worth of time with incr,
+and takes it back with decr if that overshoots the burst allowance. The key
+expires when the bucket is full, which stands in for max(TAT, now).
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from LandingPage import metrics
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Request fields naming the account a request is about, in order of preference
+ACCOUNT_FIELDS = ('username_or_email', 'username', 'email')
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60): bucket size and the seconds it takes to refill"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+
+    def __init__(self):
+        self.retry_after = None
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'AUTH_THROTTLE_CACHE', 'default')]
+
+    def get_rates(self):
+        return getattr(settings, 'AUTH_THROTTLES', {}).get(self.scope, {})
+
+    def get_account(self, request):
+        for field in ACCOUNT_FIELDS:
+            value = request.data.get(field)
+            if isinstance(value, str) and value.strip():
+                return value.strip().lower()
+        return None
+
+    def get_idents(self, request):
+        """(key type, identifier) pairs to charge the request to"""
+        rates = self.get_rates()
+        if 'ip' in rates:
+            yield 'ip', self.get_ident(request)
+        if 'account' in rates:
+            account = self.get_account(request)
+            if account:
+                yield 'account', account
+
+    def allow_request(self, request, view):
+        rates = self.get_rates()
+        for kind, ident in self.get_idents(request):
+            key = f'throttle:{self.scope}:{kind}:{hashlib.md5(ident.encode("utf-8")).hexdigest()}'
+            wait = self.take(key, *parse_rate(rates[kind]))
+            if wait is not None:
+                metrics.THROTTLED.inc(scope=self.scope, key=kind)
+                self.retry_after = wait
+                return False
+        return True
+
+    def take(self, key, capacity, period):
+        """Spend a token from bucket `key`; returns None, or seconds until one is available"""
+        interval = period * 1000 // capacity
+        now = int(time.time() * 1000)
+        try:
+            tat = self.cache.incr(key, interval)
+        except ValueError:
+            # Missing key: the bucket is full
+            if self.cache.add(key, now + interval, timeout=math.ceil(interval / 1000)):
+                return None
+            tat = self.cache.incr(key, interval)
+
+        overshoot = tat - now - capacity * interval
+        if overshoot > 0:
+            self.cache.decr(key, interval)
+            return max(math.ceil(overshoot / 1000), 1)
+        self.cache.touch(key, timeout=math.ceil((tat - now) / 1000))
+        return None
+
+    def wait(self):
+        return self.retry_after
+
+
+class RegisterThrottle(TokenBucketThrottle):
+    scope = 'register'
+
+
+class LoginThrottle(TokenBucketThrottle):
+    scope = 'login'
+
+
+class OTPRequestThrottle(TokenBucketThrottle):
+    scope = 'otp_request'
+
+
+class OTPResendThrottle(TokenBucketThrottle):
+    scope = 'otp_resend'
@@ -1,22 +1,29 @@
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes, parser_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes, throttle_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
 from .serializers import UserProfileSerializer, UserSerializer, MyTokenObtainPairSerializer
+from .avatars import (
+    DEFAULT_PICTURE, PROFILE_AVATAR_SIZE, InvalidImage, avatar_url, clear_profile_picture, set_profile_picture,
+)
 from .models import CustomUser
+from .throttling import LoginThrottle, RegisterThrottle
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 import logging
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from LandingPage.conditional import conditional_view, make_etag
 
 logger = logging.getLogger(__name__)
 
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
+    throttle_classes = [LoginThrottle]
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RegisterThrottle])
 @parser_classes([MultiPartParser, FormParser])
 def register_user(request):
     logger.info(f"Registration attempt with data keys: {list(request.data.keys())}")
@@ -31,9 +38,7 @@ def register_user(request):
             refresh = RefreshToken.for_user(user)
             
             # Get profile picture URL
-            profile_picture_url = None
-            if user.profile_picture:
-                profile_picture_url = request.build_absolute_uri(user.profile_picture.url)
+            profile_picture_url = avatar_url(user, PROFILE_AVATAR_SIZE, request)
             
             response_data = {
                 'message': 'User registered successfully.',
@@ -89,9 +94,19 @@ def register_user(request):
         status=status.HTTP_400_BAD_REQUEST
     )
 
+def profile_validators(request):
+    """Profile version from the already-loaded user row; no extra queries"""
+    user = request.user
+    return make_etag(
+        'profile', user.pk, user.username, user.email, user.first_name,
+        user.last_name, user.profile_picture.name if user.profile_picture else '',
+        sorted(user.profile_picture_variants),
+    ), None
+
 @api_view(['GET', 'PUT', 'PATCH'])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser])
+@conditional_view(profile_validators, vary=['Authorization'])
 def profile_view(request):
     user = request.user
     
@@ -166,21 +181,14 @@ def upload_profile_picture(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        # Delete old profile picture if exists and not default
-        if (user.profile_picture and 
-            user.profile_picture.name != 'profile_pics/default.jpg'):
-            try:
-                # Delete the old file from storage
-                user.profile_picture.delete(save=False)
-            except Exception as e:
-                logger.warning(f"Failed to delete old profile picture: {e}")
-
-        # Save new profile picture
-        user.profile_picture = profile_picture
-        user.save()
-
-        # Build absolute URL for the new profile picture
-        profile_picture_url = request.build_absolute_uri(user.profile_picture.url)
+        # Replace the old picture (unless it is the default) with this one
+        # and its resized copies. The files' reference counts change in the
+        # same transaction as the user row, so a failed save undoes both
+        with transaction.atomic():
+            set_profile_picture(user, profile_picture)
+            user.save()
+
+        profile_picture_url = avatar_url(user, PROFILE_AVATAR_SIZE, request)
         
         # Also update localStorage format
         user_data = {
@@ -201,6 +209,11 @@ def upload_profile_picture(request):
             'user': user_data  # ✅ Return complete user data
         }, status=status.HTTP_200_OK)
         
+    except InvalidImage:
+        return Response({
+            'error': 'Invalid image. Please upload a JPEG, PNG, GIF, or WebP image.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
     except Exception as e:
         logger.error(f"Error uploading profile picture: {str(e)}")
         return Response({
@@ -215,19 +228,12 @@ def remove_profile_picture(request):
     user = request.user
     
     try:
-        # Delete current profile picture if not default
-        if (user.profile_picture and 
-            user.profile_picture.name != 'profile_pics/default.jpg'):
-            try:
-                user.profile_picture.delete(save=False)
-            except Exception as e:
-                logger.warning(f"Failed to delete profile picture: {e}")
-
-        # Set to default
-        user.profile_picture = 'profile_pics/default.jpg'
-        user.save()
-
-        profile_picture_url = request.build_absolute_uri(user.profile_picture.url)
+        # Delete current profile picture if not default, and set to default
+        with transaction.atomic():
+            clear_profile_picture(user, default=DEFAULT_PICTURE)
+            user.save()
+
+        profile_picture_url = avatar_url(user, PROFILE_AVATAR_SIZE, request)
         
         # Return updated user data
         user_data = {
@@ -0,0 +1,9 @@
+"""
+Load-testing harness for the VeriFeed API.
+
+    python -m benchmarks.loadtest --concurrency 8 --requests 2000 --output before.json
+    python -m benchmarks.compare before.json after.json
+
+Runs in-process against a local SQLite database (benchmarks/settings.py)
+with outgoing email stubbed, so it needs no MySQL server or SendGrid key.
+"""
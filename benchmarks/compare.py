@@ -0,0 +1,57 @@
+"""
+Compare two load-test reports endpoint by endpoint.
+
+    python -m benchmarks.compare before.json after.json
+
+Prints p50/p95/p99 latency, throughput and queries-per-request side by side
+with the relative change, so a regression shows up as a positive % on
+latency / queries or a negative % on throughput.
+"""
+import json
+import sys
+
+METRICS = [
+    ('p50 ms', lambda s: s['latency_ms']['p50']),
+    ('p95 ms', lambda s: s['latency_ms']['p95']),
+    ('p99 ms', lambda s: s['latency_ms']['p99']),
+    ('rps', lambda s: s['throughput_rps']),
+    ('q/req', lambda s: s['queries_per_request']['mean']),
+]
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return ''
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def compare(before, after):
+    lines = []
+    for label in ('commit', 'mix', 'concurrency'):
+        lines.append(f"{label}: {before['meta'].get(label)} -> {after['meta'].get(label)}")
+    names = sorted(set(before['endpoints']) | set(after['endpoints']))
+    for name in names + ['overall']:
+        old = before['overall'] if name == 'overall' else before['endpoints'].get(name)
+        new = after['overall'] if name == 'overall' else after['endpoints'].get(name)
+        lines.append(f'\n{name}')
+        if old is None or new is None:
+            lines.append('  only in ' + ('after' if old is None else 'before'))
+            continue
+        for label, metric in METRICS:
+            lines.append(f'  {label:<7}{metric(old)!s:>12}{metric(new)!s:>12}{change(metric(old), metric(new)):>10}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        raise SystemExit(__doc__)
+    reports = []
+    for path in argv:
+        with open(path) as f:
+            reports.append(json.load(f))
+    print(compare(*reports))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Microbenchmark for building and sending OTP emails.
+
+    python -m benchmarks.email_bench --emails 200
+
+Render compares compiling and rendering the templates for every email with
+rendering once per process (render_email) and personalizing per recipient.
+
+Send runs against a local HTTP server that answers like SendGrid's
+mail/send, so it measures client overhead only. There is no network
+latency, which keeps the figures a lower bound: every new connection costs
+an extra round trip to a real server. Three ways of sending are compared:
+
+- a new SendGridAPIClient per email, which is how emails used to be sent
+- the pooled keep-alive client, one call per email
+- send_many, one call for all of them
+"""
+import argparse
+import json
+import os
+import pathlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+os.environ.setdefault('EMAIL_HOST_PASSWORD', 'bench-stub-key')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.template import Context, engines  # noqa: E402
+from django.template.loader import get_template  # noqa: E402
+
+from accounts import email_utils  # noqa: E402
+from accounts.models import CustomUser  # noqa: E402
+
+
+class MailSendHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+
+    def do_POST(self):
+        self.connections.add(self.client_address)
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(202)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def timed(label, count, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    return {'case': label, 'total_ms': round(elapsed * 1000, 2), 'per_email_us': round(elapsed / count * 1e6, 1)}
+
+
+def render_uncached(users):
+    engine = engines['django'].engine
+    sources = {
+        name: pathlib.Path(get_template(f'accounts/email/otp.{name}').origin.name).read_text()
+        for name in ('txt', 'html')
+    }
+
+    def run():
+        for i, user in enumerate(users):
+            copy = email_utils.OTP_COPY['login']
+            context = {
+                'subject': copy['subject'].replace(email_utils.OTP_CODE, f'{i:06d}'),
+                'title': copy['title'],
+                'greeting': copy['greeting'].replace(email_utils.USERNAME, user.username),
+                'message': copy['message'],
+                'otp_code': f'{i:06d}',
+            }
+            for source in sources.values():
+                engine.from_string(source).render(Context(context))
+    return run
+
+
+def render_cached(users):
+    def run():
+        email_utils.render_email.cache_clear()
+        for i, user in enumerate(users):
+            email_utils.otp_message(user, f'{i:06d}', 'login')
+    return run
+
+
+def send_fresh_clients(users, base_url):
+    def run():
+        for i, user in enumerate(users):
+            from sendgrid import SendGridAPIClient
+            SendGridAPIClient('bench-stub-key', host=base_url).send(email_utils.otp_message(user, f'{i:06d}'))
+    return run
+
+
+def send_pooled(users, base_url):
+    client = email_utils.SendGridClient('bench-stub-key', base_url=base_url)
+
+    def run():
+        for i, user in enumerate(users):
+            client.send(email_utils.otp_message(user, f'{i:06d}'))
+        client.close()
+    return run
+
+
+def send_batched(users):
+    def run():
+        email_utils.send_many('otp', 'login', [(user, f'{i:06d}') for i, user in enumerate(users)])
+    return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MailSendHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    settings.SENDGRID_API_URL = base_url
+
+    users = [CustomUser(username=f'bench{i}', email=f'bench{i}@example.com') for i in range(args.emails)]
+    results = []
+    for label, run in [
+        ('render: compile + render per email', render_uncached(users)),
+        ('render: once per process', render_cached(users)),
+        ('send: new client per email', send_fresh_clients(users, base_url)),
+        ('send: pooled keep-alive client', send_pooled(users, base_url)),
+        ('send: one batched call', send_batched(users)),
+    ]:
+        MailSendHandler.connections.clear()
+        result = timed(label, args.emails, run)
+        result['connections'] = len(MailSendHandler.connections)
+        results.append(result)
+    server.shutdown()
+
+    print(f"{'case':<38}{'total ms':>10}{'us/email':>10}{'conns':>7}")
+    for result in results:
+        print(f"{result['case']:<38}{result['total_ms']:>10}{result['per_email_us']:>10}{result['connections']:>7}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'emails': args.emails, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
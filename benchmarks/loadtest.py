@@ -0,0 +1,292 @@
+"""
+Drive a weighted mix of API requests at a fixed concurrency and write
+per-endpoint latency percentiles, throughput and queries-per-request to a
+JSON report.
+
+    python -m benchmarks.loadtest --mix default --concurrency 8 --requests 2000
+    python -m benchmarks.loadtest --mix service_summary=3,helpful_toggle=1 --duration 30
+
+Each worker thread has its own django.test.Client and database connection
+and authenticates as its own user. Requests go through the full middleware
+and URL stack in-process; there is no network hop. SendGrid calls are
+stubbed to succeed, and the seeded database is reused between runs.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+# email_utils refuses to send without a key; the client itself is stubbed
+os.environ.setdefault('EMAIL_HOST_PASSWORD', 'bench-stub-key')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from reviews.models import Review, Service  # noqa: E402
+from reviews.stats import rebuild_service_stats  # noqa: E402
+
+from .scenarios import PASSWORD, SCENARIOS, SEARCH_TERMS, Context, Dataset, parse_mix  # noqa: E402
+
+User = get_user_model()
+
+
+@contextlib.contextmanager
+def stub_email():
+    """Accept every SendGrid send without touching the network"""
+    with mock.patch('accounts.email_utils.SendGridClient.send', return_value=202):
+        yield
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def seed(users, reviews, services, seed_value):
+    """Small built-in dataset; use generate_benchmark_data for large ones"""
+    rng = random.Random(seed_value)
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([
+        User(username=f'bench{i}', email=f'bench{i}@example.com', password=password, two_fa_enabled=True)
+        for i in range(users)
+    ], batch_size=500)
+    user_ids = list(User.objects.values_list('id', flat=True))
+
+    names = [f'Service {i}' for i in range(services)]
+    by_name = Service.objects.resolve_many(names)
+    # A few services get most of the reviews
+    weights = [1 / (rank + 1) for rank in range(services)]
+    batch = []
+    for _ in range(reviews):
+        name = rng.choices(names, weights)[0]
+        batch.append(Review(
+            user_id=rng.choice(user_ids), service=by_name[name], service_name=name,
+            rating=rng.randint(1, 5), title=rng.choice(SEARCH_TERMS),
+            comment=' '.join(rng.sample(SEARCH_TERMS, 3)),
+        ))
+        if len(batch) >= 1000:
+            Review.objects.bulk_create(batch)
+            batch = []
+    Review.objects.bulk_create(batch)
+    rebuild_service_stats()
+
+
+def prepare_database(args):
+    os.makedirs(settings.BENCH_DATA_DIR, exist_ok=True)
+    if args.reset and os.path.exists(settings.DATABASES['default']['NAME']):
+        connections.close_all()
+        os.remove(settings.DATABASES['default']['NAME'])
+    call_command('migrate', verbosity=0)
+    if not User.objects.exists():
+        log(f"Seeding {args.seed_users} users / {args.seed_reviews} reviews ...")
+        seed(args.seed_users, args.seed_reviews, args.seed_services, args.seed)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Budget:
+    """Hands out request slots to workers until the run is over"""
+
+    def __init__(self, requests=None, duration=None):
+        self.remaining = requests
+        self.deadline = time.monotonic() + duration if duration else None
+        self.lock = threading.Lock()
+
+    def take(self):
+        if self.deadline is not None:
+            return time.monotonic() < self.deadline
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds, status, queries):
+        with self.lock:
+            self.samples.setdefault(name, []).append((seconds, status, queries))
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for name, samples in sorted(self.samples.items()):
+            endpoints[name] = summarize(samples, elapsed)
+        every = [sample for samples in self.samples.values() for sample in samples]
+        return endpoints, summarize(every, elapsed)
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    queries = [count for _, _, count in samples]
+    rounded = lambda value: None if value is None else round(value, 3)  # noqa: E731
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, status, _ in samples if status == 'error' or status >= 500),
+        'status_codes': statuses,
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': rounded(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': rounded(percentile(latencies, 50)),
+            'p95': rounded(percentile(latencies, 95)),
+            'p99': rounded(percentile(latencies, 99)),
+            'max': rounded(latencies[-1]) if latencies else None,
+        },
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+def worker(index, users, dataset, mix, seed_value, budget, recorder):
+    rng = random.Random(f'{seed_value}-{index}')
+    ctx = Context(user=users[index % len(users)], dataset=dataset, rng=rng)
+    client = Client()
+    names, weights = list(mix), list(mix.values())
+    try:
+        while budget.take():
+            name = rng.choices(names, weights)[0]
+            request = SCENARIOS[name](ctx)
+            headers = {'HTTP_AUTHORIZATION': f'Bearer {ctx.token}'} if request.authenticated else {}
+            call = getattr(client, request.method.lower())
+            if request.method == 'GET':
+                kwargs = {'data': request.params}
+            else:
+                kwargs = {'data': json.dumps(request.data or {}), 'content_type': 'application/json'}
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                try:
+                    status = call(request.path, **kwargs, **headers).status_code
+                except Exception:
+                    status = 'error'
+                elapsed = time.perf_counter() - started
+            recorder.add(name, elapsed, status, len(queries))
+    finally:
+        connection.close()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    mix = parse_mix(args.mix)
+    prepare_database(args)
+    dataset = Dataset.load()
+    users = list(User.objects.filter(username__startswith='bench').order_by('id')[:args.concurrency])
+    if not users:
+        raise SystemExit("No bench* users in the database; run with --reset to reseed")
+
+    if args.warmup:
+        log(f"Warming up with {args.warmup} requests ...")
+        with stub_email(), contextlib.redirect_stdout(io.StringIO()):
+            worker(0, users, dataset, mix, args.seed, Budget(requests=args.warmup), Recorder())
+
+    log(f"Running mix {args.mix!r} at concurrency {args.concurrency} ...")
+    recorder = Recorder()
+    budget = Budget(requests=args.requests, duration=args.duration)
+    # Views print debug output; keep it out of the report stream
+    with stub_email(), contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(worker, i, users, dataset, mix, args.seed, budget, recorder)
+                for i in range(args.concurrency)
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+    endpoints, overall = recorder.summary(elapsed)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'mix': mix,
+            'concurrency': args.concurrency,
+            'duration_s': round(elapsed, 3),
+            'seed': args.seed,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        },
+        'overall': overall,
+        'endpoints': endpoints,
+    }
+
+
+def print_table(report):
+    log(f"\n{'endpoint':<22}{'reqs':>7}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'q/req':>7}")
+    rows = list(report['endpoints'].items()) + [('overall', report['overall'])]
+    for name, stats in rows:
+        latency = stats['latency_ms']
+        log(
+            f"{name:<22}{stats['requests']:>7}{stats['errors']:>5}{stats['throughput_rps']:>9}"
+            f"{latency['p50']:>9}{latency['p95']:>9}{latency['p99']:>9}"
+            f"{stats['queries_per_request']['mean']:>7}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', default='default',
+                        help="Named mix (default, browse, write, auth) or 'scenario=weight,...'")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=1000, help='Total requests (ignored with --duration)')
+    parser.add_argument('--duration', type=float, help='Run for this many seconds instead')
+    parser.add_argument('--warmup', type=int, default=50, help='Untimed requests before measuring')
+    parser.add_argument('--output', default='bench-report.json', help='Where to write the JSON report')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true', help='Delete and reseed the benchmark database')
+    parser.add_argument('--seed-users', type=int, default=200)
+    parser.add_argument('--seed-reviews', type=int, default=5000)
+    parser.add_argument('--seed-services', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print_table(report)
+    log(f"\nReport written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
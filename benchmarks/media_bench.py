@@ -0,0 +1,164 @@
+"""
+How long a gunicorn worker is held per /media/ download, per
+MEDIA_SERVE_MODE.
+
+    python -m benchmarks.media_bench --clients 4 --size-mb 16 --rate-kb 4096
+
+Starts gunicorn with one sync worker for each mode, then has `--clients`
+clients download a `--size-mb` file at once, each reading at `--rate-kb`
+KB/s like a phone on a slow link. While they download, a probe requests a
+tiny file: its latency is how long any other request waits for the worker.
+Worker time per request comes from gunicorn's access log (%(D)s, which
+runs until the response is fully written).
+
+In 'accel' mode there is no nginx here, so clients get only the headers
+Django sends; the figures are exactly what the worker does, and the body
+transfer would be nginx's job. 'stream' includes the whole transfer, done
+with sendfile but at the client's pace. Files that fit in the kernel's
+socket send buffer (up to 4 MB with default Linux tcp_wmem) are handed off
+at once in either mode, so use a size above that to see the difference.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+
+MODES = ('stream', 'accel')
+LOG_FORMAT = '%(U)s %(s)s %(D)s'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"gunicorn did not start on port {port}")
+
+
+def fetch(port, path, rate=None):
+    """GET `path` and read the whole response, at most `rate` bytes/s; returns seconds taken"""
+    started = time.perf_counter()
+    with socket.socket() as s:
+        # A small receive window (set before connecting, or it isn't
+        # negotiated) so the client, not the kernel, sets the pace
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024)
+        s.connect(('127.0.0.1', port))
+        s.sendall(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+        chunk = 16 * 1024
+        while True:
+            data = s.recv(chunk)
+            if not data:
+                break
+            if rate:
+                time.sleep(len(data) / rate)
+    return time.perf_counter() - started
+
+
+def run_mode(mode, args, paths):
+    port = free_port()
+    log = tempfile.NamedTemporaryFile('r', suffix='.log', delete=False)
+    env = dict(os.environ, MEDIA_SERVE_MODE=mode, DJANGO_SETTINGS_MODULE='benchmarks.settings')
+    server = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', 'LandingPage.wsgi',
+            '--bind', f'127.0.0.1:{port}', '--workers', '1', '--worker-class', 'sync',
+            '--timeout', '300', '--access-logfile', log.name, '--access-logformat', LOG_FORMAT,
+        ],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(port)
+        fetch(port, paths['probe'])
+
+        rate = args.rate_kb * 1024
+        durations = []
+        threads = [
+            threading.Thread(target=lambda: durations.append(fetch(port, paths['large'], rate)))
+            for _ in range(args.clients)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        probe = fetch(port, paths['probe'])
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    held = []
+    for line in open(log.name):
+        path, status, micros = line.split()
+        if path == paths['large']:
+            held.append(int(micros) / 1000)
+    os.unlink(log.name)
+    return {
+        'mode': mode,
+        'requests': len(held),
+        'worker_ms_p50': round(statistics.median(held), 1),
+        'worker_ms_max': round(max(held), 1),
+        'worker_busy_ms': round(sum(held), 1),
+        'probe_ms': round(probe * 1000, 1),
+        'client_ms_p50': round(statistics.median(durations) * 1000, 1),
+        'wall_ms': round(wall * 1000, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--size-mb', type=float, default=16)
+    parser.add_argument('--rate-kb', type=int, default=4096, help='Read speed of each client, KB/s')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    directory = os.path.join(settings.MEDIA_ROOT, 'bench')
+    os.makedirs(directory, exist_ok=True)
+    files = {'large': int(args.size_mb * 1024 * 1024), 'probe': 64}
+    paths = {}
+    for label, size in files.items():
+        with open(os.path.join(directory, f'{label}.bin'), 'wb') as f:
+            f.write(os.urandom(size))
+        paths[label] = f'/media/bench/{label}.bin'
+
+    results = [run_mode(mode, args, paths) for mode in MODES]
+
+    print(f"{'mode':<8}{'reqs':>6}{'worker p50 ms':>15}{'worker max ms':>15}{'busy ms':>10}{'probe ms':>10}")
+    for r in results:
+        print(
+            f"{r['mode']:<8}{r['requests']:>6}{r['worker_ms_p50']:>15}{r['worker_ms_max']:>15}"
+            f"{r['worker_busy_ms']:>10}{r['probe_ms']:>10}"
+        )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'clients': args.clients, 'size_mb': args.size_mb, 'rate_kb': args.rate_kb,
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Request scenarios and the traffic mixes built from them.
+
+A scenario is a function taking the worker's Context and returning a
+Request. Anything it does before returning (e.g. issuing an OTP to verify)
+is setup and is not timed.
+"""
+import random
+import uuid
+from urllib.parse import quote
+from dataclasses import dataclass, field
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.otp_backends import get_backend
+from reviews.models import Review, ServiceRatingStats
+
+PASSWORD = 'Bench-Passw0rd!'
+
+SEARCH_TERMS = ['slow', 'great app', 'support', 'crash', 'fast', 'ads', 'update', 'login']
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    data: dict = None
+    params: dict = None
+    authenticated: bool = False
+
+
+@dataclass
+class Context:
+    """Per-worker state: the worker's user, a JWT for it and a seeded RNG"""
+    user: object
+    dataset: 'Dataset'
+    rng: random.Random
+    token: str = field(init=False)
+
+    def __post_init__(self):
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    def service(self):
+        return self.dataset.pick_service(self.rng)
+
+    def service_path(self):
+        return quote(self.service(), safe='')
+
+    def review_id(self):
+        return self.rng.choice(self.dataset.review_ids)
+
+
+@dataclass
+class Dataset:
+    """Services weighted by review count, and review ids to vote on"""
+    services: list
+    service_weights: list
+    review_ids: list
+
+    def pick_service(self, rng):
+        return rng.choices(self.services, self.service_weights)[0]
+
+    @classmethod
+    def load(cls, max_services=500, max_reviews=50000):
+        rows = list(
+            ServiceRatingStats.objects.filter(review_count__gt=0)
+            .order_by('-review_count')
+            .values_list('service__name', 'review_count')[:max_services]
+        )
+        if not rows:
+            raise RuntimeError("No reviews in the benchmark database; seed it first")
+        return cls(
+            services=[name for name, _ in rows],
+            service_weights=[count for _, count in rows],
+            review_ids=list(Review.objects.order_by().values_list('id', flat=True)[:max_reviews]),
+        )
+
+
+def service_reviews(ctx):
+    return Request('GET', f'/api/services/{ctx.service_path()}/reviews/', authenticated=True)
+
+
+def public_summary(ctx):
+    return Request('GET', f'/api/service_review_summary/{ctx.service_path()}/')
+
+
+def service_summary(ctx):
+    return Request('GET', f'/api/services/{ctx.service_path()}/summary/', authenticated=True)
+
+
+def batch_summaries(ctx):
+    services = list({ctx.service() for _ in range(5)})
+    return Request('GET', '/api/services/summaries/', params={'service': services})
+
+
+def review_search(ctx):
+    return Request('GET', '/api/reviews/search/', params={'q': ctx.rng.choice(SEARCH_TERMS)})
+
+
+def my_reviews(ctx):
+    return Request('GET', '/api/reviews/my_reviews/', authenticated=True)
+
+
+def create_review(ctx):
+    return Request('POST', '/api/quick-review/', authenticated=True, data={
+        'service_name': ctx.service(),
+        'rating': ctx.rng.randint(1, 5),
+        'comment': ctx.rng.choice(SEARCH_TERMS),
+    })
+
+
+def bulk_create_reviews(ctx):
+    # Fresh service names: the bulk endpoint rejects repeat reviews of a service
+    return Request('POST', '/api/reviews/bulk/', authenticated=True, data={'reviews': [
+        {'service_name': f'bench-{uuid.uuid4().hex[:8]}', 'rating': ctx.rng.randint(1, 5)}
+        for _ in range(10)
+    ]})
+
+
+def helpful_toggle(ctx):
+    return Request('POST', f'/api/reviews/{ctx.review_id()}/helpful/', authenticated=True)
+
+
+def profile(ctx):
+    return Request('GET', '/api/accounts/profile/', authenticated=True)
+
+
+def login(ctx):
+    return Request('POST', '/api/accounts/token/', data={
+        'username': ctx.user.email, 'password': PASSWORD,
+    })
+
+
+def request_otp(ctx):
+    return Request('POST', '/api/accounts/request-otp/', data={
+        'username_or_email': ctx.user.username, 'password': PASSWORD,
+    })
+
+
+def verify_otp(ctx):
+    otp = get_backend().issue(ctx.user, purpose='login', ip_address='127.0.0.1')
+    return Request('POST', '/api/accounts/verify-otp/', data={
+        'username_or_email': ctx.user.username, 'otp_code': otp.code,
+    })
+
+
+SCENARIOS = {
+    scenario.__name__: scenario
+    for scenario in [
+        service_reviews, public_summary, service_summary, batch_summaries,
+        review_search, my_reviews, create_review, bulk_create_reviews,
+        helpful_toggle, profile, login, request_otp, verify_otp,
+    ]
+}
+
+# Relative weights per scenario
+MIXES = {
+    'browse': {
+        'service_reviews': 30, 'public_summary': 25, 'service_summary': 15,
+        'batch_summaries': 5, 'review_search': 10, 'my_reviews': 5,
+        'helpful_toggle': 5, 'profile': 5,
+    },
+    'write': {
+        'create_review': 40, 'bulk_create_reviews': 5, 'helpful_toggle': 40,
+        'service_summary': 15,
+    },
+    'auth': {
+        'login': 30, 'request_otp': 30, 'verify_otp': 30, 'profile': 10,
+    },
+}
+MIXES['default'] = {
+    **{name: weight * 3 for name, weight in MIXES['browse'].items()},
+    'create_review': 8, 'helpful_toggle': 25, 'request_otp': 4, 'verify_otp': 4,
+}
+
+
+def parse_mix(spec):
+    """A named mix, or an explicit 'scenario=weight,...' list"""
+    if spec in MIXES:
+        return dict(MIXES[spec])
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
@@ -0,0 +1,44 @@
+"""
+Settings for the load-test harness: the project settings pointed at a local
+SQLite file. WAL mode and IMMEDIATE transactions let concurrent writer
+threads queue on the database lock instead of failing with "locked".
+"""
+import os
+
+from LandingPage.settings import *  # noqa: F401,F403
+
+BENCH_DATA_DIR = os.environ.get(
+    'BENCH_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+)
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCH_DB', os.path.join(BENCH_DATA_DIR, 'bench.sqlite3')),
+        'OPTIONS': {
+            'timeout': 30,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'verifeed-bench',
+    }
+}
+
+# The load generator sends everything from one IP as a handful of users
+AUTH_THROTTLES = {}
+
+DEBUG = False
+ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+MEDIA_ROOT = os.path.join(BENCH_DATA_DIR, 'media')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'root': {'handlers': [], 'level': 'CRITICAL'},
+}
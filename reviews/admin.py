@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Review, ReviewHelpful
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Review, ReviewHelpful, Service, ServiceRatingStats, service_slug
+from .search import matching_ids_sql
 
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
@@ -18,7 +21,34 @@ class ReviewAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # Title/comment go through the full-text index instead of icontains
+        # scans; service and username only match exactly
+        match = matching_ids_sql(search_term)
+        if match is None:
+            return super().get_search_results(request, queryset, search_term)
+        term = search_term.strip()
+        queryset = queryset.filter(
+            Q(pk__in=RawSQL(*match))
+            | Q(service__slug=service_slug(term))
+            | Q(user__username__iexact=term)
+        )
+        return queryset, False
+
 @admin.register(ReviewHelpful)
 class ReviewHelpfulAdmin(admin.ModelAdmin):
     list_display = ['review', 'user', 'created_at']
-    list_filter = ['created_at']
\ No newline at end of file
+    list_filter = ['created_at']
+
+@admin.register(Service)
+class ServiceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug', 'created_at']
+    search_fields = ['name', 'slug']
+    readonly_fields = ['slug', 'created_at']
+
+@admin.register(ServiceRatingStats)
+class ServiceRatingStatsAdmin(admin.ModelAdmin):
+    list_display = ['service', 'review_count', 'average_rating', 'last_review_at', 'updated_at']
+    list_select_related = ['service']
+    search_fields = ['service__name', 'service__slug']
+    readonly_fields = [f.name for f in ServiceRatingStats._meta.fields]
@@ -1,11 +1,16 @@
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Avg, Count, Q
-from .models import Review
-from .serializers import ReviewSerializer
+from django.conf import settings
+from django.db.models import Avg, Q
+from LandingPage.conditional import conditional_view
+from .models import Review, service_slug
+from .cache import summary_cache
+from .conditional import service_summary_validators
+from .serializers import ReviewSerializer, helpful_vote_ids
+from .stats import get_many_service_stats, get_service_stats
 
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
@@ -24,39 +29,100 @@ def user_review_stats(request):
     
     return Response(stats)
 
-@api_view(['GET'])
-def service_review_summary(request, service_name):
-    """Get review summary for a specific service"""
-    reviews = Review.objects.filter(service_name__iexact=service_name)
+def build_service_summary(request, service_name):
+    """Summary payload shared by every user (helpful-vote flags left False)"""
+    stats = get_service_stats(service_name)
     
-    if not reviews.exists():
-        return Response({
+    if not stats.review_count:
+        return {
             'service_name': service_name,
             'total_reviews': 0,
             'average_rating': 0,
             'rating_breakdown': {str(i): 0 for i in range(1, 6)}
-        })
+        }
     
-    stats = reviews.aggregate(
-        total=Count('id'),
-        avg_rating=Avg('rating')
-    )
+    reviews = Review.objects.filter(service__slug=service_slug(service_name)).select_related('user')
     
-    rating_breakdown = {}
-    for i in range(1, 6):
-        rating_breakdown[str(i)] = reviews.filter(rating=i).count()
+    rating_breakdown = {str(i): count for i, count in stats.rating_breakdown().items()}
     
-    return Response({
+    return {
         'service_name': service_name,
-        'total_reviews': stats['total'],
-        'average_rating': round(stats['avg_rating'], 1),
+        'total_reviews': stats.review_count,
+        'average_rating': round(stats.average_rating, 1),
         'rating_breakdown': rating_breakdown,
         'recent_reviews': ReviewSerializer(
             reviews.order_by('-created_at')[:3], 
             many=True,
-            context={'request': request}
+            context={'request': request, 'resolve_helpful_votes': False}
         ).data
-    })
+    }
+
+@api_view(['GET'])
+@conditional_view(service_summary_validators, vary=['Authorization'])
+def service_review_summary(request, service_name):
+    """Get review summary for a specific service"""
+    summary = summary_cache.get_or_set(
+        service_name,
+        f"api:{request.build_absolute_uri('/')}:{service_name}",
+        lambda: build_service_summary(request, service_name),
+    )
+    
+    # The cached payload is user-independent; add this user's votes on top
+    recent = summary.get('recent_reviews')
+    if recent:
+        voted = helpful_vote_ids(request, [review['id'] for review in recent])
+        summary = {
+            **summary,
+            'recent_reviews': [
+                {**review, 'user_has_voted_helpful': review['id'] in voted}
+                for review in recent
+            ],
+        }
+    
+    return Response(summary)
+
+@api_view(['GET', 'POST'])
+@permission_classes([AllowAny])
+def batch_service_summaries(request):
+    """
+    Rating summaries for several services in one call.
+    GET ?service=A&service=B or POST {"services": ["A", "B"]}
+    """
+    if request.method == 'POST':
+        service_names = request.data.get('services')
+    else:
+        service_names = request.query_params.getlist('service')
+    
+    if not isinstance(service_names, list) or not service_names or not all(
+        isinstance(name, str) and name.strip() for name in service_names
+    ):
+        return Response({
+            'error': 'Provide one or more service names'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    service_names = list(dict.fromkeys(service_names))
+    limit = settings.SERVICE_SUMMARY_BATCH_LIMIT
+    if len(service_names) > limit:
+        return Response({
+            'error': f'At most {limit} services per request'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    summaries = []
+    for service_name, stats in get_many_service_stats(service_names).items():
+        summaries.append({
+            'service_name': service_name,
+            'total_reviews': stats.review_count,
+            'average_rating': round(stats.average_rating, 1),
+            'rating_breakdown': {str(i): count for i, count in stats.rating_breakdown().items()},
+        })
+    
+    return Response({'summaries': summaries})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def summary_cache_stats(request):
+    """Hit/miss counts for the service summary cache"""
+    return Response(summary_cache.stats())
 
 @api_view(['POST'])
 @authentication_classes([TokenAuthentication])
@@ -75,7 +141,7 @@ def quick_review(request):
     # Check if user already reviewed this service
     existing_review = Review.objects.filter(
         user=request.user,
-        service_name=service_name
+        service__slug=service_slug(service_name)
     ).first()
     
     if existing_review:
@@ -0,0 +1,118 @@
+"""
+Cache for public review summary payloads.
+
+Entries are keyed by the service's normalized slug (see
+reviews.models.service_slug) plus a per-service version stamp. Any Review
+save/delete on a service bumps its version (see reviews.signals), which
+makes every cached payload for that service unreachable without having to
+know or delete the individual keys.
+
+The backend is whatever SUMMARY_CACHE points at: local memory by default,
+a shared cache (e.g. Redis via CACHE_URL) in multi-worker deployments.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from LandingPage import metrics
+
+from .models import service_slug
+from .singleflight import SingleFlight
+
+
+def _digest(value):
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+class SummaryCache:
+    prefix = 'summary'
+
+    def __init__(self):
+        # Concurrent misses on the same entry build it once (see singleflight)
+        self.flight = SingleFlight(self.prefix)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'SUMMARY_CACHE', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'SUMMARY_CACHE_TIMEOUT', 300)
+
+    def _version_key(self, service_name):
+        return f'{self.prefix}:version:{_digest(service_slug(service_name))}'
+
+    def version(self, service_name):
+        key = self._version_key(service_name)
+        version = self.cache.get(key)
+        if version is None:
+            # Seed from the clock so a version lost to eviction never reuses
+            # a number that old entries were stored under
+            self.cache.add(key, time.time_ns(), timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def invalidate(self, service_name):
+        key = self._version_key(service_name)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, time.time_ns(), timeout=None)
+
+    def invalidate_on_commit(self, *service_names):
+        """Invalidate once the current transaction's writes are visible"""
+        def invalidate():
+            for slug in {service_slug(name) for name in service_names}:
+                self.invalidate(slug)
+        transaction.on_commit(invalidate)
+
+    def _data_key(self, service_name, variant):
+        service = _digest(service_slug(service_name))
+        return f'{self.prefix}:{service}:{self.version(service_name)}:{_digest(variant)}'
+
+    def get_or_set(self, service_name, variant, builder):
+        """
+        Return the cached payload for (service, variant), building and storing
+        it on a miss. `variant` separates payloads that differ for the same
+        service, e.g. the endpoint or the host used for absolute URLs.
+        """
+        key = self._data_key(service_name, variant)
+        payload = self.cache.get(key)
+        if payload is not None:
+            self._count('hits')
+            metrics.CACHE_LOOKUPS.inc(cache='summary', result='hit')
+            return payload
+        self._count('misses')
+        metrics.CACHE_LOOKUPS.inc(cache='summary', result='miss')
+
+        def build_and_store():
+            payload = builder()
+            self.cache.set(key, payload, timeout=self.timeout)
+            return payload
+
+        return self.flight.do(key, build_and_store)
+
+    def _count(self, outcome):
+        key = f'{self.prefix}:stats:{outcome}'
+        if not self.cache.add(key, 1, timeout=None):
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, 1, timeout=None)
+
+    def stats(self):
+        counts = self.cache.get_many([f'{self.prefix}:stats:hits', f'{self.prefix}:stats:misses'])
+        hits = counts.get(f'{self.prefix}:stats:hits', 0)
+        misses = counts.get(f'{self.prefix}:stats:misses', 0)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0,
+        }
+
+
+summary_cache = SummaryCache()
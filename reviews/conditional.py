@@ -0,0 +1,83 @@
+"""
+Cheap validators for conditional GETs on the review read API.
+
+Each function returns (etag, last_modified) from at most a couple of
+single-row / indexed aggregate queries, without building the payload.
+
+Responses that include the caller's own helpful votes get no
+Last-Modified: removing a vote leaves no timestamp behind, so only the
+ETag can tell If-Modified-Since clients that their copy is stale.
+
+Reviews are shown with their author's name and picture. A user changing
+those moves the stats rows of the services they reviewed (see
+reviews.signals), and the caller's own appear in the my_reviews ETag.
+"""
+from django.db.models import Count, Max, Sum
+
+from LandingPage.conditional import make_etag
+
+from .models import Review, ReviewHelpful, ServiceRatingStats, service_slug
+
+
+def _service_state(service_name):
+    return ServiceRatingStats.objects.filter(service__slug=service_slug(service_name)).aggregate(
+        count=Sum('review_count'), updated_at=Max('updated_at')
+    )
+
+
+def _vote_state(request):
+    """Changes whenever the user adds or removes a helpful vote"""
+    if not request.user.is_authenticated:
+        return None
+    state = ReviewHelpful.objects.filter(user=request.user).aggregate(
+        count=Count('id'), latest=Max('id')
+    )
+    return request.user.pk, state['count'], state['latest']
+
+
+def public_summary_validators(request, service_name):
+    state = _service_state(service_name)
+    return (
+        make_etag('public-summary', service_name, state['count'], state['updated_at']),
+        state['updated_at'],
+    )
+
+
+def _last_modified(updated_at, vote_state):
+    return updated_at if vote_state is None else None
+
+
+def service_summary_validators(request, service_name):
+    state = _service_state(service_name)
+    votes = _vote_state(request)
+    return (
+        make_etag('summary', service_name, state['count'], state['updated_at'], votes),
+        _last_modified(state['updated_at'], votes),
+    )
+
+
+def service_reviews_validators(request, service_name):
+    state = _service_state(service_name)
+    votes = _vote_state(request)
+    return (
+        make_etag('service-reviews', request.get_full_path(), state['count'], state['updated_at'], votes),
+        _last_modified(state['updated_at'], votes),
+    )
+
+
+def my_reviews_validators(request):
+    if not request.user.is_authenticated:
+        return None, None
+    state = Review.objects.filter(user=request.user).aggregate(
+        count=Count('id'), updated_at=Max('updated_at')
+    )
+    votes = _vote_state(request)
+    user = request.user
+    author = (
+        user.username, user.first_name, user.last_name,
+        user.profile_picture.name if user.profile_picture else '', sorted(user.profile_picture_variants),
+    )
+    return (
+        make_etag('my-reviews', request.get_full_path(), state['count'], state['updated_at'], votes, author),
+        _last_modified(state['updated_at'], votes),
+    )
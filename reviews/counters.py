@@ -0,0 +1,236 @@
+"""
+Write-behind buffer for Review.helpful_count.
+
+Helpful-vote toggles add +1/-1 deltas to a counter in the shared cache
+instead of doing a read-modify-write + save() on the review row. Every
+HELPFUL_COUNT_FLUSH_INTERVAL seconds the pending deltas are folded into the
+reviews table with one F() UPDATE per distinct delta.
+
+Which reviews have pending deltas is kept in the shared cache too, as a
+journal of numbered entries, so any worker (or `flush_helpful_counts`) can
+flush deltas left behind by a worker that restarted. Only one flusher runs
+at a time, under a cache lock, so a delta is never taken twice.
+
+Buffering needs HELPFUL_COUNT_CACHE to be shared by every process, and to
+keep keys until they are flushed. A per-process LocMemCache is neither (it
+also culls entries past MAX_ENTRIES), so `check_cache` refuses to start with
+one unless HELPFUL_COUNT_FLUSH_INTERVAL is 0, which writes every vote
+straight through to the database.
+
+Deltas are taken out of the cache before the UPDATE runs, so a worker that
+dies mid-flush loses at most the votes of that one flush window; the
+ReviewHelpful rows themselves are always written synchronously.
+
+Writing the counts moves Review.updated_at and the services'
+ServiceRatingStats.updated_at and invalidates their cached summaries, so
+conditional GETs and summaries pick up the new counts.
+"""
+import atexit
+import logging
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .cache import summary_cache
+from .models import Review, ServiceRatingStats
+
+logger = logging.getLogger(__name__)
+
+# Cache backends that aren't shared between processes, or may drop keys early
+UNSHARED_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class HelpfulCountBuffer:
+    key_prefix = 'helpful_count:pending'
+    # Entry N of the journal names the review of the Nth buffered vote
+    journal_prefix = 'helpful_count:journal'
+    sequence_key = 'helpful_count:sequence'
+    cursor_key = 'helpful_count:flushed'
+    gap_key = 'helpful_count:gap'
+    lock_key = 'helpful_count:flush-lock'
+    # Journal entries handled per flush; the rest wait for the next one
+    batch_size = 1000
+    lock_timeout = 60
+
+    def __init__(self, cache_alias=None, flush_interval=None):
+        self._cache_alias = cache_alias
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    @property
+    def cache(self):
+        return caches[self._cache_alias or getattr(settings, 'HELPFUL_COUNT_CACHE', 'default')]
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'HELPFUL_COUNT_FLUSH_INTERVAL', 5)
+
+    def key(self, review_id):
+        return f'{self.key_prefix}:{review_id}'
+
+    def journal_key(self, number):
+        return f'{self.journal_prefix}:{number}'
+
+    def _incr(self, key, delta):
+        self.cache.add(key, 0, timeout=None)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # Evicted between add() and incr(); start the counter over
+            self.cache.set(key, delta, timeout=None)
+            return delta
+
+    def add(self, review_id, delta):
+        """Record a vote delta; written straight through when buffering is off"""
+        if self.flush_interval <= 0:
+            self._write([review_id], delta)
+            return
+        self._incr(self.key(review_id), delta)
+        self.cache.set(self.journal_key(self._incr(self.sequence_key, 1)), review_id, timeout=None)
+
+    def pending(self, review_id):
+        return self.cache.get(self.key(review_id), 0)
+
+    def live_count(self, review):
+        """Persisted count plus whatever is still waiting to be flushed"""
+        if self.flush_interval <= 0:
+            # add() wrote to the row after `review` was loaded
+            review.refresh_from_db(fields=['helpful_count'])
+            return review.helpful_count
+        return max(0, review.helpful_count + self.pending(review.pk))
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Fold pending deltas into Review.helpful_count; returns rows touched.
+        Returns 0 straight away while another worker is flushing.
+        """
+        self._last_flush = time.monotonic()
+        token = uuid.uuid4().hex
+        if not self.cache.add(self.lock_key, token, timeout=self.lock_timeout):
+            return 0
+        try:
+            touched, more = 0, True
+            while more:
+                review_ids, more = self._read_journal()
+                touched += self._flush_reviews(review_ids)
+            return touched
+        finally:
+            # A flush that outran lock_timeout must not release another's lock
+            if self.cache.get(self.lock_key) == token:
+                self.cache.delete(self.lock_key)
+
+    def _read_journal(self):
+        """
+        Review ids from the next batch of unflushed journal entries, which are
+        then marked flushed; also whether a full batch was read, so more may follow
+        """
+        last = self.cache.get(self.sequence_key, 0)
+        cursor = self.cache.get(self.cursor_key, 0)
+        if cursor > last:
+            # The sequence was evicted and started over
+            cursor = 0
+        numbers = range(cursor + 1, min(last, cursor + self.batch_size) + 1)
+        keys = [self.journal_key(number) for number in numbers]
+        entries = self.cache.get_many(keys)
+
+        review_ids = set()
+        # Missing entries up to here have been waited for once
+        gap = self.cache.get(self.gap_key, 0)
+        flushed = cursor
+        for number, key in zip(numbers, keys):
+            if key in entries:
+                review_ids.add(entries[key])
+            elif number > gap:
+                # Its add() may have taken the number without writing the entry
+                # yet; wait one flush for it, and for every number taken so far,
+                # before treating them as lost
+                self.cache.set(self.gap_key, last, timeout=None)
+                break
+            flushed = number
+        self.cache.set(self.cursor_key, flushed, timeout=None)
+        self.cache.delete_many(keys[:flushed - cursor])
+        return review_ids, flushed - cursor == self.batch_size
+
+    def _flush_reviews(self, review_ids):
+        if not review_ids:
+            return 0
+        keys = {self.key(review_id): review_id for review_id in review_ids}
+        by_delta = defaultdict(list)
+        for key, delta in self.cache.get_many(keys).items():
+            if delta:
+                # Claim the delta before writing it: a crash from here on drops
+                # this window instead of double-counting it on the next flush.
+                # Only the lock holder decrements, so exactly `delta` is taken.
+                self.cache.decr(key, delta)
+                by_delta[delta].append(keys[key])
+
+        try:
+            with transaction.atomic():
+                for delta, ids in by_delta.items():
+                    self._write(ids, delta)
+        except Exception:
+            logger.exception("Helpful count flush failed; re-queueing deltas")
+            for delta, ids in by_delta.items():
+                for review_id in ids:
+                    self.add(review_id, delta)
+            raise
+        return sum(len(ids) for ids in by_delta.values())
+
+    @staticmethod
+    def _write(review_ids, delta):
+        if delta >= 0:
+            value = F('helpful_count') + delta
+        else:
+            # helpful_count is unsigned: clamp at zero without going negative
+            value = Case(
+                When(helpful_count__gt=-delta, then=F('helpful_count') - abs(delta)),
+                default=Value(0),
+            )
+        now = timezone.now()
+        reviews = Review.objects.filter(pk__in=review_ids)
+        reviews.update(helpful_count=value, updated_at=now)
+        services = set(reviews.values_list('service_id', 'service_name'))
+        ServiceRatingStats.objects.filter(service_id__in={service_id for service_id, _ in services}).update(
+            updated_at=now
+        )
+        summary_cache.invalidate_on_commit(*(name for _, name in services))
+
+
+def check_cache():
+    """Raise ImproperlyConfigured if votes would be buffered in an unshared cache"""
+    if getattr(settings, 'HELPFUL_COUNT_FLUSH_INTERVAL', 5) <= 0:
+        return
+    alias = getattr(settings, 'HELPFUL_COUNT_CACHE', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend in UNSHARED_CACHES:
+        raise ImproperlyConfigured(
+            f"HELPFUL_COUNT_CACHE '{alias}' uses {backend}, which isn't shared between "
+            "processes: set CACHE_URL, or HELPFUL_COUNT_FLUSH_INTERVAL=0 to write votes straight through"
+        )
+
+
+helpful_counts = HelpfulCountBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        helpful_counts.flush()
+    except Exception:
+        logger.exception("Final helpful count flush failed")
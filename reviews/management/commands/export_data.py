@@ -0,0 +1,37 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reviews.transfer import FORMATS, MODEL_LABELS, export_model, file_name, get_models
+
+
+class Command(BaseCommand):
+    help = (
+        "Export users, reviews, helpful votes, feedback and media file counts to gzip-compressed "
+        "NDJSON/CSV files (one per model), reading the tables in bounded chunks. "
+        "User rows include password hashes: keep the output private."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir', help='Directory to write the export files to')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Rows fetched per query',
+        )
+        parser.add_argument(
+            '--model', action='append', dest='models', choices=MODEL_LABELS,
+            help='Only export this model (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        output_dir = options['output_dir']
+        os.makedirs(output_dir, exist_ok=True)
+
+        for model in get_models(options['models']):
+            path = os.path.join(output_dir, file_name(model, options['format']))
+            count = export_model(model, path, options['format'], options['chunk_size'])
+            self.stdout.write(f"{model._meta.label}: {count} rows -> {path}")
+        self.stdout.write(self.style.SUCCESS("Export complete"))
@@ -0,0 +1,34 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from reviews.counters import helpful_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Write buffered helpful-vote counts to the reviews table, including "
+        "those left behind by workers that stopped. Runs until stopped unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Flush once, then exit')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between flushes')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+
+        while not self.stopping:
+            close_old_connections()
+            touched = helpful_counts.flush()
+            if touched:
+                self.stdout.write(f"updated {touched} reviews")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+    def stop(self, signum, frame):
+        self.stopping = True
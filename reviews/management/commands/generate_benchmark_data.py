@@ -0,0 +1,224 @@
+import itertools
+import random
+import string
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import UserOTP
+from reviews.models import Feedback, Review, ReviewHelpful, Service
+from reviews.stats import rebuild_service_stats
+from reviews.transfer import keep_timestamps
+
+User = get_user_model()
+
+WORDS = (
+    'app fast slow crash support great terrible update login ads video feed '
+    'privacy battery design useful buggy smooth laggy helpful scam fake real '
+    'account payment refund delivery music search notifications dark mode'
+).split()
+
+
+def zipf_cum_weights(n, s):
+    """Cumulative weights for ranks 1..n under a Zipf(s) distribution"""
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, services, reviews, helpful votes, "
+        "feedback and OTPs for benchmarking. Service popularity and helpful votes "
+        "are Zipf-skewed, timestamps are spread over --days, and every user shares "
+        "one precomputed password hash (--password). Use a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--services', type=int, default=2000)
+        parser.add_argument('--reviews', type=int, default=100000)
+        parser.add_argument('--helpful-votes', type=int, default=200000)
+        parser.add_argument('--feedback', type=int, default=5000)
+        parser.add_argument('--otps', type=int, default=50000)
+        parser.add_argument('--days', type=int, default=730, help='Spread timestamps over this many days')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Skew exponent for services and votes')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk INSERT')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; same seed, same data')
+        parser.add_argument('--prefix', default='bench', help='Username / service name prefix')
+        parser.add_argument('--password', default='Bench-Passw0rd!', help='Password of every generated user')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(
+                f"Users prefixed {options['prefix']!r} already exist; use another --prefix or a fresh database"
+            )
+        # choices(k=...) draws a whole batch per call, so generation stays
+        # dominated by INSERT time rather than per-row Python
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        started = time.monotonic()
+
+        user_ids = self.generate_users()
+        services = self.generate_services()
+        review_ids = self.generate_reviews(user_ids, services)
+        self.generate_helpful_votes(user_ids, review_ids)
+        self.generate_feedback(user_ids)
+        self.generate_otps(user_ids)
+
+        self.stdout.write("Rebuilding rating stats ...")
+        rebuild_service_stats()
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.monotonic() - started:.1f}s"))
+
+    # -- helpers --------------------------------------------------------
+
+    def timestamps(self, k, recent_bias=2.0):
+        """k datetimes within --days, denser towards now"""
+        span = self.options['days'] * 86400
+        return [
+            self.now - timedelta(seconds=span * r ** recent_bias)
+            for r in (self.rng.random() for _ in range(k))
+        ]
+
+    def insert(self, model, total, build, **bulk_kwargs):
+        """bulk_create `total` rows in batches; returns the new rows' ids"""
+        before = model._base_manager.order_by('-pk').values_list('pk', flat=True).first() or 0
+        done = 0
+        label = model._meta.verbose_name_plural
+        while done < total:
+            size = min(self.batch_size, total - done)
+            with transaction.atomic(), keep_timestamps(model):
+                model._base_manager.bulk_create(build(size), **bulk_kwargs)
+            done += size
+            self.stdout.write(f"  {label}: {done}/{total}", ending='\r')
+            self.stdout.flush()
+        self.stdout.write(f"  {label}: {total}/{total}")
+        # Only this command writes to a benchmark database, so the new rows
+        # are exactly those above the previous maximum id
+        return list(
+            model._base_manager.filter(pk__gt=before).order_by('pk').values_list('pk', flat=True)
+        )
+
+    # -- generators -----------------------------------------------------
+
+    def generate_users(self):
+        prefix = self.options['prefix']
+        password = make_password(self.options['password'])
+        counter = itertools.count()
+
+        def build(size):
+            rows = []
+            for joined in self.timestamps(size):
+                i = next(counter)
+                rows.append(User(
+                    username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password,
+                    first_name=self.rng.choice(WORDS).title(), date_joined=joined,
+                    two_fa_enabled=self.rng.random() < 0.8, profile_picture=None,
+                ))
+            return rows
+
+        self.stdout.write("Users")
+        return self.insert(User, self.options['users'], build)
+
+    def generate_services(self):
+        names = [f'{self.options["prefix"]} {self.rng.choice(WORDS)} {i}' for i in range(self.options['services'])]
+        self.stdout.write("Services")
+        by_name = {}
+        for start in range(0, len(names), self.batch_size):
+            by_name.update(Service.objects.resolve_many(names[start:start + self.batch_size]))
+        self.stdout.write(f"  services: {len(names)}")
+        # Rank order is popularity order: names[0] is the hottest service
+        return [(name, by_name[name].pk) for name in names]
+
+    def generate_reviews(self, user_ids, services):
+        cum = zipf_cum_weights(len(services), self.options['zipf'])
+        # Ratings skew positive with a bump of angry one-star reviews
+        rating_weights = [12, 5, 10, 28, 45]
+
+        def build(size):
+            picked = self.rng.choices(services, cum_weights=cum, k=size)
+            users = self.rng.choices(user_ids, k=size)
+            ratings = self.rng.choices(range(1, 6), weights=rating_weights, k=size)
+            created = self.timestamps(size)
+            return [
+                Review(
+                    service_id=service_id, service_name=name, user_id=user_id, rating=rating,
+                    title=' '.join(self.rng.choices(WORDS, k=3)).capitalize(),
+                    comment=' '.join(self.rng.choices(WORDS, k=12))[:100],
+                    created_at=at, updated_at=at, is_verified=self.rng.random() < 0.1,
+                )
+                for (name, service_id), user_id, rating, at in zip(picked, users, ratings, created)
+            ]
+
+        self.stdout.write("Reviews")
+        return self.insert(Review, self.options['reviews'], build)
+
+    def generate_helpful_votes(self, user_ids, review_ids):
+        if not review_ids:
+            return
+        # Shuffle so vote popularity isn't tied to review age
+        ranked = list(review_ids)
+        self.rng.shuffle(ranked)
+        cum = zipf_cum_weights(len(ranked), self.options['zipf'])
+
+        def build(size):
+            reviews = self.rng.choices(ranked, cum_weights=cum, k=size)
+            users = self.rng.choices(user_ids, k=size)
+            return [
+                ReviewHelpful(review_id=review_id, user_id=user_id, created_at=at)
+                for review_id, user_id, at in zip(reviews, users, self.timestamps(size))
+            ]
+
+        self.stdout.write("Helpful votes (duplicate review/user pairs are skipped)")
+        # Hot reviews draw the same voter again; those rows are dropped
+        self.insert(ReviewHelpful, self.options['helpful_votes'], build, ignore_conflicts=True)
+
+        votes = (
+            ReviewHelpful.objects.filter(review=OuterRef('pk'))
+            .order_by().values('review').annotate(count=Count('id')).values('count')
+        )
+        Review.objects.filter(pk__in=ranked).update(
+            helpful_count=Coalesce(Subquery(votes), Value(0))
+        )
+
+    def generate_feedback(self, user_ids):
+        def build(size):
+            return [
+                Feedback(
+                    user_id=self.rng.choice(user_ids) if self.rng.random() < 0.7 else None,
+                    message=' '.join(self.rng.choices(WORDS, k=20)), created_at=at,
+                )
+                for at in self.timestamps(size)
+            ]
+
+        self.stdout.write("Feedback")
+        self.insert(Feedback, self.options['feedback'], build)
+
+    def generate_otps(self, user_ids):
+        purposes = ['login', 'signup', 'reset']
+
+        def build(size):
+            rows = []
+            for user_id, created in zip(self.rng.choices(user_ids, k=size), self.timestamps(size, 1.0)):
+                rows.append(UserOTP(
+                    user_id=user_id,
+                    otp_code=''.join(self.rng.choices(string.digits, k=6)),
+                    purpose=self.rng.choices(purposes, weights=[85, 10, 5])[0],
+                    created_at=created, expires_at=created + timedelta(minutes=5),
+                    is_used=self.rng.random() < 0.7,
+                    failed_attempts=self.rng.choices(range(6), weights=[80, 10, 4, 3, 2, 1])[0],
+                    ip_address=f'10.{self.rng.randrange(256)}.{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}',
+                ))
+            return rows
+
+        self.stdout.write("OTPs (almost all long expired)")
+        self.insert(UserOTP, self.options['otps'], build)
@@ -0,0 +1,96 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection
+
+from reviews.cache import summary_cache
+from reviews.models import Service
+from reviews.stats import rebuild_service_stats
+from reviews.transfer import FORMATS, MODEL_LABELS, file_name, get_models, import_rows, iter_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Load files written by export_data in chunked bulk inserts. Progress is "
+        "checkpointed after every batch, so an interrupted import resumes where "
+        "it stopped when run again with the same arguments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input_dir', help='Directory holding the export files')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows per bulk INSERT (and per transaction)',
+        )
+        parser.add_argument(
+            '--model', action='append', dest='models', choices=MODEL_LABELS,
+            help='Only import this model (repeatable)',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore any saved checkpoint and start from the first row',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        input_dir = options['input_dir']
+        fmt = options['format']
+        models = get_models(options['models'])
+
+        for model in models:
+            path = os.path.join(input_dir, file_name(model, fmt))
+            if not os.path.exists(path):
+                raise CommandError(f"Missing export file {path}")
+
+        checkpoint_path = os.path.join(input_dir, f'.import-checkpoint-{fmt}.json')
+        checkpoint = {}
+        if os.path.exists(checkpoint_path) and not options['restart']:
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            self.stdout.write(f"Resuming from {checkpoint_path}")
+
+        def save_checkpoint():
+            with open(checkpoint_path, 'w') as f:
+                json.dump(checkpoint, f)
+
+        for model in models:
+            label = model._meta.label
+            skip = checkpoint.get(label, 0)
+
+            def on_batch(done):
+                checkpoint[label] = done
+                save_checkpoint()
+                self.stdout.write(f"{label}: {done} rows")
+
+            path = os.path.join(input_dir, file_name(model, fmt))
+            try:
+                total, present = import_rows(
+                    model, iter_rows(path, fmt),
+                    batch_size=options['batch_size'], skip=skip, fmt=fmt, on_batch=on_batch,
+                )
+            except IntegrityError as e:
+                raise CommandError(
+                    f"{label}: a row after {checkpoint.get(label, skip)} clashes with existing data: {e}"
+                ) from e
+            self.stdout.write(
+                f"{label}: done ({total} rows, {skip} skipped from checkpoint, {present} already present)"
+            )
+
+        # Explicit primary keys don't advance sequences on backends that have them
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(self.style, models):
+                cursor.execute(sql)
+
+        # bulk_create bypasses the signals that maintain the rating stats
+        services = rebuild_service_stats()
+        # Summaries cached before the import don't include its reviews
+        for name in Service.objects.values_list('name', flat=True).iterator():
+            summary_cache.invalidate(name)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Import complete; rebuilt rating stats for {services} services"
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from reviews.stats import rebuild_service_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute every service's rating stats from the reviews table (after drift or a bulk import)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Rows per INSERT when writing the rebuilt stats',
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_service_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating stats for {total} services"))
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:31
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def populate_stats(apps, schema_editor):
+    Review = apps.get_model('reviews', 'Review')
+    ServiceRatingStats = apps.get_model('reviews', 'ServiceRatingStats')
+    stats = {}
+    rows = (
+        Review.objects.order_by()
+        .values('service_name', 'rating')
+        .annotate(count=Count('id'), latest=Max('created_at'))
+    )
+    for row in rows:
+        entry = stats.setdefault(
+            row['service_name'], ServiceRatingStats(service_name=row['service_name'])
+        )
+        entry.review_count += row['count']
+        entry.rating_sum += row['count'] * row['rating']
+        if 1 <= row['rating'] <= 5:
+            setattr(entry, f"star_{row['rating']}", row['count'])
+        if entry.last_review_at is None or row['latest'] > entry.last_review_at:
+            entry.last_review_at = row['latest']
+    ServiceRatingStats.objects.bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0004_alter_review_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceRatingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_name', models.CharField(max_length=200, unique=True)),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('star_1', models.PositiveIntegerField(default=0)),
+                ('star_2', models.PositiveIntegerField(default=0)),
+                ('star_3', models.PositiveIntegerField(default=0)),
+                ('star_4', models.PositiveIntegerField(default=0)),
+                ('star_5', models.PositiveIntegerField(default=0)),
+                ('last_review_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'service rating stats',
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
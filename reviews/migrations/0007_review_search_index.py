@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# MySQL: InnoDB maintains FULLTEXT indexes on every INSERT/UPDATE/DELETE.
+MYSQL_FORWARD = [
+    "CREATE FULLTEXT INDEX review_fulltext_idx ON reviews_review (title, comment)",
+]
+MYSQL_REVERSE = [
+    "DROP INDEX review_fulltext_idx ON reviews_review",
+]
+
+# SQLite: an external-content FTS5 table over reviews_review, kept in step by
+# triggers (see https://www.sqlite.org/fts5.html#external_content_tables).
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE reviews_review_fts USING fts5(
+        title, comment,
+        content='reviews_review', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER reviews_review_fts_insert AFTER INSERT ON reviews_review BEGIN
+        INSERT INTO reviews_review_fts (rowid, title, comment)
+        VALUES (new.id, new.title, new.comment);
+    END
+    """,
+    """
+    CREATE TRIGGER reviews_review_fts_delete AFTER DELETE ON reviews_review BEGIN
+        INSERT INTO reviews_review_fts (reviews_review_fts, rowid, title, comment)
+        VALUES ('delete', old.id, old.title, old.comment);
+    END
+    """,
+    """
+    CREATE TRIGGER reviews_review_fts_update AFTER UPDATE OF title, comment ON reviews_review BEGIN
+        INSERT INTO reviews_review_fts (reviews_review_fts, rowid, title, comment)
+        VALUES ('delete', old.id, old.title, old.comment);
+        INSERT INTO reviews_review_fts (rowid, title, comment)
+        VALUES (new.id, new.title, new.comment);
+    END
+    """,
+    "INSERT INTO reviews_review_fts (reviews_review_fts) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS reviews_review_fts_update",
+    "DROP TRIGGER IF EXISTS reviews_review_fts_delete",
+    "DROP TRIGGER IF EXISTS reviews_review_fts_insert",
+    "DROP TABLE IF EXISTS reviews_review_fts",
+]
+
+
+def run(statements_by_vendor):
+    def apply(apps, schema_editor):
+        # Other backends have no index; reviews.search falls back to icontains
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0006_review_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'mysql': MYSQL_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'mysql': MYSQL_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
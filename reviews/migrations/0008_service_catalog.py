@@ -0,0 +1,142 @@
+import hashlib
+import importlib
+import unicodedata
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max
+from django.utils.text import slugify
+
+
+def service_slug(name):
+    # Frozen copy of reviews.models.service_slug
+    cleaned = ' '.join((name or '').split()).casefold()
+    folded = ''.join(c for c in unicodedata.normalize('NFKD', cleaned) if not unicodedata.combining(c))
+    slug = slugify(folded)[:200].strip('-_') if folded.isascii() else ''
+    if not slug:
+        slug = 'service-' + hashlib.md5(cleaned.encode('utf-8')).hexdigest()[:12]
+    return slug
+
+
+def fold_services(apps, schema_editor):
+    """One Service per normalized name; point every review at it"""
+    Review = apps.get_model('reviews', 'Review')
+    Service = apps.get_model('reviews', 'Service')
+    ServiceRatingStats = apps.get_model('reviews', 'ServiceRatingStats')
+
+    # Grouped here rather than with service_name__in: a case- or
+    # accent-insensitive collation would match names across groups
+    spellings, review_ids = {}, {}
+    for pk, name in Review.objects.order_by().values_list('id', 'service_name').iterator():
+        slug = service_slug(name)
+        spellings.setdefault(slug, Counter())[' '.join(name.split())] += 1
+        review_ids.setdefault(slug, []).append(pk)
+
+    for slug, names in spellings.items():
+        # The most used spelling becomes the display name
+        service = Service.objects.create(slug=slug, name=names.most_common(1)[0][0])
+        ids = review_ids[slug]
+        for start in range(0, len(ids), 1000):
+            Review.objects.filter(pk__in=ids[start:start + 1000]).update(service=service)
+
+    # Variants now share a service, so rebuild the stats per service
+    ServiceRatingStats.objects.all().delete()
+    slugs = dict(Service.objects.values_list('id', 'slug'))
+    stats = {}
+    rows = (
+        Review.objects.order_by()
+        .values('service_id', 'rating')
+        .annotate(count=Count('id'), latest=Max('created_at'))
+    )
+    for row in rows:
+        entry = stats.setdefault(row['service_id'], ServiceRatingStats(
+            # service_name is dropped below but still unique at this point
+            service_id=row['service_id'], service_name=slugs[row['service_id']],
+        ))
+        entry.review_count += row['count']
+        entry.rating_sum += row['count'] * row['rating']
+        if 1 <= row['rating'] <= 5:
+            setattr(entry, f"star_{row['rating']}", row['count'])
+        if entry.last_review_at is None or row['latest'] > entry.last_review_at:
+            entry.last_review_at = row['latest']
+    ServiceRatingStats.objects.bulk_create(stats.values(), batch_size=500)
+
+
+def unfold_services(apps, schema_editor):
+    # Stats keyed by service_name again, as 0005 first built them
+    stats_migration = importlib.import_module('reviews.migrations.0005_servicerating_stats')
+    stats_migration.populate_stats(apps, schema_editor)
+
+
+def clear_stats(apps, schema_editor):
+    # Reversing: the rows must go before service_name comes back as a
+    # unique column; unfold_services rebuilds them
+    apps.get_model('reviews', 'ServiceRatingStats').objects.all().delete()
+
+
+def restore_search_triggers(apps, schema_editor):
+    # SQLite rebuilds reviews_review to make `service` NOT NULL, which drops
+    # the FTS triggers from 0007 along with the old table
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search_index = importlib.import_module('reviews.migrations.0007_review_search_index')
+    for sql in search_index.SQLITE_REVERSE[:3] + search_index.SQLITE_FORWARD[1:]:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0007_review_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Service',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(allow_unicode=True, max_length=200, unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='service',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='reviews', to='reviews.service'),
+        ),
+        migrations.AddField(
+            model_name='serviceratingstats',
+            name='service',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rating_stats', to='reviews.service'),
+        ),
+        migrations.RunPython(fold_services, unfold_services),
+        migrations.RemoveField(
+            model_name='serviceratingstats',
+            name='service_name',
+        ),
+        migrations.RunPython(migrations.RunPython.noop, clear_stats),
+        migrations.AlterField(
+            model_name='serviceratingstats',
+            name='service',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rating_stats', to='reviews.service'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='service',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='reviews', to='reviews.service'),
+        ),
+        migrations.RemoveIndex(
+            model_name='review',
+            name='review_service_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['service', '-created_at', '-id'], name='review_service_created_idx'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:08
+
+import importlib
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def service_slug(name):
+    return importlib.import_module('reviews.migrations.0008_service_catalog').service_slug(name)
+
+
+def rebuild_stats(Review, ServiceRatingStats, service_id):
+    entry = ServiceRatingStats(service_id=service_id)
+    rows = (
+        Review.objects.filter(service_id=service_id).order_by()
+        .values('rating').annotate(count=Count('id'), latest=Max('created_at'))
+    )
+    for row in rows:
+        entry.review_count += row['count']
+        entry.rating_sum += row['count'] * row['rating']
+        if 1 <= row['rating'] <= 5:
+            setattr(entry, f"star_{row['rating']}", row['count'])
+        if entry.last_review_at is None or row['latest'] > entry.last_review_at:
+            entry.last_review_at = row['latest']
+    entry.save()
+
+
+def fold_to_ascii(apps, schema_editor):
+    """Re-key services by ASCII slug, merging those that now share one"""
+    Review = apps.get_model('reviews', 'Review')
+    Service = apps.get_model('reviews', 'Service')
+    ServiceRatingStats = apps.get_model('reviews', 'ServiceRatingStats')
+
+    groups = {}
+    for service in Service.objects.order_by('id'):
+        groups.setdefault(service_slug(service.name), []).append(service)
+
+    for slug, services in groups.items():
+        keep, others = services[0], services[1:]
+        if others:
+            # The oldest service keeps its id, name and URLs
+            Review.objects.filter(service__in=others).update(service=keep)
+            ServiceRatingStats.objects.filter(service__in=services).delete()
+            Service.objects.filter(pk__in=[service.pk for service in others]).delete()
+            rebuild_stats(Review, ServiceRatingStats, keep.pk)
+
+    # Via temporary slugs, so no rename collides with a slug not yet renamed
+    for slug, services in groups.items():
+        Service.objects.filter(pk=services[0].pk).update(slug=f'tmp-{services[0].pk}')
+    for slug, services in groups.items():
+        Service.objects.filter(pk=services[0].pk).update(slug=slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0008_service_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_to_ascii, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='service',
+            name='slug',
+            field=models.SlugField(max_length=200, unique=True),
+        ),
+    ]
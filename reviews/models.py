@@ -1,13 +1,77 @@
-from django.db import models
+import hashlib
+import unicodedata
+
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
+from django.utils.text import slugify
 from django.contrib.auth.models import User
 
 
+def clean_service_name(name):
+    """Collapse runs of whitespace: ' Face   book ' -> 'Face book'"""
+    return ' '.join((name or '').split())
+
+
+def service_slug(name):
+    """
+    Normalized key for a service name: 'Facebook', ' facebook ' and
+    'FACEBOOK' all map to 'facebook', and accents are dropped ('Café' ->
+    'cafe'). Slugs are ASCII so that no database collation can find two of
+    them equal. Names with characters that don't fold to ASCII (e.g. '微信'),
+    or with no slug characters at all (e.g. '!!!'), get a stable hashed key.
+    """
+    cleaned = clean_service_name(name).casefold()
+    folded = ''.join(c for c in unicodedata.normalize('NFKD', cleaned) if not unicodedata.combining(c))
+    slug = slugify(folded)[:200].strip('-_') if folded.isascii() else ''
+    if not slug:
+        slug = 'service-' + hashlib.md5(cleaned.encode('utf-8')).hexdigest()[:12]
+    return slug
+
+
+class ServiceManager(models.Manager):
+    def resolve(self, name):
+        """The Service a free-text name belongs to, created on first use"""
+        service, _ = self.get_or_create(
+            slug=service_slug(name), defaults={'name': clean_service_name(name)}
+        )
+        return service
+
+    def resolve_many(self, names):
+        """{name: Service} for several names in a fixed number of queries"""
+        slugs = {name: service_slug(name) for name in names}
+        found = {service.slug: service for service in self.filter(slug__in=set(slugs.values()))}
+        missing = {}
+        for name, slug in slugs.items():
+            if slug not in found:
+                missing.setdefault(slug, self.model(slug=slug, name=clean_service_name(name)))
+        if missing:
+            # Another request may create the same services concurrently
+            self.bulk_create(missing.values(), ignore_conflicts=True)
+            found.update((service.slug, service) for service in self.filter(slug__in=list(missing)))
+        return {name: found[slug] for name, slug in slugs.items()}
+
+
+class Service(models.Model):
+    """A reviewed service; reviews of any spelling of its name share one row"""
+    slug = models.SlugField(max_length=200, unique=True)
+    name = models.CharField(max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ServiceManager()
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
 class Review(models.Model):
-    # Replace 'service_name' with your actual service/product field name
-    service_name = models.CharField(max_length=200)  # Or ForeignKey to Service model
+    service = models.ForeignKey(Service, on_delete=models.PROTECT, related_name='reviews')
+    # The name as the reviewer typed it; lookups go through `service`
+    service_name = models.CharField(max_length=200)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reviews')
     rating = models.IntegerField(
         validators=[MinValueValidator(1), MaxValueValidator(5)],
@@ -22,8 +86,33 @@ class Review(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        # Match ReviewCursorPagination's (created_at, id) keyset for each list
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='review_created_id_idx'),
+            models.Index(fields=['service', '-created_at', '-id'], name='review_service_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='review_user_created_idx'),
+        ]
     def __str__(self):
          return f"{self.user.username} - {self.comment[:20]}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the rating stats were built from, so edits can be diffed
+        instance._loaded_stats_key = (
+            instance.__dict__.get('service_id'),
+            instance.__dict__.get('rating'),
+        )
+        instance._loaded_service_name = instance.__dict__.get('service_name')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keep the review and its ServiceRatingStats row in one transaction
+        with transaction.atomic():
+            if self.service_id is None or self.service_name != getattr(self, '_loaded_service_name', None):
+                self.service = Service.objects.resolve(self.service_name)
+            super().save(*args, **kwargs)
+            self._loaded_service_name = self.service_name
     
     @property
     def stars_display(self):
@@ -44,4 +133,34 @@ class Feedback(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f'Feedback from {self.user.username if self.user else "Anonymous"} - {self.created_at}'
\ No newline at end of file
+        return f'Feedback from {self.user.username if self.user else "Anonymous"} - {self.created_at}'
+
+
+class ServiceRatingStats(models.Model):
+    """Running rating totals per service, maintained on every Review write"""
+    service = models.OneToOneField(Service, on_delete=models.CASCADE, related_name='rating_stats')
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    star_1 = models.PositiveIntegerField(default=0)
+    star_2 = models.PositiveIntegerField(default=0)
+    star_3 = models.PositiveIntegerField(default=0)
+    star_4 = models.PositiveIntegerField(default=0)
+    star_5 = models.PositiveIntegerField(default=0)
+    last_review_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'service rating stats'
+
+    def __str__(self):
+        return f"{self.service} ({self.review_count} reviews)"
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return 0
+        return self.rating_sum / self.review_count
+
+    def rating_breakdown(self):
+        """Review count per star, keyed 1..5"""
+        return {i: getattr(self, f'star_{i}') for i in range(1, 6)}
@@ -0,0 +1,119 @@
+"""
+Full-text search over review titles and comments.
+
+Backed by the index created in migration 0007: a FULLTEXT index on MySQL, an
+FTS5 table kept in sync by triggers on SQLite. Both are maintained by the
+database on every insert/update/delete (bulk_create and imports included),
+so there is nothing to rebuild. On any other backend search degrades to an
+unranked icontains scan.
+
+Results are ordered by (relevance DESC, id DESC) and paged by keyset on that
+pair, so every page is one bounded index query.
+"""
+import re
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Review, Service, service_slug
+
+TABLE = Review._meta.db_table
+FTS_TABLE = f'{TABLE}_fts'
+SERVICE_TABLE = Service._meta.db_table
+
+_word = re.compile(r'\w+', re.UNICODE)
+
+
+def terms(query):
+    return _word.findall(query or '')
+
+
+def _fts5_query(words):
+    # Quote every term so user input can't use (or break) FTS5 query syntax
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+def matching_ids_sql(query):
+    """(sql, params) selecting the ids of reviews matching `query`, or None"""
+    words = terms(query)
+    if not words:
+        return None
+    if connection.vendor == 'sqlite':
+        return f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [_fts5_query(words)]
+    if connection.vendor == 'mysql':
+        return (
+            f'SELECT id FROM {TABLE} WHERE MATCH (title, comment) AGAINST (%s IN NATURAL LANGUAGE MODE)',
+            [' '.join(words)],
+        )
+    return None
+
+
+def _ranked_sql(words, service_name, position, limit):
+    if connection.vendor == 'sqlite':
+        # bm25() is lower-is-better; negate it so both backends sort DESC
+        inner = (
+            f'SELECT {FTS_TABLE}.rowid AS id, -bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} '
+            f'JOIN {TABLE} r ON r.id = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH %s'
+        )
+        params = [_fts5_query(words)]
+    else:
+        # MATCH relevance is single precision; round so keyset comparisons are exact
+        inner = (
+            f'SELECT r.id AS id, ROUND(MATCH (r.title, r.comment) AGAINST (%s IN NATURAL LANGUAGE MODE), 6) AS score '
+            f'FROM {TABLE} r WHERE MATCH (r.title, r.comment) AGAINST (%s IN NATURAL LANGUAGE MODE)'
+        )
+        params = [' '.join(words)] * 2
+    if service_name:
+        inner += f' AND r.service_id = (SELECT id FROM {SERVICE_TABLE} WHERE slug = %s)'
+        params.append(service_slug(service_name))
+
+    sql = f'SELECT id, score FROM ({inner}) hits'
+    if position is not None:
+        score, pk = position
+        sql += ' WHERE score < %s OR (score = %s AND id < %s)'
+        params += [score, score, pk]
+    sql += ' ORDER BY score DESC, id DESC LIMIT %s'
+    params.append(limit)
+    return sql, params
+
+
+def search_reviews(query, service_name=None, position=None, limit=20):
+    """
+    Reviews matching `query`, best first, as a list of (review, score).
+    `position` is the (score, id) of the last hit of the previous page.
+    """
+    words = terms(query)
+    if not words:
+        return []
+
+    if connection.vendor not in ('sqlite', 'mysql'):
+        reviews = Review.objects.all()
+        for word in words:
+            reviews = reviews.filter(Q(title__icontains=word) | Q(comment__icontains=word))
+        if service_name:
+            reviews = reviews.filter(service__slug=service_slug(service_name))
+        if position is not None:
+            reviews = reviews.filter(id__lt=position[1])
+        return [(review, 0.0) for review in reviews.select_related('user').order_by('-id')[:limit]]
+
+    with connection.cursor() as cursor:
+        cursor.execute(*_ranked_sql(words, service_name, position, limit))
+        hits = cursor.fetchall()
+    reviews = Review.objects.select_related('user').in_bulk([pk for pk, _ in hits])
+    return [(reviews[pk], float(score)) for pk, score in hits if pk in reviews]
+
+
+def encode_cursor(position):
+    score, pk = position
+    return b64encode(parse.urlencode({'s': repr(score), 'i': pk}).encode('ascii')).decode('ascii')
+
+
+def decode_cursor(encoded):
+    """(score, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'))
+        return float(tokens['s'][0]), int(tokens['i'][0])
+    except (TypeError, KeyError, UnicodeError) as e:
+        raise ValueError(str(e))
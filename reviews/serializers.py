@@ -1,16 +1,26 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Review, ReviewHelpful, Feedback
+from django.db import models
+
+from accounts.avatars import REVIEW_AVATAR_SIZE, avatar_url
+from LandingPage.timing import TimedSerializerMixin
+from .models import Review, ReviewHelpful, Feedback, service_slug
 
 User = get_user_model()
 
-class ReviewUserSerializer(serializers.ModelSerializer):
+class ReviewUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # A thumbnail-sized copy rather than the full upload
+    profile_picture = serializers.SerializerMethodField()
+
     class Meta:
         model = User
         fields = ["id", "username", "first_name", "last_name", "profile_picture"]
 
+    def get_profile_picture(self, obj):
+        return avatar_url(obj, REVIEW_AVATAR_SIZE, self.context.get("request"))
+
 
-class ReviewSimpleSerializer(serializers.ModelSerializer):
+class ReviewSimpleSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user_name = serializers.CharField(source="user.username", read_only=True)
     user_picture = serializers.SerializerMethodField()
 
@@ -28,24 +38,57 @@ class ReviewSimpleSerializer(serializers.ModelSerializer):
         ]
 
     def get_user_picture(self, obj):
-        request = self.context.get("request")
-        if obj.user and getattr(obj.user, "profile_picture", None):
-            url = obj.user.profile_picture.url
-            return request.build_absolute_uri(url) if request else url
-        return None
+        return avatar_url(obj.user, REVIEW_AVATAR_SIZE, self.context.get("request"))
+
+
+def helpful_vote_ids(request, review_ids):
+    """Which of the given review IDs the requesting user voted helpful, in one query"""
+    if not review_ids or not (request and request.user.is_authenticated):
+        return set()
+    return set(
+        ReviewHelpful.objects.filter(
+            user=request.user, review_id__in=review_ids
+        ).values_list('review_id', flat=True)
+    )
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """
+    Resolves the current user's helpful votes for the whole list up front.
+    Pass resolve_helpful_votes=False in the context for user-independent
+    payloads (e.g. cached summaries); every review then reports False.
+    """
+
+    def to_representation(self, data):
+        reviews = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if self.context.get('resolve_helpful_votes', True):
+            request = self.context.get('request')
+            voted = helpful_vote_ids(request, [review.pk for review in reviews])
+        else:
+            voted = set()
+        self.child.voted_review_ids = voted
+        return super().to_representation(reviews)
+
+
+class ReviewSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = ReviewUserSerializer(read_only=True)
     stars_display = serializers.ReadOnlyField()
     user_has_voted_helpful = serializers.SerializerMethodField()
 
     class Meta:
         model = Review
-        fields = ['id', 'service_name', 'rating', 'comment', 'created_at']
+        fields = [
+            'id', 'service_name', 'user', 'rating', 'title', 'comment',
+            'created_at', 'updated_at', 'is_verified', 'helpful_count',
+            'stars_display', 'user_has_voted_helpful',
+        ]
         read_only_fields = ['user', 'helpful_count', 'is_verified']
+        list_serializer_class = ReviewListSerializer
 
     def get_user_has_voted_helpful(self, obj):
+        voted_review_ids = getattr(self, 'voted_review_ids', None)
+        if voted_review_ids is not None:
+            return obj.pk in voted_review_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return ReviewHelpful.objects.filter(
@@ -61,17 +104,27 @@ class ReviewSerializer(serializers.ModelSerializer):
     def validate(self, data):
         request = self.context.get('request')
         if request and request.method == 'POST':
-            if Review.objects.filter(
-                service_name=data['service_name'],
-                user=request.user
-            ).exists():
+            slug = service_slug(data['service_name'])
+            # Bulk submissions look the user's services up once and share the
+            # set across items, so repeats inside one batch are caught too
+            existing = self.context.get('existing_service_slugs')
+            if existing is not None:
+                duplicate = slug in existing
+            else:
+                duplicate = Review.objects.filter(
+                    service__slug=slug,
+                    user=request.user
+                ).exists()
+            if duplicate:
                 raise serializers.ValidationError(
                     "You have already reviewed this service."
                 )
+            if existing is not None:
+                existing.add(slug)
         return data
 
 
-class FeedbackSerializer(serializers.ModelSerializer):
+class FeedbackSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = ReviewUserSerializer(read_only=True)
 
     class Meta:
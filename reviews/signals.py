@@ -0,0 +1,63 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import summary_cache
+from .models import Review
+from .stats import record_review_added, record_review_removed, touch_reviewer_services, touch_service_stats
+
+# User fields shown alongside their reviews
+REVIEWER_FIELDS = {'username', 'first_name', 'last_name', 'profile_picture', 'profile_picture_variants'}
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    """Make sure we know the stored service/rating before an update overwrites it"""
+    if raw or instance.pk is None:
+        return
+    loaded = getattr(instance, '_loaded_stats_key', None)
+    if loaded is None or None in loaded:
+        previous = (
+            Review.objects.filter(pk=instance.pk)
+            .values_list('service_id', 'rating', 'service_name')
+            .first()
+        )
+        instance._loaded_stats_key = previous[:2] if previous else None
+        instance._loaded_service_name = previous[2] if previous else None
+
+
+@receiver(post_save, sender=Review)
+def update_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_loaded_stats_key', None)
+    current = (instance.service_id, int(instance.rating))
+    if previous != current:
+        if previous is not None:
+            record_review_removed(*previous)
+        record_review_added(*current, instance.created_at)
+    else:
+        # Conditional GETs use the stats row's updated_at as the service's
+        # last-modified time, so plain edits must move it too
+        touch_service_stats(instance.service_id)
+    previous_name = None if created else getattr(instance, '_loaded_service_name', None)
+    summary_cache.invalidate_on_commit(instance.service_name, previous_name or instance.service_name)
+    instance._loaded_stats_key = current
+
+
+@receiver(post_delete, sender=Review)
+def update_stats_on_delete(sender, instance, **kwargs):
+    previous = getattr(instance, '_loaded_stats_key', None) or (
+        instance.service_id, instance.rating
+    )
+    record_review_removed(*previous)
+    summary_cache.invalidate_on_commit(instance.service_name)
+
+
+@receiver(post_save, sender='accounts.CustomUser')
+def refresh_reviewer_services(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """A renamed user or new picture changes the review pages they appear on"""
+    if raw or created or (update_fields is not None and not REVIEWER_FIELDS & set(update_fields)):
+        return
+    services = touch_reviewer_services(instance.pk)
+    if services:
+        summary_cache.invalidate_on_commit(*services)
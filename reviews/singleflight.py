@@ -0,0 +1,111 @@
+"""
+Single-flight coalescing for expensive reads.
+
+When many identical requests arrive at once only the first one (the leader)
+runs the computation; the rest wait for its result instead of repeating the
+same queries.
+
+* Within a process, followers block on a threading.Event owned by the leader.
+* Across processes, the leader holds a short lock in the shared cache and
+  publishes its result under a key tied to that lock; followers in other
+  workers poll for it.
+
+Waiting is bounded by SINGLE_FLIGHT_WAIT_TIMEOUT. A follower whose leader
+fails, dies or takes too long falls back to computing the result itself.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    poll_interval = 0.05
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'SINGLE_FLIGHT_CACHE', 'default')]
+
+    @property
+    def wait_timeout(self):
+        return getattr(settings, 'SINGLE_FLIGHT_WAIT_TIMEOUT', 5)
+
+    @property
+    def lock_timeout(self):
+        return getattr(settings, 'SINGLE_FLIGHT_LOCK_TIMEOUT', 10)
+
+    def _key(self, key):
+        return f'flight:{self.namespace}:{hashlib.md5(key.encode("utf-8")).hexdigest()}'
+
+    def do(self, key, fn):
+        """Return fn(), sharing one evaluation among concurrent callers of `key`"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.event.wait(self.wait_timeout) and not call.failed:
+                return call.result
+            return fn()
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def _do_shared(self, key, fn):
+        lock_key = self._key(key)
+        token = uuid.uuid4().hex
+        if self.cache.add(lock_key, token, timeout=self.lock_timeout):
+            try:
+                result = fn()
+                # Followers in other workers look for the result of *this* flight
+                self.cache.set(f'{lock_key}:{token}', result, timeout=self.lock_timeout)
+                return result
+            finally:
+                if self.cache.get(lock_key) == token:
+                    self.cache.delete(lock_key)
+
+        leader_token = self.cache.get(lock_key)
+        result_key = f'{lock_key}:{leader_token}'
+        deadline = time.monotonic() + self.wait_timeout
+        while leader_token is not None:
+            # Read the lock before the result: the leader publishes its result
+            # before releasing the lock, so a released lock means it's there
+            current = self.cache.get(lock_key)
+            result = self.cache.get(result_key)
+            if result is not None:
+                return result
+            if current != leader_token:
+                break
+            if time.monotonic() >= deadline:
+                logger.warning(f"Single-flight wait timed out for {self.namespace}; computing locally")
+                break
+            time.sleep(self.poll_interval)
+        return fn()
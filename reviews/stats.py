@@ -0,0 +1,161 @@
+"""
+Incremental maintenance of ServiceRatingStats.
+
+Every Review create / rating change / service change / delete is turned into
++1 / -1 deltas against the service's stats row, so summary endpoints can read
+a single row instead of aggregating the reviews table. Rows are keyed by
+Service, so every spelling of a service name reads and writes the same row.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Review, ServiceRatingStats, service_slug
+
+
+STAR_RANGE = range(1, 6)
+
+
+def _apply_delta(service_id, ratings, sign, created_at=None):
+    """Add (sign=1) or remove (sign=-1) a list of ratings in one UPDATE"""
+    stars = Counter(ratings)
+    changes = {
+        'review_count': F('review_count') + sign * len(ratings),
+        'rating_sum': F('rating_sum') + sign * sum(ratings),
+        'updated_at': timezone.now(),
+    }
+    for rating, count in stars.items():
+        if rating in STAR_RANGE:
+            changes[f'star_{rating}'] = F(f'star_{rating}') + sign * count
+    if created_at is not None:
+        changes['last_review_at'] = Greatest(
+            Coalesce('last_review_at', Value(created_at)), Value(created_at)
+        )
+    return ServiceRatingStats.objects.filter(service_id=service_id).update(**changes)
+
+
+def _add_ratings(service_id, ratings, created_at):
+    if _apply_delta(service_id, ratings, 1, created_at):
+        return
+    try:
+        with transaction.atomic():
+            stats = ServiceRatingStats(
+                service_id=service_id,
+                review_count=len(ratings),
+                rating_sum=sum(ratings),
+                last_review_at=created_at,
+            )
+            for rating, count in Counter(ratings).items():
+                if rating in STAR_RANGE:
+                    setattr(stats, f'star_{rating}', count)
+            stats.save(force_insert=True)
+    except IntegrityError:
+        # Another request created the row first; fall back to the update path
+        _apply_delta(service_id, ratings, 1, created_at)
+
+
+def record_review_added(service_id, rating, created_at):
+    """Count a new (or moved / re-rated) review into its service's stats"""
+    _add_ratings(service_id, [rating], created_at)
+
+
+def record_reviews_bulk_added(reviews):
+    """Count freshly bulk-created reviews, one UPDATE per service"""
+    by_service = {}
+    for review in reviews:
+        by_service.setdefault(review.service_id, []).append(review)
+    for service_id, service_reviews in by_service.items():
+        _add_ratings(
+            service_id,
+            [int(review.rating) for review in service_reviews],
+            max(review.created_at for review in service_reviews),
+        )
+
+
+def record_review_removed(service_id, rating):
+    """Take a deleted (or moved / re-rated) review out of its service's stats"""
+    _apply_delta(service_id, [rating], -1)
+    latest = Review.objects.filter(service_id=service_id).aggregate(
+        latest=Max('created_at')
+    )['latest']
+    ServiceRatingStats.objects.filter(service_id=service_id).update(
+        last_review_at=latest, updated_at=timezone.now()
+    )
+
+
+def touch_service_stats(service_id):
+    """Mark a service as changed when a review is edited without moving its stats"""
+    ServiceRatingStats.objects.filter(service_id=service_id).update(
+        updated_at=timezone.now()
+    )
+
+
+def touch_reviewer_services(user_id):
+    """
+    Mark every service `user_id` has reviewed as changed, since their
+    summaries show the reviewer's name and picture; returns the service names
+    """
+    services = set(Review.objects.filter(user_id=user_id).values_list('service_id', 'service_name'))
+    if services:
+        ServiceRatingStats.objects.filter(service_id__in={service_id for service_id, _ in services}).update(
+            updated_at=timezone.now()
+        )
+    return [name for _, name in services]
+
+
+def get_service_stats(service_name):
+    """
+    Return the stats for a service (any spelling of its name) as a
+    ServiceRatingStats instance. Services without reviews get an unsaved,
+    zero-filled instance.
+    """
+    stats = ServiceRatingStats.objects.filter(service__slug=service_slug(service_name)).first()
+    return stats or ServiceRatingStats()
+
+
+def get_many_service_stats(service_names):
+    """
+    Stats for several services in one query, keyed by the names as given.
+    Services without reviews get zero-filled instances.
+    """
+    slugs = {name: service_slug(name) for name in service_names}
+    rows = {
+        stats.slug: stats
+        for stats in ServiceRatingStats.objects.filter(
+            service__slug__in=set(slugs.values())
+        ).annotate(slug=F('service__slug'))
+    }
+    return {name: rows.get(slug) or ServiceRatingStats() for name, slug in slugs.items()}
+
+
+def compute_all_stats():
+    """Recompute stats for every service straight from the reviews table"""
+    stats = {}
+    rows = (
+        Review.objects.order_by()
+        .values('service_id', 'rating')
+        .annotate(count=Count('id'), latest=Max('created_at'))
+    )
+    for row in rows:
+        entry = stats.setdefault(
+            row['service_id'], ServiceRatingStats(service_id=row['service_id'])
+        )
+        entry.review_count += row['count']
+        entry.rating_sum += row['count'] * row['rating']
+        if row['rating'] in STAR_RANGE:
+            setattr(entry, f"star_{row['rating']}", row['count'])
+        if entry.last_review_at is None or row['latest'] > entry.last_review_at:
+            entry.last_review_at = row['latest']
+    return stats
+
+
+@transaction.atomic
+def rebuild_service_stats(batch_size=500):
+    """Replace the whole stats table with freshly computed values"""
+    stats = compute_all_stats()
+    ServiceRatingStats.objects.all().delete()
+    ServiceRatingStats.objects.bulk_create(stats.values(), batch_size=batch_size)
+    return len(stats)
@@ -1,3 +1,1008 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from accounts.models import MediaFile, UserOTP
+from LandingPage.metrics import registry
+
+from .cache import summary_cache
+from .counters import HelpfulCountBuffer, check_cache, helpful_counts
+from .models import Feedback, Review, ReviewHelpful, Service, ServiceRatingStats, service_slug
+from .singleflight import SingleFlight
+
+User = get_user_model()
+
+
+def make_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com', password='Passw0rd!x'
+    )
+
+
+class ServiceRatingStatsTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice')
+
+    def stats(self, service_name):
+        return ServiceRatingStats.objects.get(service__name=service_name)
+
+    def test_create_updates_stats(self):
+        Review.objects.create(user=self.user, service_name='Facebook', rating=5)
+        Review.objects.create(user=self.user, service_name='Facebook', rating=3)
+
+        stats = self.stats('Facebook')
+        self.assertEqual(stats.review_count, 2)
+        self.assertEqual(stats.rating_sum, 8)
+        self.assertEqual(stats.rating_breakdown(), {1: 0, 2: 0, 3: 1, 4: 0, 5: 1})
+        self.assertIsNotNone(stats.last_review_at)
+
+    def test_rating_and_service_changes_move_counts(self):
+        review = Review.objects.create(user=self.user, service_name='Facebook', rating=5)
+
+        review.rating = 2
+        review.save()
+        self.assertEqual(self.stats('Facebook').rating_breakdown()[2], 1)
+        self.assertEqual(self.stats('Facebook').rating_breakdown()[5], 0)
+
+        review = Review.objects.get(pk=review.pk)
+        review.service_name = 'Instagram'
+        review.save()
+        self.assertEqual(self.stats('Facebook').review_count, 0)
+        self.assertIsNone(self.stats('Facebook').last_review_at)
+        self.assertEqual(self.stats('Instagram').review_count, 1)
+        self.assertEqual(self.stats('Instagram').rating_sum, 2)
+
+    def test_delete_updates_stats(self):
+        first = Review.objects.create(user=self.user, service_name='Facebook', rating=4)
+        Review.objects.create(user=self.user, service_name='Facebook', rating=1)
+
+        first.delete()
+        Review.objects.filter(rating=1).delete()
+
+        stats = self.stats('Facebook')
+        self.assertEqual(stats.review_count, 0)
+        self.assertEqual(stats.rating_sum, 0)
+
+    def test_rebuild_command_fixes_drift(self):
+        Review.objects.create(user=self.user, service_name='Facebook', rating=4)
+        Review.objects.create(user=self.user, service_name='Facebook', rating=2)
+        ServiceRatingStats.objects.update(review_count=99, star_4=0)
+        ServiceRatingStats.objects.create(service=Service.objects.create(slug='stale', name='Stale'), review_count=3)
+
+        call_command('rebuild_rating_stats', stdout=StringIO())
+
+        stats = self.stats('Facebook')
+        self.assertEqual(stats.review_count, 2)
+        self.assertEqual(stats.rating_breakdown()[4], 1)
+        self.assertFalse(ServiceRatingStats.objects.filter(service__name='Stale').exists())
+
+
+class ServiceSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('alice')
+        self.client = APIClient()
+        for rating in (5, 4, 4, 1):
+            Review.objects.create(user=self.user, service_name='Facebook', rating=rating)
+
+    def test_public_summary_reads_stats_row(self):
+        # conditional GET validator + stats row + recent reviews (users joined)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/service_review_summary/Facebook/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_reviews'], 4)
+        self.assertEqual(response.data['average_rating'], 3.5)
+        self.assertEqual(response.data['rating_breakdown'], {'1': 1, '2': 0, '3': 0, '4': 2, '5': 1})
+
+    def test_summary_for_unknown_service_is_zero_filled(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/services/Unknown/summary/')
+        self.assertEqual(response.data['total_reviews'], 0)
+        self.assertEqual(response.data['rating_breakdown'], {str(i): 0 for i in range(1, 6)})
+
+    def test_authenticated_summary_is_case_insensitive(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/services/facebook/summary/')
+        self.assertEqual(response.data['total_reviews'], 4)
+        self.assertEqual(response.data['rating_breakdown']['4'], 2)
+
+    def test_public_and_authenticated_summaries_agree(self):
+        Review.objects.create(user=self.user, service_name=' FACEBOOK ', rating=2)
+        public = self.client.get('/api/service_review_summary/facebook/').data
+        self.client.force_authenticate(self.user)
+        authenticated = self.client.get('/api/services/Facebook/summary/').data
+        self.assertEqual(public['total_reviews'], 5)
+        self.assertEqual(authenticated['total_reviews'], 5)
+
+
+class ServiceCatalogTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice')
+
+    def test_name_variants_share_one_service(self):
+        first = Review.objects.create(user=self.user, service_name='Google  Maps', rating=5)
+        second = Review.objects.create(user=self.user, service_name=' google maps', rating=3)
+
+        self.assertEqual(first.service_id, second.service_id)
+        self.assertEqual(first.service.slug, 'google-maps')
+        self.assertEqual(first.service.name, 'Google Maps')
+        self.assertEqual(ServiceRatingStats.objects.get(service=first.service).review_count, 2)
+
+    def test_renaming_a_review_moves_it_to_the_other_service(self):
+        review = Review.objects.create(user=self.user, service_name='Facebook', rating=5)
+        review.service_name = 'Instagram'
+        review.save()
+        self.assertEqual(review.service.slug, 'instagram')
+        self.assertEqual(ServiceRatingStats.objects.get(service__slug='facebook').review_count, 0)
+
+    def test_names_without_slug_characters_get_a_stable_key(self):
+        self.assertEqual(service_slug('!!!'), service_slug(' !!! '))
+        self.assertTrue(service_slug('!!!').startswith('service-'))
+        self.assertEqual(service_slug('微信'), service_slug(' 微信'))
+        self.assertNotEqual(service_slug('微信'), service_slug('微博'))
+        self.assertTrue(service_slug('微信 Pay').startswith('service-'))
+
+    def test_accented_name_shares_its_unaccented_twins_service(self):
+        # Slugs are ASCII, so e.g. MySQL's utf8mb4_general_ci can't see two as equal
+        accented = Review.objects.create(user=self.user, service_name='Café', rating=5)
+        plain = Review.objects.create(user=make_user('bob'), service_name='CAFE', rating=3)
+        self.assertEqual(accented.service_id, plain.service_id)
+        self.assertEqual(accented.service.slug, 'cafe')
+        self.assertEqual(accented.service.name, 'Café')
+        self.assertEqual(ServiceRatingStats.objects.get(service__slug='cafe').review_count, 2)
+
+    def test_resolve_many_creates_missing_services_once(self):
+        Service.objects.resolve('Facebook')
+        with self.assertNumQueries(3):
+            services = Service.objects.resolve_many(['facebook', 'TikTok', 'tiktok '])
+        self.assertEqual(services['TikTok'], services['tiktok '])
+        self.assertEqual(Service.objects.count(), 2)
+
+
+class ReviewCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user('alice')
+        self.client = APIClient()
+        self.reviews = [
+            Review.objects.create(user=self.user, service_name='Facebook', rating=5)
+            for _ in range(5)
+        ]
+        # Force timestamp ties so the id tie-breaker is exercised
+        Review.objects.filter(pk__in=[r.pk for r in self.reviews[1:4]]).update(
+            created_at=self.reviews[1].created_at
+        )
+
+    def walk(self, url, key='results'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data[key])
+            url = response.data['next']
+        return ids
+
+    def test_pages_cover_every_review_once_newest_first(self):
+        expected = list(
+            Review.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(self.walk('/api/reviews/?page_size=2'), expected)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.walk(f'/api/users/{self.user.pk}/reviews/?page_size=2'), expected)
+        self.assertEqual(
+            self.walk('/api/services/Facebook/reviews/?page_size=2', key='reviews'), expected
+        )
+
+    def test_previous_link_returns_to_earlier_page(self):
+        first = self.client.get('/api/reviews/?page_size=2').data
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(
+            [r['id'] for r in back['results']], [r['id'] for r in first['results']]
+        )
+
+    def test_my_reviews_is_paginated(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/reviews/my_reviews/?page_size=3')
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/reviews/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class HelpfulVoteBatchingTests(TestCase):
+    def setUp(self):
+        self.author = make_user('alice')
+        self.voter = make_user('bob')
+        self.client = APIClient()
+        self.client.force_authenticate(self.voter)
+
+    def add_reviews(self, count):
+        reviews = [
+            Review.objects.create(user=self.author, service_name='Facebook', rating=4)
+            for _ in range(count)
+        ]
+        for review in reviews[::2]:
+            ReviewHelpful.objects.create(review=review, user=self.voter)
+        return reviews
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/users/{self.author.pk}/reviews/?page_size=100')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.data['results']
+
+    def test_query_count_does_not_grow_with_list_size(self):
+        self.add_reviews(2)
+        small_count, _ = self.count_queries()
+        self.add_reviews(20)
+        large_count, results = self.count_queries()
+
+        self.assertEqual(len(results), 22)
+        self.assertEqual(small_count, large_count)
+
+    def test_votes_are_reported_per_review(self):
+        reviews = self.add_reviews(4)
+        _, results = self.count_queries()
+        voted = {item['id'] for item in results if item['user_has_voted_helpful']}
+        self.assertEqual(voted, {reviews[0].pk, reviews[2].pk})
+
+
+class HelpfulCountBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('alice')
+        self.review = Review.objects.create(user=self.author, service_name='Facebook', rating=4)
+        self.buffer = HelpfulCountBuffer(flush_interval=60)
+
+    def persisted(self):
+        return Review.objects.get(pk=self.review.pk).helpful_count
+
+    def test_deltas_are_buffered_until_flush(self):
+        for _ in range(3):
+            self.buffer.add(self.review.pk, 1)
+        self.buffer.add(self.review.pk, -1)
+
+        self.assertEqual(self.persisted(), 0)
+        self.assertEqual(self.buffer.live_count(self.review), 2)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.persisted(), 2)
+        self.assertEqual(self.buffer.pending(self.review.pk), 0)
+
+    def test_count_never_goes_below_zero(self):
+        self.buffer.add(self.review.pk, -2)
+        self.buffer.flush()
+        self.assertEqual(self.persisted(), 0)
+
+    def test_crash_loses_at_most_one_flush_window(self):
+        for _ in range(3):
+            self.buffer.add(self.review.pk, 1)
+        self.buffer.flush()
+        for _ in range(2):
+            self.buffer.add(self.review.pk, 1)
+
+        # Worker dies: its in-memory state and the local-memory counters are gone
+        cache.clear()
+        HelpfulCountBuffer(flush_interval=60).flush()
+
+        self.assertEqual(self.persisted(), 3)
+
+    def test_deltas_from_a_stopped_worker_are_flushed_elsewhere(self):
+        self.buffer.add(self.review.pk, 1)
+        # A new process has none of the old one's in-memory state
+        out = StringIO()
+        with self.settings(HELPFUL_COUNT_FLUSH_INTERVAL=60):
+            call_command('flush_helpful_counts', '--once', stdout=out)
+        self.assertIn('updated 1 reviews', out.getvalue())
+        self.assertEqual(self.persisted(), 1)
+        self.assertEqual(HelpfulCountBuffer(flush_interval=60).flush(), 0)
+
+    def test_only_one_flusher_takes_a_delta(self):
+        self.buffer.add(self.review.pk, 1)
+        other = HelpfulCountBuffer(flush_interval=60)
+        cache.add(other.lock_key, 1)
+        self.assertEqual(other.flush(), 0)
+        cache.delete(other.lock_key)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(other.flush(), 0)
+        self.assertEqual(self.persisted(), 1)
+
+    def test_unwritten_journal_entry_is_waited_for_once(self):
+        self.buffer.add(self.review.pk, 1)
+        # Another add() has taken entry 2 but not written it yet
+        cache.incr(self.buffer.sequence_key)
+        self.buffer.add(self.review.pk, 1)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.persisted(), 2)
+        self.assertEqual(cache.get(self.buffer.cursor_key), 1)
+
+        self.buffer.add(self.review.pk, 1)
+        self.buffer.flush()
+        self.assertEqual(self.persisted(), 3)
+        self.assertEqual(cache.get(self.buffer.cursor_key), 4)
+
+    def test_lost_journal_entries_are_skipped_after_one_wait(self):
+        for _ in range(5):
+            self.buffer.add(self.review.pk, 1)
+        # Evicted, or still being written
+        cache.delete_many([self.buffer.journal_key(number) for number in (2, 3, 4)])
+
+        self.buffer.flush()
+        self.assertEqual(cache.get(self.buffer.cursor_key), 1)
+        self.buffer.flush()
+        self.assertEqual(cache.get(self.buffer.cursor_key), 5)
+        self.assertEqual(self.persisted(), 5)
+
+    def test_overrun_flush_leaves_a_newer_lock_alone(self):
+        self.buffer.add(self.review.pk, 1)
+        read_journal = self.buffer._read_journal
+
+        def slow_read():
+            # The lock expired and another flusher took it meanwhile
+            cache.set(self.buffer.lock_key, 'other')
+            return read_journal()
+
+        with mock.patch.object(self.buffer, '_read_journal', side_effect=slow_read):
+            self.buffer.flush()
+        self.assertEqual(cache.get(self.buffer.lock_key), 'other')
+
+    def test_buffering_needs_a_shared_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(CACHES=locmem, HELPFUL_COUNT_FLUSH_INTERVAL=5), self.assertRaises(ImproperlyConfigured):
+            check_cache()
+        with self.settings(CACHES=locmem, HELPFUL_COUNT_FLUSH_INTERVAL=0):
+            check_cache()
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://x'}}
+        with self.settings(CACHES=redis, HELPFUL_COUNT_FLUSH_INTERVAL=5):
+            check_cache()
+
+    def test_write_through_returns_the_stored_count(self):
+        voter = make_user('bob')
+        client = APIClient()
+        client.force_authenticate(voter)
+        with self.settings(HELPFUL_COUNT_FLUSH_INTERVAL=0):
+            response = client.post(f'/api/reviews/{self.review.pk}/helpful/')
+        self.assertEqual(response.data, {'helpful': True, 'helpful_count': 1})
+        self.assertEqual(self.persisted(), 1)
+
+    def test_toggle_view_returns_live_count(self):
+        voter = make_user('bob')
+        client = APIClient()
+        client.force_authenticate(voter)
+        url = f'/api/reviews/{self.review.pk}/helpful/'
+
+        with self.settings(HELPFUL_COUNT_FLUSH_INTERVAL=60):
+            response = client.post(url)
+            self.assertEqual(response.data, {'helpful': True, 'helpful_count': 1})
+            self.assertEqual(self.persisted(), 0)
+
+            helpful_counts.flush()
+            self.assertEqual(self.persisted(), 1)
+
+            response = client.post(url)
+            self.assertEqual(response.data, {'helpful': False, 'helpful_count': 0})
+            helpful_counts.flush()
+            self.assertEqual(self.persisted(), 0)
+
+
+class SummaryCacheTests(TestCase):
+    url = '/api/service_review_summary/Facebook/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('alice')
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review = Review.objects.create(user=self.user, service_name='Facebook', rating=5)
+
+    def test_repeat_requests_are_served_from_cache(self):
+        self.client.get(self.url)
+        # Only the conditional GET validator touches the database
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['total_reviews'], 1)
+        self.assertEqual(summary_cache.stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_review_writes_make_old_entries_unreachable(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=self.user, service_name='Facebook', rating=1)
+        self.assertEqual(self.client.get(self.url).data['total_reviews'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['total_reviews'], 1)
+        self.assertEqual(response.data['average_rating'], 1)
+
+    def test_cached_payload_keeps_per_user_vote_flags(self):
+        voter = make_user('bob')
+        ReviewHelpful.objects.create(review=self.review, user=voter)
+        url = '/api/services/Facebook/summary/'
+
+        self.client.force_authenticate(self.user)
+        self.assertFalse(self.client.get(url).data['recent_reviews'][0]['user_has_voted_helpful'])
+        self.client.force_authenticate(voter)
+        self.assertTrue(self.client.get(url).data['recent_reviews'][0]['user_has_voted_helpful'])
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/services/summary-cache/stats/').status_code, 403)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def slow_query(self):
+        self.calls += 1
+        time.sleep(0.2)
+        return {'calls': self.calls}
+
+    def burst(self, flights, size=20):
+        results = []
+        barrier = threading.Barrier(size)
+
+        def request(flight):
+            barrier.wait()
+            results.append(flight.do('service:Facebook', self.slow_query))
+
+        threads = [
+            threading.Thread(target=request, args=(flights[i % len(flights)],))
+            for i in range(size)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_burst_within_a_process_runs_once(self):
+        results = self.burst([SingleFlight('test')])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{'calls': 1}] * 20)
+
+    def test_burst_across_processes_runs_once(self):
+        # Separate instances share nothing but the cache, like separate workers
+        results = self.burst([SingleFlight('test') for _ in range(4)])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(results), 20)
+
+    def test_followers_fall_back_after_leader_failure(self):
+        flight = SingleFlight('test')
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError('boom')
+
+        def lead():
+            with self.assertRaises(RuntimeError):
+                flight.do('key', failing)
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait()
+        self.assertEqual(flight.do('key', lambda: 'fallback'), 'fallback')
+        leader.join()
+
+    def test_followers_stop_waiting_after_timeout(self):
+        cache.add(SingleFlight('test')._key('key'), 'stuck-leader', timeout=60)
+        with self.settings(SINGLE_FLIGHT_WAIT_TIMEOUT=0.1):
+            self.assertEqual(SingleFlight('test').do('key', lambda: 'computed'), 'computed')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.review = Review.objects.create(user=self.user, service_name='Facebook', rating=5)
+
+    def assert_revalidates(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.has_header('ETag'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+        return first['ETag']
+
+    def test_public_summary(self):
+        url = '/api/service_review_summary/Facebook/'
+        etag = self.assert_revalidates(url)
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304
+        )
+
+        self.review.title = 'Edited'
+        self.review.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_service_reviews_change_with_votes(self):
+        url = '/api/services/Facebook/reviews/'
+        etag = self.assert_revalidates(url)
+        ReviewHelpful.objects.create(review=self.review, user=self.user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_authenticated_summary_and_my_reviews(self):
+        self.assert_revalidates('/api/services/facebook/summary/')
+        etag = self.assert_revalidates('/api/reviews/my_reviews/')
+        Review.objects.create(user=self.user, service_name='Instagram', rating=3)
+        response = self.client.get('/api/reviews/my_reviews/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+    def test_flushed_helpful_counts_change_validators(self):
+        urls = ['/api/reviews/my_reviews/', '/api/services/Facebook/reviews/', '/api/service_review_summary/Facebook/']
+        etags = {url: self.assert_revalidates(url) for url in urls}
+        self.assertEqual(self.client.get('/api/services/facebook/summary/').data['recent_reviews'][0]['helpful_count'], 0)
+        self.assertFalse(self.client.get(urls[0]).has_header('Last-Modified'))
+
+        buffer = HelpfulCountBuffer(flush_interval=60)
+        buffer.add(self.review.pk, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            buffer.flush()
+
+        for url in urls:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200, url)
+        # The cached summary was dropped rather than served until it expired
+        summary = self.client.get('/api/services/facebook/summary/').data
+        self.assertEqual(summary['recent_reviews'][0]['helpful_count'], 1)
+
+
+    def test_renamed_reviewer_changes_validators(self):
+        urls = ['/api/reviews/my_reviews/', '/api/services/Facebook/reviews/', '/api/service_review_summary/Facebook/']
+        etags = {url: self.assert_revalidates(url) for url in urls}
+
+        self.user.username = 'alicia'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        for url in urls:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200, url)
+        summary = self.client.get('/api/service_review_summary/Facebook/').data
+        self.assertEqual(summary['recent_reviews'][0]['user_name'], 'alicia')
+
+    def test_login_does_not_touch_reviewed_services(self):
+        etag = self.assert_revalidates('/api/service_review_summary/Facebook/')
+        self.user.save(update_fields=['last_login'])
+        response = self.client.get('/api/service_review_summary/Facebook/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class BatchSummaryTests(TestCase):
+    url = '/api/services/summaries/'
+
+    def setUp(self):
+        self.user = make_user('alice')
+        self.client = APIClient()
+        for service_name, rating in [('Facebook', 5), ('Facebook', 3), ('YouTube', 1)]:
+            Review.objects.create(user=self.user, service_name=service_name, rating=rating)
+
+    def test_summaries_come_from_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                self.url, {'service': ['facebook', 'YouTube', 'TikTok']}
+            )
+        self.assertEqual(response.status_code, 200)
+        facebook, youtube, tiktok = response.data['summaries']
+        self.assertEqual(facebook['service_name'], 'facebook')
+        self.assertEqual(facebook['total_reviews'], 2)
+        self.assertEqual(facebook['average_rating'], 4)
+        self.assertEqual(youtube['rating_breakdown']['1'], 1)
+        self.assertEqual(tiktok, {
+            'service_name': 'TikTok',
+            'total_reviews': 0,
+            'average_rating': 0,
+            'rating_breakdown': {str(i): 0 for i in range(1, 6)},
+        })
+
+    def test_post_body_and_limits(self):
+        response = self.client.post(self.url, {'services': ['Facebook']}, format='json')
+        self.assertEqual(response.data['summaries'][0]['total_reviews'], 2)
+
+        self.assertEqual(self.client.post(self.url, {}, format='json').status_code, 400)
+        with self.settings(SERVICE_SUMMARY_BATCH_LIMIT=2):
+            response = self.client.get(self.url, {'service': ['a', 'b', 'c']})
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkReviewCreateTests(TestCase):
+    url = '/api/reviews/bulk/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Review.objects.create(user=self.user, service_name='Facebook', rating=4)
+
+    def test_valid_items_are_inserted_and_errors_reported_by_index(self):
+        response = self.client.post(self.url, [
+            {'service_name': 'YouTube', 'rating': 5, 'comment': 'Great'},
+            {'service_name': 'Facebook', 'rating': 2},
+            {'service_name': 'TikTok', 'rating': 9},
+            {'service_name': 'TikTok', 'rating': 3},
+            {'service_name': 'TikTok', 'rating': 1},
+            'nope',
+        ], format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['failed'], 4)
+        results = response.data['results']
+        self.assertEqual([result['success'] for result in results],
+                         [True, False, False, True, False, False])
+        self.assertIn('non_field_errors', results[1]['errors'])
+        self.assertIn('rating', results[2]['errors'])
+        self.assertIn('non_field_errors', results[4]['errors'])
+        youtube = Review.objects.get(service_name='YouTube')
+        self.assertEqual(results[0]['id'], youtube.pk)
+        self.assertEqual(youtube.user, self.user)
+
+    def test_ids_are_reported_without_returning_inserts(self):
+        # As on MySQL, where bulk_create can't set the new rows' PKs
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            response = self.client.post(self.url, [
+                {'service_name': 'YouTube', 'rating': 5},
+                {'service_name': 'TikTok', 'rating': 3},
+            ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [result['id'] for result in response.data['results']],
+            [Review.objects.get(service_name=name).pk for name in ('YouTube', 'TikTok')],
+        )
+
+    def test_stats_and_summary_cache_follow_bulk_insert(self):
+        summary_cache.get_or_set('YouTube', 'v', lambda: {'stale': True})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {'reviews': [
+                {'service_name': 'YouTube', 'rating': 5},
+                {'service_name': 'Instagram', 'rating': 2},
+            ]}, format='json')
+        stats = ServiceRatingStats.objects.get(service__name='YouTube')
+        self.assertEqual((stats.review_count, stats.star_5), (1, 1))
+        self.assertIsNotNone(stats.last_review_at)
+        self.assertEqual(
+            summary_cache.get_or_set('YouTube', 'v', lambda: {'stale': False}),
+            {'stale': False},
+        )
+
+    def test_rejects_empty_oversized_and_anonymous_requests(self):
+        self.assertEqual(self.client.post(self.url, [], format='json').status_code, 400)
+        with self.settings(REVIEW_BULK_CREATE_LIMIT=1):
+            response = self.client.post(self.url, [
+                {'service_name': 'a', 'rating': 1}, {'service_name': 'b', 'rating': 1},
+            ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            APIClient().post(self.url, [{'service_name': 'a', 'rating': 1}], format='json').status_code,
+            401,
+        )
+
+
+class ExportImportTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        review = Review.objects.create(user=self.alice, service_name='Facebook', rating=4, title='Nice')
+        Review.objects.create(user=self.bob, service_name='Facebook', rating=2)
+        ReviewHelpful.objects.create(review=review, user=self.bob)
+        Feedback.objects.create(user=None, message='Hello')
+        MediaFile.objects.create(name='profile_pics/9f86d081884c7d659a2feaa0c55ad015.png', size=10, refcount=2)
+        self.created_at = review.created_at
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def wipe(self):
+        User.objects.all().delete()
+        Feedback.objects.all().delete()
+        ServiceRatingStats.objects.all().delete()
+        MediaFile.objects.all().delete()
+
+    def round_trip(self, fmt):
+        call_command('export_data', self.tmp.name, format=fmt, chunk_size=1, stdout=StringIO())
+        self.wipe()
+        call_command('import_data', self.tmp.name, format=fmt, batch_size=1, stdout=StringIO())
+
+        review = Review.objects.get(user__username='alice')
+        self.assertEqual(review.title, 'Nice')
+        self.assertEqual(review.created_at, self.created_at)
+        self.assertEqual(ReviewHelpful.objects.get().user.username, 'bob')
+        self.assertIsNone(Feedback.objects.get().user)
+        self.assertTrue(User.objects.get(username='alice').check_password('Passw0rd!x'))
+        self.assertEqual(ServiceRatingStats.objects.get(service__name='Facebook').review_count, 2)
+        self.assertEqual(MediaFile.objects.get().refcount, 2)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, f'.import-checkpoint-{fmt}.json')))
+
+    def test_ndjson_round_trip(self):
+        self.round_trip('ndjson')
+
+    def test_csv_round_trip(self):
+        self.round_trip('csv')
+
+    def test_json_fields_survive_csv(self):
+        variants = {'48': {'webp': 'profile_pics/variants/a.webp', 'jpeg': 'profile_pics/variants/a.jpg'}}
+        User.objects.filter(pk=self.alice.pk).update(profile_picture_variants=variants)
+        self.round_trip('csv')
+
+        alice = User.objects.get(username='alice')
+        self.assertEqual(alice.profile_picture_variants, variants)
+        self.assertEqual(User.objects.get(username='bob').profile_picture_variants, {})
+        client = APIClient()
+        client.force_authenticate(alice)
+        self.assertEqual(client.get('/api/services/Facebook/reviews/').status_code, 200)
+
+    def test_import_resumes_from_checkpoint(self):
+        call_command('export_data', self.tmp.name, stdout=StringIO())
+        self.wipe()
+        # An earlier run got through the first user only
+        User.objects.create_user(username='alice', email='alice@example.com', password='x', id=self.alice.id)
+        with open(os.path.join(self.tmp.name, '.import-checkpoint-ndjson.json'), 'w') as f:
+            json.dump({'accounts.CustomUser': 1}, f)
+
+        out = StringIO()
+        call_command('import_data', self.tmp.name, stdout=out)
+        self.assertIn('1 skipped from checkpoint', out.getvalue())
+        self.assertTrue(User.objects.get(username='alice').check_password('x'))
+        self.assertEqual(Review.objects.count(), 2)
+
+    def test_import_reports_rows_already_present(self):
+        call_command('export_data', self.tmp.name, stdout=StringIO())
+        self.wipe()
+        User.objects.create_user(username='alice', email='alice@example.com', password='x', id=self.alice.id)
+
+        out = StringIO()
+        call_command('import_data', self.tmp.name, stdout=out)
+        self.assertIn('accounts.CustomUser: done (2 rows, 0 skipped from checkpoint, 1 already present)', out.getvalue())
+        self.assertTrue(User.objects.get(username='alice').check_password('x'))
+
+    def test_import_fails_on_clash_with_another_key(self):
+        call_command('export_data', self.tmp.name, stdout=StringIO())
+        self.wipe()
+        # Same username as an exported row, under a different id
+        User.objects.create_user(username='alice', email='other@example.com', password='x', id=self.bob.id + 100)
+
+        with self.assertRaisesMessage(CommandError, 'accounts.CustomUser: a row after 0 clashes'):
+            call_command('import_data', self.tmp.name, stdout=StringIO())
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['alice'])
+
+    def test_import_invalidates_cached_summaries(self):
+        call_command('export_data', self.tmp.name, stdout=StringIO())
+        self.wipe()
+        summary_cache.get_or_set('Facebook', 'v', lambda: {'stale': True})
+
+        call_command('import_data', self.tmp.name, stdout=StringIO())
+        self.assertEqual(summary_cache.get_or_set('Facebook', 'v', lambda: {'stale': False}), {'stale': False})
+
+
+class ReviewSearchTests(TestCase):
+    url = '/api/reviews/search/'
+
+    def setUp(self):
+        self.user = make_user('alice')
+        self.client = APIClient()
+        self.slow = Review.objects.create(
+            user=self.user, service_name='Facebook', rating=2,
+            title='Slow app', comment='Loading is slow',
+        )
+        self.fast = Review.objects.create(
+            user=self.user, service_name='YouTube', rating=5,
+            title='Fast', comment='Never slow',
+        )
+        Review.objects.create(user=self.user, service_name='TikTok', rating=4, comment='Fun videos')
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_results_are_ranked_and_filtered_by_service(self):
+        results = self.search(q='slow')['results']
+        self.assertEqual([r['id'] for r in results], [self.slow.pk, self.fast.pk])
+        self.assertGreater(results[0]['relevance'], results[1]['relevance'])
+
+        results = self.search(q='slow', service='YouTube')['results']
+        self.assertEqual([r['id'] for r in results], [self.fast.pk])
+        self.assertEqual(self.search(q='"slow" (*')['results'][0]['id'], self.slow.pk)
+
+    def test_keyset_pages_cover_every_hit_once(self):
+        for i in range(4):
+            Review.objects.create(user=self.user, service_name=f'S{i}', rating=3, comment='slow')
+        seen = []
+        data = self.search(q='slow', page_size=2)
+        while True:
+            seen += [r['id'] for r in data['results']]
+            if not data['next']:
+                break
+            data = self.client.get(data['next']).data
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.fast.comment = 'Quick and reliable'
+        self.fast.save()
+        self.slow.delete()
+        self.assertEqual(self.search(q='slow')['results'], [])
+        self.assertEqual(self.search(q='reliable')['results'][0]['id'], self.fast.pk)
+
+    def test_requires_a_query(self):
+        self.assertEqual(self.client.get(self.url, {'q': '  !'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'q': 'slow', 'cursor': 'bad'}).status_code, 404)
+
+    def test_admin_search_uses_index(self):
+        admin_user = User.objects.create_superuser('root', 'root@example.com', 'Passw0rd!x')
+        self.client.force_login(admin_user)
+        response = self.client.get('/admin/reviews/review/', {'q': 'videos'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r.service_name for r in response.context['cl'].result_list], ['TikTok'])
+
+
+class GenerateBenchmarkDataTests(TestCase):
+    def generate(self, prefix):
+        call_command(
+            'generate_benchmark_data', users=20, services=5, reviews=200, helpful_votes=300,
+            feedback=10, otps=30, batch_size=64, prefix=prefix, password='Gen-Passw0rd!',
+            stdout=StringIO(),
+        )
+        return Review.objects.filter(service_name__startswith=prefix).order_by('pk')
+
+    def test_generates_consistent_skewed_data(self):
+        reviews = self.generate('gen')
+        self.assertEqual(reviews.count(), 200)
+        self.assertEqual(User.objects.filter(username__startswith='gen').count(), 20)
+        self.assertEqual(UserOTP.objects.count(), 30)
+        self.assertTrue(User.objects.get(username='gen0').check_password('Gen-Passw0rd!'))
+
+        # Zipf: the top-ranked service gets far more than an even share
+        top = ServiceRatingStats.objects.order_by('-review_count').first()
+        self.assertGreater(top.review_count, 200 / 5)
+        self.assertEqual(
+            sum(ServiceRatingStats.objects.values_list('review_count', flat=True)), 200
+        )
+        self.assertEqual(
+            sum(reviews.values_list('helpful_count', flat=True)), ReviewHelpful.objects.count()
+        )
+        self.assertLess(reviews.order_by('created_at').first().created_at,
+                        reviews.order_by('-created_at').first().created_at)
+
+    def test_same_seed_same_data(self):
+        first = list(self.generate('one').values_list('rating', 'title'))
+        second = list(self.generate('two').values_list('rating', 'title'))
+        self.assertEqual(first, second)
+
+    def test_refuses_to_reuse_a_prefix(self):
+        self.generate('gen')
+        with self.assertRaises(CommandError):
+            self.generate('gen')
+
+
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('alice')
+        self.client = APIClient()
+        Review.objects.create(user=self.user, service_name='Facebook', rating=5, comment='fine')
+
+    def test_staff_get_server_timing_header(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/services/Facebook/reviews/')
+        self.assertEqual(response.status_code, 200)
+        timing = response.headers['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        for name in ('serializer', 'view', 'total'):
+            self.assertIn(f'{name};dur=', timing)
+
+    def test_other_users_get_no_header(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/services/Facebook/reviews/')
+        self.assertNotIn('Server-Timing', response.headers)
+
+    def test_logs_one_line_per_request(self):
+        with self.assertLogs('LandingPage.timing', 'INFO') as logs:
+            self.client.get('/api/service_review_summary/Facebook/')
+        self.assertEqual(len(logs.records), 1)
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['path'], '/api/service_review_summary/Facebook/')
+        self.assertEqual(entry['status'], 200)
+        self.assertGreater(entry['queries'], 0)
+        self.assertFalse(entry['slow'])
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+
+    def test_flags_requests_over_the_query_threshold(self):
+        with self.settings(REQUEST_TIMING_SLOW_QUERIES=0), \
+                self.assertLogs('LandingPage.timing', 'INFO') as logs:
+            APIClient().get('/api/service_review_summary/Facebook/')
+        self.assertEqual(logs.records[0].levelname, 'WARNING')
+        self.assertTrue(json.loads(logs.records[0].getMessage())['slow'])
+
+    def test_disabled_timing_still_feeds_metrics(self):
+        latency = 'verifeed_http_request_duration_seconds_count{view="service_review_summary",status="200"}'
+        before = metric_value(registry.render(), latency)
+        with self.settings(REQUEST_TIMING_ENABLED=False, DEBUG=True), \
+                self.assertNoLogs('LandingPage.timing'):
+            response = APIClient().get('/api/service_review_summary/Facebook/')
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(metric_value(registry.render(), latency), before + 1)
+
+
+def metric_value(text, sample):
+    for line in text.splitlines():
+        if line.startswith(sample + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+
+@override_settings(METRICS_TOKEN='s3cret')
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('alice')
+        self.client = APIClient()
+        Review.objects.create(user=self.user, service_name='Facebook', rating=5)
+
+    def scrape(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_records_request_latency_and_cache_lookups(self):
+        latency = 'verifeed_http_request_duration_seconds_count{view="service_review_summary",status="200"}'
+        hits = 'verifeed_cache_lookups_total{cache="summary",result="hit"}'
+        before = self.scrape()
+        self.client.get('/api/service_review_summary/Facebook/')
+        self.client.get('/api/service_review_summary/Facebook/')
+        after = self.scrape()
+        self.assertEqual(metric_value(after, latency) - metric_value(before, latency), 2)
+        self.assertEqual(metric_value(after, hits) - metric_value(before, hits), 1)
+        self.assertIn('# TYPE verifeed_http_request_duration_seconds histogram', after)
+        self.assertIn(
+            'verifeed_http_request_duration_seconds_bucket{view="service_review_summary",status="200",le="+Inf"}',
+            after,
+        )
+
+    def test_sums_values_written_by_other_workers(self):
+        sample = 'verifeed_otp_generated_total{purpose="login"}'
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            before = metric_value(self.scrape(), sample)
+            with open(os.path.join(directory, 'other-worker.json'), 'w') as f:
+                json.dump({'verifeed_otp_generated': [[['login'], 3]]}, f)
+            self.assertEqual(metric_value(self.scrape(), sample), before + 3)
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get('/metrics').status_code, 200)
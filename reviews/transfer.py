@@ -0,0 +1,184 @@
+"""
+App-level export/import of users, reviews, helpful votes and feedback,
+with the reference counts of the media files they point at.
+
+Each model is written to its own gzip-compressed file, as NDJSON (one JSON
+object per line) or CSV, with one column per concrete field (foreign keys as
+their raw `<name>_id`). Rows are read in primary-key order with keyset
+chunks (`pk > last ORDER BY pk LIMIT n`) rather than one big query: the MySQL
+drivers Django uses buffer a whole result set client-side even for
+`iterator()`, so chunking by key is what keeps memory flat on any backend.
+
+Imports read the files back in the same order and insert them in batches of
+`bulk_create`, each batch in its own transaction. Rows whose primary key is
+already taken are left out and counted; any other conflict (a username or
+email that another row already has) fails the batch rather than being
+silently dropped, as `ignore_conflicts` (INSERT IGNORE on MySQL) would.
+"""
+import csv
+import datetime
+import gzip
+import json
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+
+# Dependency order: everything after a model may point at it
+MODEL_LABELS = [
+    'accounts.MediaFile',
+    'accounts.CustomUser',
+    'reviews.Service',
+    'reviews.Review',
+    'reviews.ReviewHelpful',
+    'reviews.Feedback',
+]
+
+FORMATS = ('ndjson', 'csv')
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder rounds to milliseconds; keep timestamps exact
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def get_models(labels=None):
+    return [apps.get_model(label) for label in (labels or MODEL_LABELS)]
+
+
+def file_name(model, fmt):
+    return f'{model._meta.label_lower}.{fmt}.gz'
+
+
+def concrete_fields(model):
+    # Many-to-many relations (e.g. user groups) live in other tables and are not exported
+    return list(model._meta.concrete_fields)
+
+
+def iter_chunks(model, chunk_size=2000):
+    """Yield lists of row dicts in pk order, one keyset query per chunk"""
+    columns = [field.attname for field in concrete_fields(model)]
+    queryset = model._base_manager.order_by('pk').values(*columns)
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][model._meta.pk.attname]
+
+
+def export_model(model, path, fmt='ndjson', chunk_size=2000):
+    """Write every row of `model` to `path`; returns the number of rows"""
+    fields = concrete_fields(model)
+    columns = [field.attname for field in fields]
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as stream:
+        if fmt == 'csv':
+            writer = csv.writer(stream)
+            writer.writerow(columns)
+        for rows in iter_chunks(model, chunk_size):
+            for row in rows:
+                if fmt == 'csv':
+                    writer.writerow(_csv_value(field, row[field.attname]) for field in fields)
+                else:
+                    stream.write(json.dumps(row, cls=_Encoder, ensure_ascii=False))
+                    stream.write('\n')
+            count += len(rows)
+    return count
+
+
+def _csv_value(field, value):
+    if value is None:
+        return ''
+    if isinstance(field, models.JSONField):
+        return json.dumps(value, cls=_Encoder, ensure_ascii=False)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def iter_rows(path, fmt='ndjson'):
+    """Stream the rows of an exported file back as dicts of raw values"""
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as stream:
+        if fmt == 'csv':
+            yield from csv.DictReader(stream)
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def build_instance(model, row, fmt='ndjson'):
+    values = {}
+    for field in concrete_fields(model):
+        if field.attname not in row:
+            continue
+        value = row[field.attname]
+        if fmt == 'csv' and value == '' and field.null:
+            value = None
+        elif fmt == 'csv' and isinstance(field, models.JSONField):
+            value = json.loads(value)
+        if value is not None:
+            value = field.to_python(value)
+        values[field.attname] = value
+    return model(**values)
+
+
+@contextmanager
+def keep_timestamps(model):
+    """Stop auto_now/auto_now_add fields overwriting imported timestamps"""
+    fields = [
+        (field, field.auto_now, field.auto_now_add)
+        for field in concrete_fields(model)
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def import_rows(model, rows, batch_size=1000, skip=0, fmt='ndjson', on_batch=None):
+    """
+    Insert rows with bulk_create, `batch_size` per transaction, after skipping
+    the first `skip` rows (already imported by an earlier run). Rows whose key
+    already exists are left out, so re-running a partly applied batch is safe.
+    `on_batch(done)` is called after each committed batch with the running
+    row count, including skipped rows. Returns the final count and the number
+    of rows left out because their key existed.
+    """
+    done = present = 0
+    batch = []
+
+    def flush():
+        nonlocal present
+        with transaction.atomic(), keep_timestamps(model):
+            existing = set(
+                model._base_manager.filter(pk__in=[obj.pk for obj in batch]).values_list('pk', flat=True)
+            )
+            model._base_manager.bulk_create([obj for obj in batch if obj.pk not in existing])
+        present += len(existing)
+        if on_batch:
+            on_batch(done)
+        batch.clear()
+
+    for row in rows:
+        if done < skip:
+            done += 1
+            continue
+        batch.append(build_instance(model, row, fmt))
+        done += 1
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return done, present
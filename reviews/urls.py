@@ -15,6 +15,10 @@ urlpatterns = [
          views.ReviewHelpfulToggleView.as_view(), name='review-helpful-toggle'),
     path('services/<str:service_name>/reviews/', 
          views.ServiceReviewsView.as_view(), name='service-reviews'),
+    path('services/summaries/', 
+         api_views.batch_service_summaries, name='batch-service-summaries'),
+    path('services/summary-cache/stats/', 
+         api_views.summary_cache_stats, name='summary-cache-stats'),
     path('services/<str:service_name>/summary/', 
          api_views.service_review_summary, name='service-review-summary'),
     path('users/<int:user_id>/reviews/', 
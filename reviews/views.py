@@ -1,22 +1,38 @@
 from rest_framework import viewsets, generics, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes, authentication_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.views import APIView
+from rest_framework.utils.urls import replace_query_param
 from rest_framework_simplejwt.authentication import JWTAuthentication  # ✅ CONSISTENT JWT AUTH
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, CreateView
 from django.contrib import messages
 from django.urls import reverse_lazy
-from django.db.models import Avg, Count
-from .models import Review, ReviewHelpful, Feedback
-from .serializers import ReviewSerializer, FeedbackSerializer, ReviewSimpleSerializer
+from LandingPage.conditional import conditional_view
+from .cache import summary_cache
+from .conditional import my_reviews_validators, public_summary_validators, service_reviews_validators
+from .counters import helpful_counts
+from .models import Feedback, Review, ReviewHelpful, Service, service_slug
+from .pagination import ReviewCursorPagination
+from .search import decode_cursor as decode_search_cursor, encode_cursor as encode_search_cursor
+from .search import search_reviews, terms as search_terms
+from .serializers import ReviewSerializer, FeedbackSerializer, ReviewSimpleSerializer, helpful_vote_ids
+from .singleflight import SingleFlight
+from .stats import get_service_stats, record_reviews_bulk_added
+
+service_review_flights = SingleFlight('service-reviews')
 
 class ReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.all().select_related('user')
     serializer_class = ReviewSerializer
+    pagination_class = ReviewCursorPagination
     permission_classes = [IsAuthenticatedOrReadOnly]
     authentication_classes = [JWTAuthentication]  # ✅ CONSISTENT JWT AUTH
 
@@ -49,44 +65,172 @@ class ReviewViewSet(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
     @action(detail=False, methods=['get'])
+    @method_decorator(conditional_view(my_reviews_validators, vary=['Authorization']))
     def my_reviews(self, request):
         """Get current user's reviews"""
         if not request.user.is_authenticated:
             return Response({'error': 'Authentication required'},
                           status=status.HTTP_401_UNAUTHORIZED)
-        reviews = Review.objects.filter(user=request.user)
-        serializer = self.get_serializer(reviews, many=True)
-        return Response(serializer.data)
+        reviews = Review.objects.filter(user=request.user).select_related('user')
+        page = self.paginate_queryset(reviews)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """
+        Submit several reviews at once: [{...}, ...] or {"reviews": [...]}.
+        Valid items are inserted together; results are reported per index.
+        """
+        items = request.data.get('reviews') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Provide a list of reviews'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        limit = settings.REVIEW_BULK_CREATE_LIMIT
+        if len(items) > limit:
+            return Response({'error': f'At most {limit} reviews per request'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        context = {
+            **self.get_serializer_context(),
+            'existing_service_slugs': set(
+                Review.objects.filter(user=request.user).values_list('service__slug', flat=True)
+            ),
+        }
+        results, valid = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results.append({'index': index, 'success': False,
+                                'errors': {'non_field_errors': ['Expected an object.']}})
+                continue
+            serializer = ReviewSerializer(data=item, context=context)
+            if serializer.is_valid():
+                valid.append((index, Review(user=request.user, **serializer.validated_data)))
+                results.append(None)
+            else:
+                results.append({'index': index, 'success': False, 'errors': serializer.errors})
+
+        reviews = [review for _, review in valid]
+        if reviews:
+            with transaction.atomic():
+                services = Service.objects.resolve_many({review.service_name for review in reviews})
+                for review in reviews:
+                    review.service = services[review.service_name]
+                previous = Review.objects.filter(user=request.user).aggregate(last=Max('id'))['last'] or 0
+                Review.objects.bulk_create(reviews)
+                if any(review.pk is None for review in reviews):
+                    # Backends that don't return inserted rows (MySQL) leave
+                    # the PKs unset. The batch's rows are this user's rows
+                    # past `previous`, and the serializer lets each service
+                    # into a batch once; of rows a concurrent request added
+                    # for the same service, the first is taken
+                    ids = {}
+                    inserted = (
+                        Review.objects.filter(user=request.user, id__gt=previous)
+                        .order_by('id').values_list('service_id', 'id')
+                    )
+                    for service_id, pk in inserted:
+                        ids.setdefault(service_id, pk)
+                    for review in reviews:
+                        review.pk = ids[review.service_id]
+                # bulk_create skips save() and its signals
+                record_reviews_bulk_added(reviews)
+                summary_cache.invalidate_on_commit(*services)
+        for index, review in valid:
+            results[index] = {'index': index, 'success': True, 'id': review.pk}
+
+        created = len(reviews)
+        return Response({
+            'created': created,
+            'failed': len(items) - created,
+            'results': results,
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over titles and comments, best match first.
+        ?q=terms [&service=name] [&page_size=n] [&cursor=...]
+        """
+        query = request.query_params.get('q', '')
+        if not search_terms(query):
+            return Response({'error': 'Provide a search query'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        position = None
+        if request.query_params.get('cursor'):
+            try:
+                position = decode_search_cursor(request.query_params['cursor'])
+            except ValueError:
+                raise NotFound('Invalid cursor')
+
+        page_size = self.paginator.get_page_size(request)
+        hits = search_reviews(
+            query, request.query_params.get('service'), position, limit=page_size + 1
+        )
+        next_link = None
+        if len(hits) > page_size:
+            hits = hits[:page_size]
+            review, score = hits[-1]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor', encode_search_cursor((score, review.pk))
+            )
+
+        serializer = self.get_serializer([review for review, _ in hits], many=True)
+        return Response({
+            'next': next_link,
+            'results': [
+                {**data, 'relevance': score}
+                for data, (_, score) in zip(serializer.data, hits)
+            ],
+        })
 
 class ServiceReviewsView(generics.ListAPIView):
     serializer_class = ReviewSerializer
+    pagination_class = ReviewCursorPagination
 
     def get_queryset(self):
         service_name = self.kwargs['service_name']
-        return Review.objects.filter(service_name=service_name).select_related('user')
+        return Review.objects.filter(service__slug=service_slug(service_name)).select_related('user')
 
+    @method_decorator(conditional_view(service_reviews_validators, vary=['Authorization']))
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        stats = queryset.aggregate(
-            avg_rating=Avg('rating'),
-            total_reviews=Count('id'),
+        # Identical concurrent requests (same service, cursor and page size)
+        # share one page query; only the user's own vote flags differ
+        payload = service_review_flights.do(
+            request.build_absolute_uri(), lambda: self.build_payload(request)
         )
-        rating_breakdown = {}
-        for i in range(1, 6):
-            rating_breakdown[f'{i}_star'] = queryset.filter(rating=i).count()
-        
+        reviews = payload['reviews']
+        voted = helpful_vote_ids(request, [review['id'] for review in reviews])
         return Response({
+            **payload,
+            'reviews': [
+                {**review, 'user_has_voted_helpful': review['id'] in voted}
+                for review in reviews
+            ],
+        })
+
+    def build_payload(self, request):
+        page = self.paginate_queryset(self.get_queryset())
+        context = {**self.get_serializer_context(), 'resolve_helpful_votes': False}
+        serializer = self.get_serializer(page, many=True, context=context)
+        stats = get_service_stats(self.kwargs['service_name'])
+        rating_breakdown = {
+            f'{i}_star': count for i, count in stats.rating_breakdown().items()
+        }
+        
+        return {
             'reviews': serializer.data,
+            **self.paginator.get_page_links(),
             'statistics': {
-                'average_rating': round(stats['avg_rating'] or 0, 1),
-                'total_reviews': stats['total_reviews'],
+                'average_rating': round(stats.average_rating, 1),
+                'total_reviews': stats.review_count,
                 'rating_breakdown': rating_breakdown
             }
-        })
+        }
 
 class UserReviewsView(generics.ListAPIView):
     serializer_class = ReviewSerializer
+    pagination_class = ReviewCursorPagination
 
     def get_queryset(self):
         user_id = self.kwargs['user_id']
@@ -103,20 +247,17 @@ class ReviewHelpfulToggleView(APIView):
             user=request.user
         )
         if created:
-            review.helpful_count += 1
-            review.save()
-            return Response({
-                'helpful': True,
-                'helpful_count': review.helpful_count
-            })
+            helpful_counts.add(review.id, 1)
         else:
             helpful_vote.delete()
-            review.helpful_count = max(0, review.helpful_count - 1)
-            review.save()
-            return Response({
-                'helpful': False,
-                'helpful_count': review.helpful_count
-            })
+            helpful_counts.add(review.id, -1)
+
+        helpful_count = helpful_counts.live_count(review)
+        helpful_counts.maybe_flush()
+        return Response({
+            'helpful': created,
+            'helpful_count': helpful_count
+        })
 
 # Django Template Views (Optional - for web interface)
 class ReviewListView(ListView):
@@ -269,28 +410,33 @@ def quick_review(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(["GET"])
-@permission_classes([AllowAny])
-def service_review_summary(request, service_name):
-    """Public endpoint for service review summaries"""
-    reviews = Review.objects.filter(service_name=service_name).select_related('user')
-    
-    stats = reviews.aggregate(
-        avg_rating=Avg("rating"),
-        total_reviews=Count("id"),
-    )
+def build_public_summary(request, service_name):
+    """Payload for service_review_summary, built on a summary cache miss"""
+    reviews = Review.objects.filter(service__slug=service_slug(service_name)).select_related('user')
+    stats = get_service_stats(service_name)
     
-    rating_breakdown = {str(i): reviews.filter(rating=i).count() for i in range(1, 6)}
+    rating_breakdown = {str(i): count for i, count in stats.rating_breakdown().items()}
     
     recent = reviews.order_by('-created_at')[:20]
     
-    return Response({
+    return {
         "service_name": service_name,
-        "average_rating": round(stats["avg_rating"] or 0, 1),
-        "total_reviews": stats["total_reviews"],
+        "average_rating": round(stats.average_rating, 1),
+        "total_reviews": stats.review_count,
         "rating_breakdown": rating_breakdown,
         "recent_reviews": ReviewSimpleSerializer(recent, many=True, context={'request': request}).data,
-    })
+    }
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+@conditional_view(public_summary_validators)
+def service_review_summary(request, service_name):
+    """Public endpoint for service review summaries"""
+    return Response(summary_cache.get_or_set(
+        service_name,
+        f"public:{request.build_absolute_uri('/')}:{service_name}",
+        lambda: build_public_summary(request, service_name),
+    ))
 
 @api_view(['POST', 'GET'])
 @permission_classes([AllowAny])
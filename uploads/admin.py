@@ -0,0 +1,21 @@
+from django.contrib import admin
+
+from .models import MediaAsset, UploadSession
+
+
+@admin.register(MediaAsset)
+class MediaAssetAdmin(admin.ModelAdmin):
+    list_display = ['original_name', 'user', 'content_type', 'size', 'created_at']
+    list_filter = ['content_type']
+    search_fields = ['original_name', 'sha256', 'user__username', 'user__email']
+    list_select_related = ['user']
+    readonly_fields = ['file', 'size', 'sha256', 'created_at']
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'filename', 'user', 'status', 'size', 'created_at', 'expires_at']
+    list_filter = ['status']
+    search_fields = ['filename', 'user__username', 'user__email']
+    list_select_related = ['user']
+    readonly_fields = ['size', 'chunk_size', 'sha256', 'asset', 'created_at']
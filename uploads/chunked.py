@@ -0,0 +1,291 @@
+"""
+Chunked, resumable uploads for files too large for one request.
+
+A client starts an upload with the file's name, type, size and SHA-256 and
+is told the chunk size. It then PUTs chunks 0..N-1 in any order, each with
+its own SHA-256 in X-Chunk-SHA256, and finally asks for the upload to be
+completed:
+
+- `write_chunk` streams the request body to a temporary file in blocks of
+  CHUNK_BLOCK bytes, hashing as it goes, and moves it into place as
+  CHUNKED_UPLOAD_DIR/<session id>/<index> only when the hash matches. A
+  chunk on disk is therefore always a verified one, and the chunks present
+  are what a client resumes from after a dropped connection.
+- `complete_upload` joins the chunks into one file, hashing that pass too,
+  checks it against the SHA-256 given at the start and moves the result
+  into the media storage (by rename on ContentAddressedStorage, so a video
+  is never copied again) as a MediaAsset. The session is marked COMPLETING
+  under its row lock and the lock released before that I/O, so a retried
+  request is turned away at once instead of waiting on the lock.
+
+Nothing is ever held in memory beyond one block, so DATA_UPLOAD_MAX_MEMORY_SIZE
+doesn't apply. Sessions not completed within CHUNKED_UPLOAD_TTL seconds of
+their last chunk are removed by `purge_uploads`. A user can have at most
+CHUNKED_UPLOAD_MAX_OPEN_SESSIONS unfinished uploads, announcing at most
+CHUNKED_UPLOAD_MAX_PENDING_BYTES between them.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import MediaAsset, UploadSession
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the request (or a chunk file) at a time
+CHUNK_BLOCK = 256 * 1024
+
+
+class UploadError(Exception):
+    status_code = 400
+
+
+class UploadNotOpen(UploadError):
+    status_code = 409
+
+
+class UploadExpired(UploadError):
+    status_code = 410
+
+
+class TooManyUploads(UploadError):
+    status_code = 409
+
+
+class InvalidChunk(UploadError):
+    pass
+
+
+class ChecksumMismatch(UploadError):
+    pass
+
+
+class IncompleteUpload(UploadError):
+    status_code = 409
+
+    def __init__(self, missing):
+        super().__init__(f"{len(missing)} chunks have not been received")
+        self.missing = missing
+
+
+def upload_dir():
+    return getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'upload_parts'))
+
+
+def session_dir(session):
+    return os.path.join(upload_dir(), str(session.pk))
+
+
+def session_ttl():
+    return timedelta(seconds=getattr(settings, 'CHUNKED_UPLOAD_TTL', 24 * 3600))
+
+
+def unfinished(user):
+    """The user's sessions that still hold (or may still get) chunks"""
+    return UploadSession.objects.filter(
+        user=user, status__in=[UploadSession.OPEN, UploadSession.COMPLETING], expires_at__gt=timezone.now(),
+    )
+
+
+def start_upload(user, filename, content_type, size, sha256):
+    """Raises TooManyUploads if the user is at their limits"""
+    with transaction.atomic():
+        # Serializes the user's starts, so concurrent ones can't both pass the checks
+        get_user_model().objects.select_for_update().get(pk=user.pk)
+        pending = unfinished(user).aggregate(count=Count('pk'), size=Sum('size'))
+        if pending['count'] >= getattr(settings, 'CHUNKED_UPLOAD_MAX_OPEN_SESSIONS', 5):
+            raise TooManyUploads("Too many unfinished uploads; complete or abandon one first")
+        limit = getattr(settings, 'CHUNKED_UPLOAD_MAX_PENDING_BYTES', 4 * 1024 ** 3)
+        if (pending['size'] or 0) + size > limit:
+            raise TooManyUploads(f"Unfinished uploads can hold at most {limit} bytes; complete or abandon one first")
+        session = UploadSession.objects.create(
+            user=user,
+            filename=filename,
+            content_type=content_type,
+            size=size,
+            chunk_size=getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024),
+            sha256=sha256.lower(),
+            expires_at=timezone.now() + session_ttl(),
+        )
+    os.makedirs(session_dir(session), exist_ok=True)
+    return session
+
+
+def received_chunks(session):
+    """Sorted indexes of the chunks stored (and verified) so far"""
+    try:
+        names = os.listdir(session_dir(session))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def check_open(session):
+    if session.status != UploadSession.OPEN:
+        raise UploadNotOpen(f"This upload is {session.status}")
+    if session.expires_at <= timezone.now():
+        raise UploadExpired("This upload has expired; start a new one")
+
+
+def write_chunk(session, index, stream, content_length, sha256):
+    """
+    Store chunk `index` from `stream`, which must hold exactly
+    `content_length` bytes hashing to `sha256`. Sending a chunk again
+    replaces it.
+    """
+    check_open(session)
+    if not 0 <= index < session.chunk_count:
+        raise InvalidChunk(f"Chunk index must be between 0 and {session.chunk_count - 1}")
+    expected = session.chunk_length(index)
+    if content_length != expected:
+        raise InvalidChunk(f"Chunk {index} must be exactly {expected} bytes")
+    if not sha256 or len(sha256) != 64:
+        raise InvalidChunk("Send the chunk's SHA-256 as hex in X-Chunk-SHA256")
+
+    directory = session_dir(session)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.chunk-')
+    try:
+        digest = hashlib.sha256()
+        remaining = expected
+        with os.fdopen(fd, 'wb') as f:
+            while remaining:
+                block = stream.read(min(CHUNK_BLOCK, remaining))
+                if not block:
+                    raise InvalidChunk(f"Chunk {index} ended after {expected - remaining} bytes")
+                digest.update(block)
+                f.write(block)
+                remaining -= len(block)
+        if digest.hexdigest() != sha256.lower():
+            raise ChecksumMismatch(f"Chunk {index} does not match its SHA-256")
+        os.replace(tmp, os.path.join(directory, str(index)))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    # Uploads that keep making progress don't expire
+    UploadSession.objects.filter(pk=session.pk).update(expires_at=timezone.now() + session_ttl())
+
+
+def asset_name(session):
+    """Storage name for the finished file; the storage may rename it"""
+    extension = posixpath.splitext(session.filename)[1].lower()
+    if mimetypes.guess_type(session.filename)[0] != session.content_type:
+        extension = mimetypes.guess_extension(session.content_type) or ''
+    return f'videos/upload{extension}'
+
+
+def assemble(session, directory):
+    """Join the chunks into one file in `directory`; returns its path and SHA-256"""
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(dir=directory, prefix='.assembled-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for index in range(session.chunk_count):
+                with open(os.path.join(directory, str(index)), 'rb') as chunk:
+                    while block := chunk.read(CHUNK_BLOCK):
+                        digest.update(block)
+                        out.write(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def store(name, path, digest):
+    storage = default_storage
+    if hasattr(storage, 'adopt'):
+        return storage.adopt(name, path, digest)
+    with open(path, 'rb') as f:
+        name = storage.save(name, File(f))
+    os.remove(path)
+    return name
+
+
+def complete_upload(session):
+    """
+    The MediaAsset for a finished upload, created on the first call.
+    Raises IncompleteUpload while chunks are missing, UploadNotOpen while
+    another request is completing it, or ChecksumMismatch (and fails the
+    upload) if the joined file isn't the one announced.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status == UploadSession.COMPLETE:
+            return session.asset
+        check_open(session)
+        missing = sorted(set(range(session.chunk_count)) - set(received_chunks(session)))
+        if missing:
+            raise IncompleteUpload(missing)
+        session.status = UploadSession.COMPLETING
+        # Not purged while it is being joined
+        session.expires_at = timezone.now() + session_ttl()
+        session.save(update_fields=['status', 'expires_at'])
+
+    directory = session_dir(session)
+    try:
+        path, digest = assemble(session, directory)
+        if digest == session.sha256:
+            with transaction.atomic():
+                asset = MediaAsset.objects.create(
+                    user=session.user,
+                    file=store(asset_name(session), path, digest),
+                    original_name=session.filename,
+                    content_type=session.content_type,
+                    size=session.size,
+                    sha256=digest,
+                )
+                UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.COMPLETE, asset=asset)
+                transaction.on_commit(lambda: shutil.rmtree(directory, ignore_errors=True))
+            return asset
+    except BaseException:
+        # Let the client try again
+        UploadSession.objects.filter(pk=session.pk, status=UploadSession.COMPLETING).update(status=UploadSession.OPEN)
+        raise
+
+    os.remove(path)
+    UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.FAILED)
+    shutil.rmtree(directory, ignore_errors=True)
+    raise ChecksumMismatch("The uploaded file does not match its SHA-256; start a new upload")
+
+
+def purge_expired(now=None):
+    """
+    Delete unfinished sessions past their expiry, with their chunks, and
+    chunk directories with no session. Returns the number of sessions.
+    """
+    now = now or timezone.now()
+    expired = UploadSession.objects.exclude(status=UploadSession.COMPLETE).filter(expires_at__lte=now)
+    count = 0
+    for session in expired.iterator():
+        # One at a time, so that post_delete removes each chunk directory
+        session.delete()
+        count += 1
+
+    try:
+        names = os.listdir(upload_dir())
+    except FileNotFoundError:
+        return count
+    known = {
+        str(pk) for pk in UploadSession.objects.filter(
+            status__in=[UploadSession.OPEN, UploadSession.COMPLETING],
+        ).values_list('pk', flat=True)
+    }
+    for name in set(names) - known:
+        logger.info(f"Removing stray upload directory {name}")
+        shutil.rmtree(os.path.join(upload_dir(), name), ignore_errors=True)
+    return count
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from uploads.chunked import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads that expired before being completed, with their chunks"
+
+    def handle(self, *args, **options):
+        count = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Removed {count} expired uploads"))
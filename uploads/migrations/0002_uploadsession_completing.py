@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('open', 'Open'), ('completing', 'Completing'), ('complete', 'Complete'), ('failed', 'Failed')], default='open', max_length=10),
+        ),
+    ]
@@ -0,0 +1,61 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+
+class MediaAsset(models.Model):
+    """A large media file (e.g. a video to verify) received through a chunked upload"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='media_assets')
+    file = models.FileField(upload_to='videos/', max_length=255)
+    original_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.original_name} ({self.user})"
+
+
+class UploadSession(models.Model):
+    """An upload in progress; its chunks are files under CHUNKED_UPLOAD_DIR/<id>/"""
+    OPEN = 'open'
+    # Being joined and checked, outside the row lock
+    COMPLETING = 'completing'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (OPEN, 'Open'),
+        (COMPLETING, 'Completing'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    # Of the whole file, as the client computed it before uploading
+    sha256 = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=OPEN)
+    asset = models.OneToOneField(
+        MediaAsset, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+    @property
+    def chunk_count(self):
+        return -(-self.size // self.chunk_size)
+
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.size - index * self.chunk_size)
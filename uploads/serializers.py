@@ -0,0 +1,56 @@
+from django.conf import settings
+from rest_framework import serializers
+
+from LandingPage.timing import TimedSerializerMixin
+
+from .chunked import received_chunks
+from .models import MediaAsset, UploadSession
+
+DEFAULT_CONTENT_TYPES = ['video/mp4', 'video/webm', 'video/quicktime', 'video/x-matroska']
+
+
+class StartUploadSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=100)
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', error_messages={'invalid': "Must be 64 hex digits."})
+
+    def validate_content_type(self, value):
+        allowed = getattr(settings, 'CHUNKED_UPLOAD_CONTENT_TYPES', DEFAULT_CONTENT_TYPES)
+        if value not in allowed:
+            raise serializers.ValidationError(f"Unsupported type. Allowed: {', '.join(allowed)}.")
+        return value
+
+    def validate_size(self, value):
+        limit = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+        if value > limit:
+            raise serializers.ValidationError(f"Files can be at most {limit} bytes.")
+        return value
+
+
+class MediaAssetSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MediaAsset
+        fields = ['id', 'url', 'original_name', 'content_type', 'size', 'sha256', 'created_at']
+
+    def get_url(self, obj):
+        request = self.context.get('request')
+        return request.build_absolute_uri(obj.file.url) if request else obj.file.url
+
+
+class UploadSessionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    chunk_count = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+    asset = MediaAssetSerializer(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'content_type', 'size', 'sha256', 'chunk_size', 'chunk_count',
+            'received_chunks', 'status', 'asset', 'created_at', 'expires_at',
+        ]
+
+    def get_received_chunks(self, obj):
+        return received_chunks(obj) if obj.status == UploadSession.OPEN else []
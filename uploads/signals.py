@@ -0,0 +1,19 @@
+import shutil
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .chunked import session_dir
+from .models import MediaAsset, UploadSession
+
+
+@receiver(post_delete, sender=UploadSession)
+def remove_chunks(sender, instance, **kwargs):
+    shutil.rmtree(session_dir(instance), ignore_errors=True)
+
+
+@receiver(post_delete, sender=MediaAsset)
+def release_file(sender, instance, **kwargs):
+    """Drop the asset's reference to its file; the storage deletes it once unused"""
+    if instance.file:
+        instance.file.delete(save=False)
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser, MediaFile
+from LandingPage.storage import is_content_addressed
+
+from . import chunked
+from .models import MediaAsset, UploadSession
+
+CHUNK_SIZE = 1024
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(
+            MEDIA_ROOT=media_root,
+            CHUNKED_UPLOAD_DIR=os.path.join(media_root, 'parts'),
+            CHUNKED_UPLOAD_CHUNK_SIZE=CHUNK_SIZE,
+        ))
+        self.user = CustomUser.objects.create_user(username='hal', email='hal@example.com', password='Passw0rd!x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.data = os.urandom(CHUNK_SIZE * 2 + 100)
+
+    def start(self, data=None, **overrides):
+        data = self.data if data is None else data
+        body = {'filename': 'Clip.MP4', 'content_type': 'video/mp4', 'size': len(data), 'sha256': sha256(data)}
+        body.update(overrides)
+        return self.client.post('/api/uploads/', body, format='json')
+
+    def put_chunk(self, upload_id, index, data=None, checksum=None):
+        data = self.data[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE] if data is None else data
+        return self.client.generic(
+            'PUT', f'/api/uploads/{upload_id}/chunks/{index}/', data,
+            content_type='application/octet-stream', HTTP_X_CHUNK_SHA256=checksum or sha256(data),
+        )
+
+    def test_upload_resume_and_complete(self):
+        response = self.start()
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.data['id']
+        self.assertEqual((response.data['chunk_size'], response.data['chunk_count']), (CHUNK_SIZE, 3))
+
+        # Chunks can arrive in any order; the session says which are still needed
+        self.assertEqual(self.put_chunk(upload_id, 2).status_code, 200)
+        self.assertEqual(self.put_chunk(upload_id, 0).status_code, 200)
+        response = self.client.get(f'/api/uploads/{upload_id}/')
+        self.assertEqual(response.data['received_chunks'], [0, 2])
+
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['missing_chunks'], [1])
+
+        self.assertEqual(self.put_chunk(upload_id, 1).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sha256'], sha256(self.data))
+
+        asset = MediaAsset.objects.get(user=self.user)
+        self.assertTrue(asset.file.name.startswith('videos/') and asset.file.name.endswith('.mp4'))
+        self.assertTrue(is_content_addressed(asset.file.name))
+        with asset.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(MediaFile.objects.get(name=asset.file.name).refcount, 1)
+        self.assertFalse(os.path.exists(os.path.join(settings.CHUNKED_UPLOAD_DIR, upload_id)))
+
+        # Completing again is answered with the same asset
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual((response.status_code, response.data['id']), (200, asset.pk))
+        self.assertEqual(self.put_chunk(upload_id, 0).status_code, 409)
+
+    def test_bad_chunks_are_rejected_and_not_kept(self):
+        upload_id = self.start().data['id']
+        response = self.put_chunk(upload_id, 0, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('SHA-256', response.data['error'])
+        self.assertEqual(self.put_chunk(upload_id, 0, data=b'short').status_code, 400)
+        self.assertEqual(self.put_chunk(upload_id, 3, data=b'').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').data['received_chunks'], [])
+        self.assertEqual(os.listdir(os.path.join(settings.CHUNKED_UPLOAD_DIR, upload_id)), [])
+
+    def test_whole_file_checksum_mismatch_fails_the_upload(self):
+        upload_id = self.start(sha256='a' * 64).data['id']
+        for index in range(3):
+            self.put_chunk(upload_id, index)
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).status, UploadSession.FAILED)
+        self.assertFalse(MediaAsset.objects.exists())
+        self.assertEqual(self.put_chunk(upload_id, 0).status_code, 409)
+
+    def test_completion_runs_outside_the_lock_and_turns_retries_away(self):
+        upload_id = self.start().data['id']
+        for index in range(3):
+            self.put_chunk(upload_id, index)
+        statuses = []
+
+        def assemble(session, directory):
+            statuses.append(UploadSession.objects.get(pk=upload_id).status)
+            # A retry while this one is still joining the chunks
+            statuses.append(self.client.post(f'/api/uploads/{upload_id}/complete/').status_code)
+            statuses.append(self.client.delete(f'/api/uploads/{upload_id}/').status_code)
+            raise OSError('disk full')
+
+        with mock.patch.object(chunked, 'assemble', side_effect=assemble), self.assertRaises(OSError):
+            self.client.post(f'/api/uploads/{upload_id}/complete/')
+        self.assertEqual(statuses, [UploadSession.COMPLETING, 409, 409])
+
+        # The failed attempt leaves the upload open for another try
+        self.assertEqual(UploadSession.objects.get(pk=upload_id).status, UploadSession.OPEN)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f'/api/uploads/{upload_id}/complete/').status_code, 201)
+
+    def test_unfinished_uploads_are_capped_per_user(self):
+        with self.settings(CHUNKED_UPLOAD_MAX_OPEN_SESSIONS=2):
+            first = self.start().data['id']
+            self.start()
+            response = self.start()
+            self.assertEqual(response.status_code, 409)
+            self.assertIn('unfinished', response.data['error'])
+            self.client.delete(f'/api/uploads/{first}/')
+            self.assertEqual(self.start().status_code, 201)
+
+        UploadSession.objects.all().delete()
+        with self.settings(CHUNKED_UPLOAD_MAX_PENDING_BYTES=len(self.data) * 2):
+            self.assertEqual(self.start().status_code, 201)
+            self.assertEqual(self.start().status_code, 201)
+            self.assertEqual(self.start().status_code, 409)
+            self.assertEqual(self.start(data=b'x').status_code, 409)
+
+    def test_start_validation(self):
+        self.assertEqual(self.start(content_type='application/x-msdownload').status_code, 400)
+        self.assertEqual(self.start(sha256='not-a-hash').status_code, 400)
+        with self.settings(CHUNKED_UPLOAD_MAX_SIZE=100):
+            self.assertEqual(self.start().status_code, 400)
+
+    def test_other_users_cannot_see_or_write_uploads(self):
+        upload_id = self.start().data['id']
+        other = CustomUser.objects.create_user(username='ida', email='ida@example.com', password='Passw0rd!x')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').status_code, 404)
+        self.assertEqual(self.put_chunk(upload_id, 0).status_code, 404)
+
+    def test_identical_uploads_share_a_file_until_both_assets_go(self):
+        data = os.urandom(500)
+        names = []
+        for _ in range(2):
+            upload_id = self.start(data=data).data['id']
+            self.put_chunk(upload_id, 0, data=data)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f'/api/uploads/{upload_id}/complete/')
+            names.append(MediaAsset.objects.latest('pk').file.name)
+        self.assertEqual(names[0], names[1])
+        self.assertEqual(MediaFile.objects.get(name=names[0]).refcount, 2)
+
+        storage = MediaAsset.objects.first().file.storage
+        for asset in MediaAsset.objects.all():
+            with self.captureOnCommitCallbacks(execute=True):
+                asset.delete()
+        self.assertFalse(storage.exists(names[0]))
+
+    def test_abandon_and_purge(self):
+        abandoned = self.start().data['id']
+        self.put_chunk(abandoned, 0)
+        self.assertEqual(self.client.delete(f'/api/uploads/{abandoned}/').status_code, 204)
+        self.assertFalse(os.path.exists(os.path.join(settings.CHUNKED_UPLOAD_DIR, abandoned)))
+
+        stale = self.start().data['id']
+        self.put_chunk(stale, 0)
+        fresh = self.start().data['id']
+        UploadSession.objects.filter(pk=stale).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.put_chunk(stale, 1).status_code, 410)
+        os.makedirs(os.path.join(settings.CHUNKED_UPLOAD_DIR, 'stray'))
+
+        out = StringIO()
+        call_command('purge_uploads', stdout=out)
+        self.assertIn('Removed 1 expired uploads', out.getvalue())
+        self.assertEqual([str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)], [fresh])
+        self.assertEqual(os.listdir(settings.CHUNKED_UPLOAD_DIR), [fresh])
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'uploads'
+
+urlpatterns = [
+    path('', views.start_upload_view, name='start'),
+    path('<uuid:upload_id>/', views.upload_view, name='detail'),
+    path('<uuid:upload_id>/chunks/<int:index>/', views.upload_chunk_view, name='chunk'),
+    path('<uuid:upload_id>/complete/', views.complete_upload_view, name='complete'),
+]
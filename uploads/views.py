@@ -0,0 +1,77 @@
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .chunked import IncompleteUpload, UploadError, complete_upload, start_upload, write_chunk
+from .models import UploadSession
+from .serializers import MediaAssetSerializer, StartUploadSerializer, UploadSessionSerializer
+
+
+def error_response(error):
+    body = {'error': str(error)}
+    if isinstance(error, IncompleteUpload):
+        body['missing_chunks'] = error.missing
+    return Response(body, status=error.status_code)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def start_upload_view(request):
+    """Start a chunked upload: filename, content_type, size and sha256 of the whole file"""
+    serializer = StartUploadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({'error': 'Invalid data.', 'details': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        session = start_upload(request.user, **serializer.validated_data)
+    except UploadError as e:
+        return error_response(e)
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_view(request, upload_id):
+    """GET the upload's progress (to resume it), or DELETE to abandon it"""
+    session = get_object_or_404(UploadSession.objects.select_related('asset'), pk=upload_id, user=request.user)
+    if request.method == 'DELETE':
+        if session.status in (UploadSession.COMPLETING, UploadSession.COMPLETE):
+            return Response({'error': f'This upload is {session.status}'}, status=status.HTTP_409_CONFLICT)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(UploadSessionSerializer(session, context={'request': request}).data)
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+# The body is streamed to disk as it arrives, never parsed or buffered
+@parser_classes([])
+def upload_chunk_view(request, upload_id, index):
+    """PUT chunk `index` as the raw body, with its SHA-256 in X-Chunk-SHA256"""
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    try:
+        write_chunk(session, index, request.stream, content_length, request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return error_response(e)
+    return Response({'index': index})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def complete_upload_view(request, upload_id):
+    """Verify the whole file and register it as a MediaAsset"""
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    was_complete = session.status == UploadSession.COMPLETE
+    try:
+        asset = complete_upload(session)
+    except UploadError as e:
+        return error_response(e)
+    return Response(
+        MediaAssetSerializer(asset, context={'request': request}).data,
+        status=status.HTTP_200_OK if was_complete else status.HTTP_201_CREATED,
+    )